@@ -0,0 +1,117 @@
+import json
+import os
+
+import numpy as np
+
+
+class ChainArchive:
+    """A consolidated archive of the chains of a `Fitter`, keyed by model and walker index.
+
+    The archive is a directory holding one .npy file per model, with the rows of all its walkers concatenated, and an
+    index giving the rows of each walker and the size and modification time of the chain files each model was built
+    from. Each row holds the posterior, weight and evidence followed by the chain, as returned by `Fitter._load_file`.
+    Models are read memory-mapped, so loading many fits only reads the parts that are used.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the archive
+    """
+
+    index_name = "index.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = {"models": {}}
+        if os.path.exists(self.get_index_filename()):
+            with open(self.get_index_filename()) as f:
+                self.index = json.load(f)
+
+    def get_index_filename(self):
+        return os.path.join(self.directory, self.index_name)
+
+    def exists(self):
+        return os.path.exists(self.get_index_filename())
+
+    def get_model_indexes(self):
+        return sorted(int(m) for m in self.index["models"])
+
+    def is_current(self, model_index, sources):
+        """Whether the archived model was built from exactly the chain files in sources, a dictionary of filename to
+        [size, mtime_ns] as given by `get_sources`"""
+        entry = self.index["models"].get(str(model_index))
+        return entry is not None and entry["sources"] == sources
+
+    @staticmethod
+    def get_sources(filenames):
+        """Gets the size and modification time of each chain file, used to tell if the archive is out of date"""
+        sources = {}
+        for filename in filenames:
+            stat = os.stat(filename)
+            sources[os.path.basename(filename)] = [stat.st_size, stat.st_mtime_ns]
+        return sources
+
+    def read(self, model_index, mmap=True, split_walkers=True):
+        """Reads the chains of all walkers of a model
+
+        Parameters
+        ----------
+        model_index : int
+            The index of the model
+        mmap : bool, optional
+            Whether to memory-map the chains (copy on write) rather than read them into memory
+        split_walkers : bool, optional
+            Whether to split the rows by walker. If not, all rows are returned as one walker with index None.
+
+        Returns
+        -------
+        walkers : list[tuple(int, np.ndarray)]
+            The walker index and chain rows of each walker, in order of walker index. The rows are views of one array.
+        """
+        entry = self.index["models"][str(model_index)]
+        result = np.load(os.path.join(self.directory, entry["file"]), mmap_mode="c" if mmap else None)
+        if not split_walkers:
+            return [(None, result)]
+        return [(wi, result[start:stop]) for wi, start, stop in entry["walkers"]]
+
+    def write(self, model_index, walkers, sources):
+        """Writes the chains of all walkers of a model, replacing any previous version
+
+        Parameters
+        ----------
+        model_index : int
+            The index of the model
+        walkers : list[tuple(int, np.ndarray)]
+            The walker index and chain rows of each walker
+        sources : dict
+            The chain files the chains were loaded from, as given by `get_sources`
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stops = np.cumsum([len(c) for _, c in walkers])
+        starts = stops - [len(c) for _, c in walkers]
+        columns = {c.shape[1] for _, c in walkers}
+        assert len(columns) == 1, f"Walkers of model {model_index} have different numbers of parameters: {columns}"
+        dtype = np.result_type(*[c.dtype for _, c in walkers])
+
+        # Write to a temporary file and move it into place, so readers never see a partially written model
+        filename = f"model_{model_index}.npy"
+        temp = os.path.join(self.directory, f"model_{model_index}.{os.getpid()}.tmp.npy")
+        result = np.lib.format.open_memmap(temp, mode="w+", dtype=dtype, shape=(int(stops[-1]), columns.pop()))
+        for (_, c), start, stop in zip(walkers, starts, stops):
+            result[start:stop] = c
+        result.flush()
+        del result
+        os.replace(temp, os.path.join(self.directory, filename))
+
+        self.index["models"][str(model_index)] = {
+            "file": filename,
+            "walkers": [[int(wi), int(start), int(stop)] for (wi, _), start, stop in zip(walkers, starts, stops)],
+            "sources": sources,
+        }
+        self.save_index()
+
+    def save_index(self):
+        temp = self.get_index_filename() + f".{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(temp, self.get_index_filename())
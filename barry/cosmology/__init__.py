@@ -1,2 +1,8 @@
 from barry.cosmology.camb_generator import getCambGenerator
-from barry.cosmology.pk2xi import PowerToCorrelationGauss, PowerToCorrelationFT, PowerToCorrelationFFTLog, PowerToCorrelationSphericalBessel
+from barry.cosmology.pk2xi import (
+    PowerToCorrelationGauss,
+    PowerToCorrelationFT,
+    PowerToCorrelationFFTLog,
+    PowerToCorrelationSphericalBessel,
+    PowerToCorrelationMatrix,
+)
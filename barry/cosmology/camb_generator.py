@@ -1,9 +1,15 @@
+from collections.abc import Mapping
 from functools import lru_cache
 
+import hashlib
 import numpy as np
 import inspect
 import os
 import logging
+import time
+
+from barry.cosmology.interpolation import get_interpolator
+from barry.cosmology.power_spectrum_smoothing import smooth_func_batch
 
 
 # TODO: Add options for mnu, h0 default, omega_b, etc
@@ -11,9 +17,32 @@ import logging
 
 @lru_cache(maxsize=32)
 def getCambGenerator(
-    redshift=0.51, om_resolution=101, h0_resolution=1, h0=0.676, ob=0.04814, ns=0.97, mnu=0.0, recon_smoothing_scale=21.21
+    redshift=0.51,
+    om_resolution=101,
+    h0_resolution=1,
+    h0=0.676,
+    ob=0.04814,
+    ns=0.97,
+    mnu=0.0,
+    recon_smoothing_scale=21.21,
+    mmap=True,
+    dtype=np.float64,
+    interpolation="linear",
+    backend="camb",
 ):
-    return CambGenerator(
+    """Gets the (cached) generator of the CAMB sound horizon and power spectra for a cosmology.
+
+    The backend is either 'camb', which interpolates a table precomputed on a grid of omch2 and h0, or 'emulator', which
+    uses a trained `barry.cosmology.emulator.PowerEmulator` and needs no table. A trained emulator is only shipped for
+    z=0.51; for other redshifts train one first with ``python -m barry.cosmology.emulator -z <redshift>``, which needs CAMB.
+    """
+    if backend == "camb":
+        cls = CambGenerator
+    elif backend == "emulator":
+        from barry.cosmology.emulator import EmulatedCambGenerator as cls
+    else:
+        raise ValueError(f"Unknown CAMB backend {backend}, should be 'camb' or 'emulator'")
+    return cls(
         redshift=redshift,
         om_resolution=om_resolution,
         h0_resolution=h0_resolution,
@@ -22,6 +51,9 @@ def getCambGenerator(
         ns=ns,
         mnu=mnu,
         recon_smoothing_scale=recon_smoothing_scale,
+        mmap=mmap,
+        dtype=dtype,
+        interpolation=interpolation,
     )
 
 
@@ -53,6 +85,34 @@ def E_z(omega_m, z):
     return np.sqrt((1.0 + z) ** 3 * omega_m + (1.0 - omega_m))
 
 
+class CambData(Mapping):
+    """The CAMB data at one cosmology, as returned by `CambGenerator.get_data`.
+
+    Behaves like a read only dictionary, but each field is only interpolated from the table the first time it is used.
+    """
+
+    def __init__(self, generator, omch2, h0):
+        self.generator = generator
+        self.omch2 = omch2
+        self.h0 = h0
+        self.values = {"ks": generator.ks}
+
+    def __getitem__(self, key):
+        value = self.values.get(key)
+        if value is None:
+            value = self.values[key] = self.generator.get_field(self.omch2, self.h0, key)
+        return value
+
+    def __iter__(self):
+        return iter(["ks"] + list(self.generator.fields))
+
+    def __len__(self):
+        return len(self.generator.fields) + 1
+
+    def get_nbytes(self):
+        return sum([np.asarray(v).nbytes for k, v in self.values.items() if k != "ks"])
+
+
 class CambGenerator(object):
     """An object to generate power spectra using camb and save them to file.
 
@@ -60,11 +120,33 @@ class CambGenerator(object):
     """
 
     def __init__(
-        self, redshift=0.61, om_resolution=101, h0_resolution=1, h0=0.676, ob=0.04814, ns=0.97, mnu=0.0, recon_smoothing_scale=21.21
+        self,
+        redshift=0.61,
+        om_resolution=101,
+        h0_resolution=1,
+        h0=0.676,
+        ob=0.04814,
+        ns=0.97,
+        mnu=0.0,
+        recon_smoothing_scale=21.21,
+        mmap=True,
+        dtype=np.float64,
+        cache_size=512,
+        interpolation="linear",
     ):
         """
         Precomputes CAMB for efficiency. Access ks via self.ks, and use get_data for an array
         of both the linear and non-linear power spectrum
+
+        The table is memory-mapped by default, so processes on a node share one copy through the page cache. Setting
+        dtype to np.float32 halves its size (interpolated values are still float64), at the cost of writing a float32
+        copy of the table next to the original the first time it is loaded. Up to cache_size calls to get_data are
+        cached, see `get_cache_info`.
+
+        The table (and every precomputed model quantity) is interpolated in omch2 and h0 with the given scheme, one of
+        'linear', 'cubic' or 'chebyshev' (see `barry.cosmology.interpolation`), which also chooses the grid nodes. The
+        higher order schemes reach the accuracy of a 101 point linear grid with far fewer nodes, which can be checked
+        with `get_interpolation_error`.
         """
         self.logger = logging.getLogger("barry")
         self.om_resolution = om_resolution
@@ -72,10 +154,13 @@ class CambGenerator(object):
         self.h0 = h0
         self.redshift = redshift
         self.singleval = True if om_resolution == 1 and h0_resolution == 1 else False
+        self.interpolator = get_interpolator(interpolation)
 
         self.data_dir = os.path.normpath(os.path.dirname(inspect.stack()[0][1]) + "/../generated/")
         hh = int(h0 * 10000)
         self.filename_unique = f"{int(self.redshift * 1000)}_{self.om_resolution}_{self.h0_resolution}_{hh}_{int(ob * 10000)}_{int(ns * 1000)}_{int(mnu * 10000)}"
+        if not self.interpolator.uniform:
+            self.filename_unique += f"_{self.interpolator.name}"
         self.filename = self.data_dir + f"/camb_{self.filename_unique}.npy"
 
         self.k_min = 1e-5
@@ -85,35 +170,76 @@ class CambGenerator(object):
         self.recon_smoothing_scale = recon_smoothing_scale
         self.smoothing_kernel = np.exp(-self.ks**2 * self.recon_smoothing_scale**2 / 2.0)
 
-        self.omch2s = np.linspace(0.05, 0.3, self.om_resolution)
+        self.omch2s = self.interpolator.get_nodes(0.05, 0.3, self.om_resolution)
         self.omega_b = ob
         self.ns = ns
         self.mnu = mnu
         if h0_resolution == 1:
             self.h0s = [h0]
         else:
-            self.h0s = np.linspace(0.6, 0.8, self.h0_resolution)
+            self.h0s = self.interpolator.get_nodes(0.6, 0.8, self.h0_resolution)
+
+        self.mmap = mmap
+        self.dtype = np.dtype(dtype)
+        self.fields = {
+            "r_s": 0,
+            "pk_lin": slice(1, 1 + self.k_num),
+            "pk_nl_0": slice(1 + 1 * self.k_num, 1 + 2 * self.k_num),
+            "pk_nl_z": slice(1 + 2 * self.k_num, 1 + 3 * self.k_num),
+        }
+        self.cache = {}
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         self.data = None
+        self.smoothed = {}
         self.logger.info(f"Creating CAMB data with {self.om_resolution} x {self.h0_resolution}")
 
-    def load_data(self, can_generate=False):
+    def load_data(self, can_generate=False, num_processes=1):
         if not os.path.exists(self.filename):
             if not can_generate:
                 msg = "Data does not exist and this isn't the time to generate it!"
                 self.logger.error(msg)
                 raise ValueError(msg)
             else:
-                self.data = self._generate_data()
+                self.data = self._generate_data(num_processes=num_processes)
         else:
-            self.data = np.load(self.filename)
+            self.data = self._load_table()
             self.logger.info("Loading existing CAMB data")
 
-    @lru_cache(maxsize=512)
+    def _load_table(self):
+        """Loads the table from self.filename, memory-mapped and converted to self.dtype as configured"""
+        mmap_mode = "r" if self.mmap else None
+        if self.dtype == np.float64:
+            return np.load(self.filename, mmap_mode=mmap_mode)
+        filename = self.filename.replace(".npy", f"_{self.dtype.name}.npy")
+        if not os.path.exists(filename) or os.path.getmtime(filename) < os.path.getmtime(self.filename):
+            try:
+                temp = filename.replace(".npy", f".{os.getpid()}.tmp.npy")
+                np.save(temp, np.load(self.filename, mmap_mode="r").astype(self.dtype))
+                os.replace(temp, filename)
+            except OSError as e:
+                self.logger.warning(f"Could not save a {self.dtype.name} copy of the CAMB data, converting in memory: {e}")
+                return np.load(self.filename).astype(self.dtype)
+        return np.load(filename, mmap_mode=mmap_mode)
+
     def get_data(self, om=0.31, h0=None):
-        """Returns the sound horizon, the linear power spectrum, and the halofit power spectrum at self.redshift"""
+        """Returns the sound horizon, the linear power spectrum, and the halofit power spectrum at self.redshift
+
+        Returns
+        -------
+        data : CambData
+            A mapping with keys 'r_s', 'ks', 'pk_lin', 'pk_nl_0' and 'pk_nl_z'. Each is only interpolated when used.
+        """
         if h0 is None:
             h0 = self.h0
+        key = (om, h0)
+        data = self.cache.get(key)
+        if data is not None:
+            self.cache_hits += 1
+            return data
+        self.cache_misses += 1
         if self.data is None:
             # If we are not interested in varying om, we can run CAMB this once to avoid precomputing
             if self.singleval:
@@ -121,99 +247,309 @@ class CambGenerator(object):
                 self.data = self._generate_data(savedata=False)[0, 0]
             else:
                 self.load_data()
+        data = CambData(self, (om - self.omega_b) * h0 * h0, h0)
+        if len(self.cache) >= self.cache_size:
+            self.cache.pop(next(iter(self.cache)))
+        self.cache[key] = data
+        return data
+
+    def get_field(self, omch2, h0, name):
+        """Interpolates one field of the table (see self.fields) at the given cosmology, only reading that field"""
+        columns = self.fields[name]
         if self.singleval:
-            data = self.data
+            return self.data[columns]
+        return self._interpolate(omch2, h0, columns=columns)
+
+    def get_smoothed_data(self, om=0.31, h0=None, smooth_type=None):
+        """Returns the smoothed linear power spectrum and the wiggle ratio pk_lin / pk_smooth_lin - 1 at self.redshift,
+        interpolated from a table of them over the grid (see `load_smoothed_data`)
+
+        Parameters
+        ----------
+        om, h0 : float, optional
+            The cosmology. h0 defaults to self.h0.
+        smooth_type : dict, optional
+            The smoothing method and its arguments, as used by models. Defaults to {"method": "hinton2017"}.
+
+        Returns
+        -------
+        pk_smooth_lin : np.ndarray
+            The smoothed linear power spectrum at self.ks
+        pk_ratio : np.ndarray
+            The wiggle ratio at self.ks
+        """
+        if h0 is None:
+            h0 = self.h0
+        if smooth_type is None:
+            smooth_type = {"method": "hinton2017"}
+        name = self.get_smoothed_name(smooth_type)
+        if name not in self.smoothed:
+            self.load_smoothed_data(smooth_type)
+        table = self.smoothed[name]
+        if self.singleval:
+            values = table[0, 0]
         else:
-            omch2 = (om - self.omega_b) * h0 * h0
-            data = self._interpolate(omch2, h0)
-        return {
-            "r_s": data[0],
-            "ks": self.ks,
-            "pk_lin": data[1 : 1 + self.k_num],
-            "pk_nl_0": data[1 + 1 * self.k_num : 1 + 2 * self.k_num],
-            "pk_nl_z": data[1 + 2 * self.k_num :],
-        }
+            values = self._interpolate((om - self.omega_b) * h0 * h0, h0, data=table)
+        return values[: self.k_num], values[self.k_num :]
+
+    def get_smoothed_name(self, smooth_type):
+        """The name of the smoothed table of a smoothing method, which includes a hash of any non-default arguments"""
+        kwargs = {k: v for k, v in smooth_type.items() if k != "method"}
+        name = smooth_type["method"].lower()
+        if kwargs:
+            name += "_" + hashlib.md5(str(sorted(kwargs.items())).encode()).hexdigest()[:8]
+        return name
+
+    def load_smoothed_data(self, smooth_type):
+        """Loads the table of smoothed linear power spectra and wiggle ratios over the grid for a smoothing method.
+
+        The table is generated from the CAMB data with `smooth_func_batch` the first time it is needed, which is
+        quick next to running CAMB, and saved next to the CAMB data unless the CAMB data is a single cosmology.
+        """
+        name = self.get_smoothed_name(smooth_type)
+        filename = self.data_dir + f"/smooth_{name}_{self.filename_unique}.npy"
+        if not self.singleval and os.path.exists(filename):
+            self.smoothed[name] = np.load(filename, mmap_mode="r" if self.mmap else None)
+            self.logger.info(f"Loading existing smoothed data for {name}")
+            return
 
-    def _generate_data(self, savedata=True):
-        self.logger.info(f"Generating CAMB data with {self.om_resolution} x {self.h0_resolution}")
-        os.makedirs(self.data_dir, exist_ok=True)
+        if self.data is None:
+            if self.singleval:
+                self.get_data()
+            else:
+                self.load_data()
+        if self.singleval:
+            data = np.asarray(self.data)[None, None, :]
+        else:
+            data = np.load(self.filename, mmap_mode="r")
+
+        self.logger.info(f"Generating smoothed data for {name} with {self.om_resolution} x {self.h0_resolution}")
+        h0s = np.tile(self.h0s, self.om_resolution)
+        omch2s = np.repeat(self.omch2s, self.h0_resolution)
+        pk_lin = np.array(data[:, :, self.fields["pk_lin"]]).reshape((-1, self.k_num))
+        pk_smooth_lin = smooth_func_batch(
+            self.ks,
+            pk_lin,
+            om=omch2s / (h0s * h0s) + self.omega_b,
+            h0=h0s,
+            ob=self.omega_b,
+            ns=self.ns,
+            rs=np.array(data[:, :, self.fields["r_s"]]).flatten(),
+            **smooth_type,
+        )
+        # Some methods smooth to zero far from the BAO (wallisch2018 below its extrapolation range), where there are no
+        # wiggles, so store a ratio of zero there rather than inf, which would turn the interpolation into nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pk_ratio = pk_lin / pk_smooth_lin - 1.0
+        pk_ratio[~np.isfinite(pk_ratio)] = 0.0
+        table = np.concatenate([pk_smooth_lin, pk_ratio], axis=1).reshape(data.shape[:2] + (2 * self.k_num,))
+        if not self.singleval:
+            try:
+                temp = filename.replace(".npy", f".{os.getpid()}.tmp.npy")
+                np.save(temp, table)
+                os.replace(temp, filename)
+            except OSError as e:
+                self.logger.warning(f"Could not save the smoothed data for {name}: {e}")
+        self.smoothed[name] = table
+
+    def get_cache_info(self):
+        """Returns the hits, misses, size and the bytes used by the interpolated fields of the get_data cache"""
+        nbytes = sum([d.get_nbytes() for d in self.cache.values()])
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self.cache), "nbytes": nbytes}
+
+    def _get_camb_params(self):
         import camb
 
         pars = camb.CAMBparams()
         pars.set_dark_energy(w=-1.0, dark_energy_model="fluid")
         pars.InitPower.set_params(As=2.083e-9, ns=self.ns)
         pars.set_matter_power(redshifts=[self.redshift, 0.0], kmax=self.k_max)
-        self.logger.info("Configured CAMB power and dark energy")
-
-        data = np.zeros((self.om_resolution, self.h0_resolution, 1 + 3 * self.k_num))
-        for i, omch2 in enumerate(self.omch2s):
-            for j, h0 in enumerate(self.h0s):
-                self.logger.info("Generating %d:%d  %0.4f  %0.4f" % (i, j, omch2, h0))
-                pars.set_cosmology(
-                    H0=h0 * 100,
-                    omch2=omch2,
-                    mnu=self.mnu,
-                    ombh2=self.omega_b * h0 * h0,
-                    omk=0.0,
-                    tau=0.066,
-                    neutrino_hierarchy="degenerate",
-                    num_massive_neutrinos=1,
-                )
-                pars.NonLinear = camb.model.NonLinear_none
-                results = camb.get_results(pars)
-                params = results.get_derived_params()
-                rdrag = params["rdrag"]
-                kh, z, pk_lin = results.get_matter_power_spectrum(minkh=self.k_min, maxkh=self.k_max, npoints=self.k_num)
-                pars.NonLinear = camb.model.NonLinear_pk
-                results.calc_power_spectra(pars)
-                kh, z, pk_nonlin = results.get_matter_power_spectrum(minkh=self.k_min, maxkh=self.k_max, npoints=self.k_num)
-                data[i, j, 0] = rdrag
-                data[i, j, 1 : 1 + self.k_num] = pk_lin[1, :]
-                data[i, j, 1 + self.k_num :] = pk_nonlin.flatten()
+        return pars
+
+    def _compute_node(self, pars, omch2, h0):
+        """Runs CAMB for one grid node, returning the sound horizon, linear power spectrum and halofit power spectra"""
+        import camb
+
+        pars.set_cosmology(
+            H0=h0 * 100,
+            omch2=omch2,
+            mnu=self.mnu,
+            ombh2=self.omega_b * h0 * h0,
+            omk=0.0,
+            tau=0.066,
+            neutrino_hierarchy="degenerate",
+            num_massive_neutrinos=1,
+        )
+        pars.NonLinear = camb.model.NonLinear_none
+        results = camb.get_results(pars)
+        params = results.get_derived_params()
+        rdrag = params["rdrag"]
+        kh, z, pk_lin = results.get_matter_power_spectrum(minkh=self.k_min, maxkh=self.k_max, npoints=self.k_num)
+        pars.NonLinear = camb.model.NonLinear_pk
+        results.calc_power_spectra(pars)
+        kh, z, pk_nonlin = results.get_matter_power_spectrum(minkh=self.k_min, maxkh=self.k_max, npoints=self.k_num)
+        row = np.zeros(1 + 3 * self.k_num)
+        row[0] = rdrag
+        row[1 : 1 + self.k_num] = pk_lin[1, :]
+        row[1 + self.k_num :] = pk_nonlin.flatten()
+        return row
+
+    def _generate_data(self, savedata=True, num_processes=1):
+        """Runs CAMB over the grid of omch2 and h0.
+
+        When saving, each node is written to a memory-mapped partial file as soon as it is computed, with a mask of the
+        finished nodes alongside, so an interrupted run resumes from where it stopped. The partial file is moved to
+        self.filename once every node is done.
+
+        Parameters
+        ----------
+        savedata : bool, optional
+            Whether to save the grid to self.filename
+        num_processes : int, optional
+            The number of processes to compute grid nodes over. If None, uses one per CPU.
+        """
+        self.logger.info(f"Generating CAMB data with {self.om_resolution} x {self.h0_resolution}")
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        shape = (self.om_resolution, self.h0_resolution, 1 + 3 * self.k_num)
+        partial = self.filename.replace(".npy", ".partial.npy")
+        done_file = self.filename.replace(".npy", ".done.npy")
+        if not savedata:
+            data, done = np.zeros(shape), np.zeros(shape[:2], dtype=bool)
+        elif os.path.exists(partial) and os.path.exists(done_file):
+            data = np.lib.format.open_memmap(partial, mode="r+")
+            done = np.lib.format.open_memmap(done_file, mode="r+")
+            self.logger.info(f"Resuming CAMB generation from {partial}, {done.sum()} of {done.size} nodes already done")
+        else:
+            data = np.lib.format.open_memmap(partial, mode="w+", dtype=np.float64, shape=shape)
+            done = np.lib.format.open_memmap(done_file, mode="w+", dtype=bool, shape=shape[:2])
+
+        todo = [(i, j) for i in range(self.om_resolution) for j in range(self.h0_resolution) if not done[i, j]]
+        num_processes = min(num_processes or os.cpu_count() or 1, max(len(todo), 1))
+        start = time.time()
+        for n, (i, j, row) in enumerate(self._compute_nodes(todo, num_processes)):
+            data[i, j] = row
+            done[i, j] = True
+            if savedata:
+                data.flush()
+                done.flush()
+            elapsed = time.time() - start
+            remaining = elapsed / (n + 1) * (len(todo) - n - 1)
+            self.logger.info(f"Generated {i}:{j} ({n + 1}/{len(todo)}), {elapsed:0.0f}s elapsed, ~{remaining:0.0f}s remaining")
+
         if savedata:
             self.logger.info(f"Saving to {self.filename}")
-            np.save(self.filename, data)
+            data = np.array(data)
+            os.replace(partial, self.filename)
+            os.remove(done_file)
         return data
 
+    def _compute_nodes(self, indexes, num_processes):
+        """Yields (i, j, row) for each (i, j) grid node index, computing them over num_processes processes"""
+        if num_processes == 1:
+            pars = self._get_camb_params()
+            self.logger.info("Configured CAMB power and dark energy")
+            for i, j in indexes:
+                self.logger.info("Generating %d:%d  %0.4f  %0.4f" % (i, j, self.omch2s[i], self.h0s[j]))
+                yield i, j, self._compute_node(pars, self.omch2s[i], self.h0s[j])
+            return
+
+        import multiprocessing
+
+        # Fork where we can so the workers inherit the generator, and split the CPUs between them for CAMB's OpenMP
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        threads = max(1, (os.cpu_count() or 1) // num_processes)
+        self.logger.info(f"Generating {len(indexes)} nodes over {num_processes} processes with {threads} threads each")
+        with context.Pool(num_processes, initializer=_init_camb_worker, initargs=(self, threads)) as pool:
+            yield from pool.imap_unordered(_compute_camb_node, indexes)
+
     def interpolate(self, om, h0, data=None):
         omch2 = (om - self.omega_b) * h0 * h0
         return self._interpolate(omch2, h0, data=data)
 
-    def _interpolate(self, omch2, h0, data=None):
-        """Performs bilinear interpolation on the entire pk array"""
-        omch2_index = 1.0 * (self.om_resolution - 1) * (omch2 - self.omch2s[0]) / (self.omch2s[-1] - self.omch2s[0])
-
-        # If omch2 == self.omch2s[-1] we can get an index out of bounds later due to rounding errors, so we
-        # manually set the edge cases
-        if omch2 >= self.omch2s[-1]:
-            omch2_index = self.om_resolution - 1 - 1.0e-6
-
+    def _get_interpolation_weights(self, omch2, h0):
+        """Returns the (omch2 index, h0 index, weight) of each grid node used to interpolate to omch2 and h0"""
+        omch2_indexes, omch2_weights = self.interpolator.get_weights(omch2, self.omch2s)
         if self.h0_resolution == 1:
-            h0_index = 0
+            h0_indexes, h0_weights = [0], [1.0]
         else:
-            h0_index = 1.0 * (self.h0_resolution - 1) * (h0 - self.h0s[0]) / (self.h0s[-1] - self.h0s[0])
-
-            # If h0 == self.h0s[-1] we can get an index out of bounds later due to rounding errors, so we
-            # manually set the edge cases
-            if h0 == self.h0s[-1]:
-                h0_index = self.h0_resolution - 1 - 1.0e-6
-
-        x = omch2_index - np.floor(omch2_index)
-        y = h0_index - np.floor(h0_index)
+            h0_indexes, h0_weights = self.interpolator.get_weights(h0, self.h0s)
+        return [(i, j, a * b) for i, a in zip(omch2_indexes, omch2_weights) for j, b in zip(h0_indexes, h0_weights)]
 
+    def _interpolate(self, omch2, h0, data=None, columns=None):
+        """Interpolates the pk array, or only the given columns of it. Only the rows of the grid nodes used are read, so
+        this is cheap on a memory-mapped table."""
         if data is None:
             data = self.data
-        v1 = data[int(np.floor(omch2_index)), int(np.floor(h0_index))]  # 00
-        v2 = data[int(np.ceil(omch2_index)), int(np.floor(h0_index))]  # 01
-
-        if self.h0_resolution == 1:
-            final = v1 * (1 - x) * (1 - y) + v2 * x * (1 - y)
-        else:
-            v3 = data[int(np.floor(omch2_index)), int(np.ceil(h0_index))]  # 10
-            v4 = data[int(np.ceil(omch2_index)), int(np.ceil(h0_index))]  # 11
-            final = v1 * (1 - x) * (1 - y) + v2 * x * (1 - y) + v3 * y * (1 - x) + v4 * x * y
+        final = 0.0
+        for i, j, weight in self._get_interpolation_weights(omch2, h0):
+            if weight == 0.0:
+                continue
+            value = data[i, j] if columns is None else data[i, j, columns]
+            if getattr(value, "dtype", None) == np.float32:
+                value = value.astype(np.float64)
+            final = final + value * weight
         return final
 
+    def get_interpolation_error(self, num_test=5, seed=0, fields=("r_s", "pk_lin", "pk_nl_z"), kmin=1e-3, kmax=0.5):
+        """Estimates the interpolation error by running CAMB at random held-out points inside the grid
+
+        Parameters
+        ----------
+        num_test : int, optional
+            The number of held-out cosmologies to run CAMB at
+        seed : int, optional
+            The random seed for the held-out cosmologies
+        fields : tuple[str], optional
+            The fields to compare
+        kmin, kmax : float, optional
+            Only compare the power spectra between these ks, as used in fits. CAMB does not compute the very smallest ks
+            of the table, which are tiny and would dominate the relative error.
+
+        Returns
+        -------
+        errors : dict
+            The largest absolute relative error of each field over the held-out points and ks
+        """
+        if self.data is None:
+            self.load_data()
+        rng = np.random.default_rng(seed)
+        pars = self._get_camb_params()
+        mask = (self.ks >= kmin) & (self.ks <= kmax)
+        errors = {f: 0.0 for f in fields}
+        for _ in range(num_test):
+            omch2 = rng.uniform(self.omch2s[0], self.omch2s[-1])
+            h0 = self.h0s[0] if self.h0_resolution == 1 else rng.uniform(self.h0s[0], self.h0s[-1])
+            exact = self._compute_node(pars, omch2, h0)
+            for f in fields:
+                columns = self.fields[f]
+                interpolated = np.atleast_1d(self.get_field(omch2, h0, f))
+                truth = np.atleast_1d(exact[columns])
+                if truth.size == self.k_num:
+                    interpolated, truth = interpolated[mask], truth[mask]
+                errors[f] = max(errors[f], float(np.max(np.abs(interpolated / truth - 1))))
+        self.logger.info(f"Interpolation errors with {self.interpolator.name} on {self.om_resolution} x {self.h0_resolution}: {errors}")
+        return errors
+
+
+_camb_generator = None
+_camb_params = None
+
+
+def _init_camb_worker(generator, threads):
+    """Sets up a worker process of `CambGenerator._generate_data`. CAMB reads its thread count when first imported."""
+    global _camb_generator, _camb_params
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _camb_generator = generator
+    _camb_params = generator._get_camb_params()
+
+
+def _compute_camb_node(index):
+    i, j = index
+    g = _camb_generator
+    return i, j, g._compute_node(_camb_params, g.omch2s[i], g.h0s[j])
+
 
 def test_rand_h0const():
     g = CambGenerator()
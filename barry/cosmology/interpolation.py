@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class GridInterpolator:
+    """Chooses the nodes of a one dimensional grid, and the weights of the nodes used to interpolate to a point.
+
+    `CambGenerator` takes the tensor product of the weights in omch2 and h0 to interpolate its table and every
+    precomputed model quantity, so a scheme only has to provide `get_nodes` and `get_weights`. Points outside the grid
+    are clamped to its edges.
+    """
+
+    name = None
+    uniform = True  # Whether the nodes are evenly spaced, so grids can be shared between schemes
+
+    def get_nodes(self, low, high, num):
+        return np.linspace(low, high, num)
+
+    def get_weights(self, x, nodes):
+        """Returns the indexes of the nodes used to interpolate to x, and their weights
+
+        Parameters
+        ----------
+        x : float
+            The point to interpolate to
+        nodes : np.ndarray
+            The grid nodes, in increasing order, as given by `get_nodes`
+
+        Returns
+        -------
+        indexes : list[int]
+            The indexes of the nodes used
+        weights : list[float]
+            The weight of each node, which sum to one
+        """
+        raise NotImplementedError()
+
+
+class LinearInterpolator(GridInterpolator):
+    """Linear interpolation between the two nodes either side of the point, on a uniform grid"""
+
+    name = "linear"
+
+    def get_weights(self, x, nodes):
+        n = len(nodes)
+        if n == 1:
+            return [0], [1.0]
+        index = 1.0 * (n - 1) * (x - nodes[0]) / (nodes[-1] - nodes[0])
+
+        # If x == nodes[-1] we can get an index out of bounds later due to rounding errors, so we
+        # manually set the edge cases
+        if x >= nodes[-1]:
+            index = n - 1 - 1.0e-6
+        index = max(index, 0.0)
+        frac = index - np.floor(index)
+        return [int(np.floor(index)), int(np.ceil(index))], [1 - frac, frac]
+
+
+class CubicInterpolator(GridInterpolator):
+    """Cubic Lagrange interpolation through the four nodes around the point (shifted inwards at the edges of the grid)"""
+
+    name = "cubic"
+    order = 3
+
+    def get_weights(self, x, nodes):
+        assert len(nodes) > self.order, f"Need more than {self.order} nodes for {self.name} interpolation"
+        x = np.clip(x, nodes[0], nodes[-1])
+        start = np.searchsorted(nodes, x) - (self.order + 1) // 2
+        start = int(np.clip(start, 0, len(nodes) - self.order - 1))
+        local = nodes[start : start + self.order + 1]
+        weights = []
+        for j, node in enumerate(local):
+            others = np.delete(local, j)
+            weights.append(np.prod((x - others) / (node - others)))
+        return list(range(start, start + self.order + 1)), weights
+
+
+class ChebyshevInterpolator(GridInterpolator):
+    """Polynomial interpolation through all the nodes, placed at the Chebyshev points (of the second kind, so including
+    the ends of the range). The error falls exponentially with the number of nodes for smooth functions, so 10-20
+    nodes can replace a dense linear grid. Uses the barycentric formula, which is stable for any number of nodes."""
+
+    name = "chebyshev"
+    uniform = False
+
+    def get_nodes(self, low, high, num):
+        if num == 1:
+            return np.array([0.5 * (low + high)])
+        return 0.5 * (low + high) - 0.5 * (high - low) * np.cos(np.pi * np.arange(num) / (num - 1))
+
+    def get_weights(self, x, nodes):
+        n = len(nodes)
+        x = np.clip(x, nodes[0], nodes[-1])
+        exact = np.flatnonzero(x == nodes)
+        if exact.size:
+            return [int(exact[0])], [1.0]
+        barycentric = (-1.0) ** np.arange(n)
+        barycentric[[0, -1]] *= 0.5
+        terms = barycentric / (x - nodes)
+        return list(range(n)), list(terms / np.sum(terms))
+
+
+INTERPOLATORS = {c.name: c for c in [LinearInterpolator, CubicInterpolator, ChebyshevInterpolator]}
+
+
+def get_interpolator(name):
+    """Gets the `GridInterpolator` for the name of an interpolation scheme: 'linear', 'cubic' or 'chebyshev'"""
+    if name not in INTERPOLATORS:
+        raise ValueError(f"Unknown interpolation {name}, should be one of {list(INTERPOLATORS)}")
+    return INTERPOLATORS[name]()
@@ -7,10 +7,13 @@ import numpy as np
 import numpy.fft as fft
 from scipy.special import spherical_jn, gamma, loggamma
 from scipy.integrate import trapz
-from scipy.interpolate import interp1d, splev, splrep
+from scipy.interpolate import interp1d, splev, splrep, make_interp_spline
+from scipy.sparse import block_diag, csr_matrix
 from scipy.interpolate import InterpolatedUnivariateSpline as interpolate
 from scipy.misc import derivative
 
+from barry.profiling import profile
+
 
 class PowerToCorrelation(ABC):
     """Generic class for converting power spectra to correlation functions
@@ -22,6 +25,7 @@ class PowerToCorrelation(ABC):
     def __init__(self, ell=0):
         self.ell = ell
 
+    @profile("pk2xi")
     def __call__(self, ks, pk, ss):
         """Generates the correlation function
 
@@ -51,6 +55,7 @@ class PowerToCorrelationGauss(PowerToCorrelation):
         self.ks2 = np.logspace(np.log(np.min(ks)), np.log(np.max(ks)), interpolateDetail * ks.size, base=np.e)
         self.precomp = self.ks2 * np.exp(-self.ks2 * self.ks2 * a * a) / (2 * np.pi * np.pi)  # Precomp a bunch of things
 
+    @profile("pk2xi")
     def __call__(self, ks, pks, ss):
         pks2 = interp1d(ks, pks, kind="linear")(self.ks2)
         # Set up output array
@@ -76,6 +81,98 @@ class PowerToCorrelationGauss(PowerToCorrelation):
         return xis
 
 
+class PowerToCorrelationMatrix(PowerToCorrelation):
+    """A pk2xi implementation applying a precomputed Hankel kernel matrix, for fixed input k and output s grids.
+
+    The transform is linear in P(k), so the linear interpolation onto a finer log-spaced grid, the Gaussian damping,
+    the trapezoid quadrature weights and the spherical Bessel function are combined into a single (ns, nk) matrix for
+    each set of separations, and xi(s) is a single matrix product. This is the same integral as
+    `PowerToCorrelationGauss`, so agrees with it to numerical precision, without the loop over separations. Optionally
+    the matrix is truncated to its leading singular vectors, making the product two thin matrix products.
+
+    Parameters
+    ----------
+    ks : np.ndarray
+        The k values of the power spectra, which must be the same for every call
+    ss : np.ndarray, optional
+        The separations to precompute the matrix for. Matrices for other separations are computed and cached as needed.
+    interpolateDetail : int, optional
+        The number of integration points per input k value
+    a : float, optional
+        The Gaussian damping scale
+    ell : int, optional
+        The order of the transform
+    rtol : float, optional
+        If given, singular values smaller than rtol times the largest are discarded. By default the full matrix is used.
+    """
+
+    def __init__(self, ks, ss=None, interpolateDetail=2, a=0.25, ell=0, rtol=None):
+        super().__init__(ell=ell)
+        self.ks = ks
+        self.ks2 = np.logspace(np.log(np.min(ks)), np.log(np.max(ks)), interpolateDetail * ks.size, base=np.e)
+        self.a = a
+        self.rtol = rtol
+
+        # Linear interpolation from ks onto ks2 multiplied by the damping and quadrature weights, shape (nk2, nk)
+        weights = np.zeros(self.ks2.size)
+        weights[1:] += 0.5 * np.diff(self.ks2)
+        weights[:-1] += 0.5 * np.diff(self.ks2)
+        interpolation = interp1d(ks, np.eye(ks.size), kind="linear", axis=0)(self.ks2)
+        self.precomp = (weights * self.ks2**2 * np.exp(-self.ks2 * self.ks2 * a * a) / (2 * np.pi * np.pi))[:, None] * interpolation
+
+        self.matrices = {}
+        self.max_matrices = 8
+        if ss is not None:
+            self.get_matrix(ss)
+
+    def get_matrix(self, ss):
+        """Gets the kernel matrix for the separations ss
+
+        Returns
+        -------
+        matrix : tuple(np.ndarray)
+            Either the full (ns, nk) matrix, or if truncating, the (ns, rank) and (rank, nk) factors.
+        """
+        key = ss.tobytes()
+        if key not in self.matrices:
+            if len(self.matrices) >= self.max_matrices:
+                self.matrices.pop(next(iter(self.matrices)))
+            # Including the sign of i^ell, matching the other implementations
+            bessel = np.real((1j) ** self.ell) * spherical_jn(self.ell, np.outer(ss, self.ks2))
+            matrix = bessel @ self.precomp
+            if self.rtol is None:
+                self.matrices[key] = (matrix,)
+            else:
+                u, sv, vt = np.linalg.svd(matrix, full_matrices=False)
+                rank = max(1, np.sum(sv > self.rtol * sv[0]))
+                self.matrices[key] = (u[:, :rank] * sv[:rank], np.ascontiguousarray(vt[:rank]))
+        return self.matrices[key]
+
+    @profile("pk2xi")
+    def __call__(self, ks, pks, ss):
+        """Generates the correlation function
+
+        Parameters
+        ----------
+        ks : np.ndarray
+            The k values for the power spectrum data, which must be the ks this class was created with
+        pks : np.ndarray
+            The P(k) values, either a single spectrum or a stack with shape (n, nk)
+        ss : np.nparray
+            The distances to calculate xi(s) at. This should be a fixed grid, as the matrix for each is cached.
+
+        Returns
+        -------
+        xi : np.ndarray
+            The correlation function at the specified distances, with shape (ns,) or (n, ns)
+        """
+        assert ks.shape == self.ks.shape, f"Expected the {self.ks.size} ks this class was created with, got {ks.size}"
+        xis = pks
+        for factor in self.get_matrix(ss)[::-1]:
+            xis = xis @ factor.T
+        return xis
+
+
 class PowerToCorrelationFT(PowerToCorrelation):
     """A pk2xi implementation utilising the Hankel library to use explicit FFT."""
 
@@ -94,6 +191,7 @@ class PowerToCorrelationFT(PowerToCorrelation):
         super().__init__(ell=ell)
         self.ft = SymmetricFourierTransform(ndim=2 * ell + 3, N=num_nodes, h=h)
 
+    @profile("pk2xi")
     def __call__(self, ks, pk, ss):
         pkspline = splrep(ks, pk)
         f = lambda k: splev(k, pkspline) / (k**self.ell)
@@ -101,6 +199,10 @@ class PowerToCorrelationFT(PowerToCorrelation):
         return xi
 
 
+# FFTLog plans shared by all PowerToCorrelationFFTLog instances, see PowerToCorrelationFFTLog.get_plan
+_fftlog_plans = {}
+
+
 class PowerToCorrelationFFTLog(PowerToCorrelation):
     """A pk2xi implementation based on Ashley Ross' code."""
 
@@ -109,10 +211,18 @@ class PowerToCorrelationFFTLog(PowerToCorrelation):
 
         Parameters
         ----------
-        num_nodes : int, optional
-            Number of nodes in FFT
-        h : float, optional
-            Step size of integration
+        ell : int, optional
+            The order of the transform
+        q : float, optional
+            The power of kr in the transform
+        r0 : float, optional
+            The starting output coordinate, adjusted to limit ringing
+        transformed_axis : int, optional
+            The axis of the power spectra to transform. Use -1 to transform a stack of spectra with shape (..., nk).
+        output_r_power : float, optional
+            The output is multiplied by r**output_r_power
+        n : float, optional
+            Defaults to q, do not play with this
         """
 
         super().__init__(ell=ell)
@@ -123,6 +233,7 @@ class PowerToCorrelationFFTLog(PowerToCorrelation):
         self.n = self.q if n is None else n
         self.mu = ell + 0.5
 
+    @profile("pk2xi")
     def __call__(self, ks, pk, ss):
         """
         Hankel transform, with power law biasing
@@ -130,42 +241,66 @@ class PowerToCorrelationFFTLog(PowerToCorrelation):
         with k logathmically spaced
         based on Hamilton 2000 FFTLog algorithm.
 
+        The kernel and output coordinates are cached for each k-grid, so repeated calls only do the FFTs.
+
         Args:
              k : 1D numpy array, log spacing defining the rectangular k-grid of Pk
-             a : 1D or 2D numpy array, axis to be transformed must have same size as k
+             a : numpy array of any dimension, axis to be transformed must have same size as k
              q : float or int, power of kr in transformation
              mu : float or int, parameter of Bessel function
         Options:
              r0 : float, default is 10 (units of 1/k)
-             transformed_axis : int, if a is 2D, can transform along axis 0 or 1,
-                                do the transform on all rows of other axis.
+             transformed_axis : int, the axis of a to transform, all the other axes are transformed at once.
              ss : 1D numpy array or None. if set, output is interpolated to
                                 this array of coordinates
              output_r_power : multiply output by r**output_r_power
              n : default n=None and set to n=q , do not play with this
         Returns:
-             r : 1D numpy array
-             a'(r) : numpy array, 1D or 2D, depending on input a
+             a'(r) : numpy array, with the same shape as a, except for the transformed axis having the size of ss
         """
-        if len(pk.shape) > 2:
-            print("not implemented for a of more than 2D")
-            sys.exit(12)
+        plan = self.get_plan(ks)
+
+        # Transform along the last axis, so any leading axes are a batch of spectra
+        pk = np.moveaxis(np.asarray(pk), self.transformed_axis, -1)
+        transformed = (fft.ifft(plan["um"] * fft.fft(pk * plan["kn"], axis=-1), axis=-1) * plan["rn"]).real[..., plan["order"]]
+        if ss is not None:
+            # Linear interpolation onto ss, extrapolating linearly from the end points as in extrap
+            rs = plan["rs"]
+            i = np.clip(np.searchsorted(rs, ss) - 1, 0, rs.size - 2)
+            w = (ss - rs[i]) / (rs[i + 1] - rs[i])
+            transformed = (1.0 - w) * transformed[..., i] + w * transformed[..., i + 1]
+        transformed = np.moveaxis(transformed, -1, self.transformed_axis)
+
+        return np.real((1j) ** self.ell * transformed / (5.0 * np.pi))
+
+    def get_plan(self, ks):
+        """Gets the FFTLog kernel and output coordinates for the log-spaced ks, computing them the first time the
+        (N, k0, L, q, n, mu, r0) configuration is seen. Plans are shared between instances.
 
+        Returns
+        -------
+        plan : dict
+            Containing the kernel 'um', the input factor 'kn', the output factor 'rn', the sorting 'order' of the output
+            coordinates and the sorted coordinates 'rs'.
+        """
         k0 = ks[0]
         N = len(ks)
         L = np.log(ks.max() / k0) * N / (N - 1.0)  ## this is important, need to have the right scale !!
+        key = (N, k0, L, self.q, self.n, self.mu, self.r0, self.output_r_power)
+        if key in _fftlog_plans:
+            return _fftlog_plans[key]
+
         emm = N * np.fft.fftfreq(N)
 
         nout = self.n + self.output_r_power
 
         x = (self.q - self.n) + 2 * np.pi * 1j * emm / L  # Eq. 174
 
-        if 1:  # choose r0 to limit ringing with the condition u(-N/2)=u(N/2), see Hamilton 2000, Eq. 186
-            x0 = (self.q - self.n) + np.pi * 1j * N / L
-            tmp = 1.0 / np.pi * np.angle(2**x0 * gamma((self.mu + 1 + x0) / 2.0) / gamma((self.mu + 1 - x0) / 2.0))
-            number = int(np.log(k0 * self.r0) * N / L - tmp)
-            lowringing_r0 = np.exp(L / N * (tmp + number)) / k0
-            r0 = lowringing_r0
+        # choose r0 to limit ringing with the condition u(-N/2)=u(N/2), see Hamilton 2000, Eq. 186
+        x0 = (self.q - self.n) + np.pi * 1j * N / L
+        tmp = 1.0 / np.pi * np.angle(2**x0 * gamma((self.mu + 1 + x0) / 2.0) / gamma((self.mu + 1 - x0) / 2.0))
+        number = int(np.log(k0 * self.r0) * N / L - tmp)
+        r0 = np.exp(L / N * (tmp + number)) / k0
 
         um = (
             (k0 * r0) ** (-2 * np.pi * 1j * emm / L) * 2**x * (gamma((self.mu + 1 + x) / 2.0) / gamma((self.mu + 1 - x) / 2.0))
@@ -173,34 +308,13 @@ class PowerToCorrelationFFTLog(PowerToCorrelation):
         um[0] = um[0].real
 
         r = r0 * np.exp(-emm * L / N)
-        s = np.argsort(r)
-        rs = r[s]  # sorted
+        order = np.argsort(r)
 
-        if len(pk.shape) == 1:
-            transformed = (fft.ifft(um * fft.fft(pk * (ks**self.n))) * (r**nout)).real[s]
-            if ss is not None:
-                transformed = self.extrap(ss, rs, transformed)
-        else:
-            if self.transformed_axis == 0:
-                if ss is None:
-                    transformed = np.zeros_like(pk)
-                    for i in xrange(pk.shape[1]):  # I don't know how to do this at once
-                        transformed[:, i] = (fft.ifft(um * fft.fft(pk[:, i] * (ks**self.n))) * (r**nout)).real[s]
-                else:
-                    transformed = np.zeros(shape=(ss.size, pk.shape[1]), dtype=pk.dtype)
-                    for i in xrange(pk.shape[1]):
-                        transformed[:, i] = self.extrap(ss, rs, (fft.ifft(um * fft.fft(pk[:, i] * (ks**self.n))) * (r**nout)).real[s])
-            else:
-                if ss is None:
-                    transformed = np.zeros_like(pk)
-                    for i in xrange(pk.shape[0]):
-                        transformed[i, :] = (fft.ifft(um * fft.fft(pk[i, :] * (ks**self.n))) * (r**nout)).real[s]
-                else:
-                    transformed = np.zeros(shape=(pk.shape[0], ss.size), dtype=pk.dtype)
-                    for i in xrange(pk.shape[0]):
-                        transformed[i, :] = self.extrap(ss, rs, (fft.ifft(um * fft.fft(pk[i, :] * (ks**self.n))) * (r**nout)).real[s])
-
-        return np.real((1j) ** self.ell * transformed / (5.0 * np.pi))
+        plan = {"um": um, "kn": ks**self.n, "rn": r**nout, "order": order, "rs": r[order]}
+        if len(_fftlog_plans) >= 32:
+            _fftlog_plans.pop(next(iter(_fftlog_plans)))
+        _fftlog_plans[key] = plan
+        return plan
 
     def extrap(self, x, xp, yp):
         """np.interp function with linear extrapolation"""
@@ -292,6 +406,13 @@ class PowerToCorrelationSphericalBessel(PowerToCorrelation):
                 self.udict[ll] = us
                 self.qdict[ll] = q
 
+        # Padded input buffers for each number of orders, and output interpolation operators for each separation grid, used by
+        # transform
+        self.buffers = {}
+        self.operators = {}
+        self.max_operators = 8
+
+    @profile("pk2xi")
     def __call__(self, ks, fq, ss, damping=0.25, nu=None):
         """
         The workhorse of the class. Spherical Hankel Transforms fq on coordinates self.q.
@@ -311,6 +432,79 @@ class PowerToCorrelationSphericalBessel(PowerToCorrelation):
 
         return np.real((1j) ** nu * splev(ss, splrep(y, y ** (-q) * gs[self.pad_iis])))
 
+    @profile("pk2xi")
+    def transform(self, ks, fqs, ss, ells, damping=0.25):
+        """Batched spherical Hankel transform of several spectra, each with its own order, onto a fixed output grid.
+
+        All the FFTs are done together, and the spline from the log-spaced FFTLog output onto ss is applied as a matrix
+        product with a precomputed interpolation operator. The operator is cached for each ss and ells, so ss should be a fixed
+        grid (such as finedist in the correlation function models) rather than one that changes with every call.
+        Agrees with `__call__` to within the accuracy of the spline.
+
+        Parameters
+        ----------
+        ks : np.ndarray
+            The k values of the spectra, which must be the qs this class was created with
+        fqs : np.ndarray
+            The spectra to transform, with shape (n, nk), or (..., n, nk) to transform a batch of them with the same orders
+        ss : np.ndarray
+            The fixed grid of separations to calculate xi(s) at
+        ells : list[int]
+            The order of each transform, with length n. Each must be at most the ell this class was created with.
+        damping : float, optional
+            The Gaussian damping scale applied to the spectra, as in `__call__`
+
+        Returns
+        -------
+        xis : np.ndarray
+            The transformed spectra, with shape (n, len(ss)), or (..., n, len(ss)) for a batch
+        """
+        ells = list(ells)
+        fqs = np.atleast_2d(fqs)
+        batch = fqs.shape[:-2]
+        assert fqs.shape[-2:] == (len(ells), self.Nx), f"Expected spectra with shape {(len(ells), self.Nx)}, got {fqs.shape}"
+        fqs = fqs.reshape((-1, len(ells), self.Nx))
+
+        # Fill the middle of the padded buffer, the padding stays zero. The buffer is only reallocated for larger batches.
+        buffer = self.buffers.get(len(ells))
+        if buffer is None or len(buffer) < len(fqs):
+            buffer = self.buffers[len(ells)] = np.zeros(fqs.shape[:2] + (self.Nx + 2 * len(self.pads),))
+        buffer = buffer[: len(fqs)]
+        prefactors = np.array([self.q ** (3 - self.qdict[nu]) for nu in ells])
+        np.multiply(prefactors * np.exp(-(ks**2) * damping**2), fqs, out=buffer[..., len(self.pads) : len(self.pads) + self.Nx])
+
+        fks = np.fft.rfft(buffer, axis=-1)
+        gs = np.fft.hfft(np.array([self.udict[nu] for nu in ells]) * fks, axis=-1) / self.N
+
+        xis = self.get_output_operator(ss, ells) @ gs[..., self.pad_iis].reshape((len(fqs), -1)).T
+        return xis.T.reshape(batch + (len(ells), len(ss)))
+
+    def get_output_operator(self, ss, ells):
+        """Gets the operator interpolating the stacked FFTLog outputs of orders ells onto the separations ss.
+
+        Spline interpolation is linear, so interpolating from the log-spaced output coordinates (and applying the y^-q
+        and i^nu factors) is a matrix for each order, and the batch is their block diagonal. The spline weights decay
+        quickly away from each output separation, so negligible weights are dropped and the operator is stored sparse.
+
+        Returns
+        -------
+        operator : scipy.sparse.csr_matrix
+            The operator, with shape (len(ells) * len(ss), len(ells) * len(y))
+        """
+        key = (ss.tobytes(), tuple(ells))
+        if key not in self.operators:
+            if len(self.operators) >= self.max_operators:
+                self.operators.pop(next(iter(self.operators)))
+            blocks = []
+            for nu in ells:
+                y, q = self.ydict[nu], self.qdict[nu]
+                # Not-a-knot cubic spline of each unit vector, matching splrep
+                weights = make_interp_spline(y, np.eye(self.Nx), k=3)(ss)
+                weights[np.abs(weights) < 1.0e-13] = 0.0
+                blocks.append(csr_matrix(np.real((1j) ** nu) * weights * y ** (-q)))
+            self.operators[key] = block_diag(blocks, format="csr")
+        return self.operators[key]
+
     def UK(self, nu, z):
         """
         The Mellin transform of the spherical bessel transform.
@@ -28,7 +28,54 @@ def smooth_func(ks, pk, method="hinton2017", **kwargs):
     return get_smooth_methods_dict()[method.lower()](ks, pk, **kwargs)
 
 
-def smooth_wallisch2018(ks, pk, ii_l=None, ii_r=None, extrap_min=1e-3, extrap_max=10, N=16):
+def smooth_func_batch(ks, pks, method="hinton2017", chunk_size=256, **kwargs):
+    """Smooths many power spectra at once, such as those on the grid of a `CambGenerator`
+
+    The hinton2017 and eh1998 methods are vectorised over the spectra, processing chunk_size at a time to limit the
+    memory used. Other methods smooth the spectra one by one.
+
+    Parameters
+    ----------
+    ks : np.ndarray
+        The ks of the power spectra
+    pks : np.ndarray
+        The power spectra, with shape (num_spectra, num_ks)
+    method : str, optional
+        The smoothing method, see `get_smooth_methods_dict`
+    chunk_size : int, optional
+        The number of spectra to smooth together
+    kwargs : dict
+        The arguments of the smoothing method. Each is either a single value or an array of one value per spectrum,
+        such as the om and rs of each spectrum for eh1998.
+
+    Returns
+    -------
+    pks_smoothed : np.ndarray
+        The smoothed power spectra, with the same shape as pks
+    """
+    pks = np.atleast_2d(pks)
+    batched = {"hinton2017": smooth_hinton2017_batch, "eh1998": smooth_eh1998_batch}.get(method.lower())
+    result = np.empty(pks.shape)
+    for start in range(0, len(pks), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        args = {k: v[chunk] if np.ndim(v) else v for k, v in kwargs.items()}
+        if batched is not None:
+            result[chunk] = batched(ks, pks[chunk], **args)
+        else:
+            for i, pk in enumerate(pks[chunk]):
+                result[start + i] = smooth_func(ks, pk, method=method, **{k: v[i] if np.ndim(v) else v for k, v in args.items()})
+    return result
+
+
+def _solve_weighted_least_squares(design, targets):
+    """Solves the linear least squares problem of each design matrix (with shape (num_problems, num_points,
+    num_params)) and target vector at once, scaling the columns as `np.polyfit` does for conditioning"""
+    scale = np.sqrt(np.sum(design**2, axis=1))
+    q, r = np.linalg.qr(design / scale[:, None, :])
+    return np.linalg.solve(r, np.einsum("npi,np->ni", q, targets)[..., None])[..., 0] / scale
+
+
+def smooth_wallisch2018(ks, pk, ii_l=None, ii_r=None, extrap_min=1e-3, extrap_max=10, N=16, **kwargs):
     """Implement the wiggle/no-wiggle split procedure from Benjamin Wallisch's thesis (arXiv:1810.02800)"""
 
     # put onto a linear grid
@@ -103,6 +150,24 @@ def smooth_hinton2017(ks, pk, degree=13, sigma=1, weight=0.5, **kwargs):
     return pk_smoothed
 
 
+def smooth_hinton2017_batch(ks, pks, degree=13, sigma=1, weight=0.5, **kwargs):
+    """Vectorised `smooth_hinton2017` of power spectra with shape (num_spectra, num_ks). The weights only depend on
+    where each spectrum peaks, so all the spectra peaking at the same k are fit with a single call to polyfit."""
+    log_ks = np.log(ks)
+    log_pks = np.log(pks)
+    indexes = np.argmax(pks, axis=1)
+    z = np.empty((len(pks), degree + 1))
+    for index in np.unique(indexes):
+        if sigma < 0.001:
+            gauss = 0.0
+        else:
+            gauss = np.exp(-0.5 * np.power(((log_ks - log_ks[index]) / sigma), 2))
+        w = np.ones(ks.size) - weight * gauss
+        rows = indexes == index
+        z[rows] = np.polyfit(log_ks, log_pks[rows].T, degree, w=w).T
+    return np.exp(z @ np.vander(log_ks, degree + 1).T)
+
+
 def smooth_eh1998(ks, pk, om=0.3121, ob=0.0491, h0=0.6751, ns=0.9653, sigma8=0.8150, rs=None, **kwargs):
     """Smooth power spectrum based on Eisenstein and Hu 1998 fitting formulae for the transfer function
     with shape of matter power spectrum fit using 5th order polynomial
@@ -127,6 +192,24 @@ def smooth_eh1998(ks, pk, om=0.3121, ob=0.0491, h0=0.6751, ns=0.9653, sigma8=0.8
     return result["x"][0] * pk_EH98 + Apoly
 
 
+def smooth_eh1998_batch(ks, pks, om=0.3121, ob=0.0491, h0=0.6751, ns=0.9653, rs=None, **kwargs):
+    """Vectorised `smooth_eh1998` of power spectra with shape (num_spectra, num_ks), where the cosmological parameters
+    are either single values or arrays of one value per spectrum.
+
+    The fit of the Eisenstein and Hu power spectrum and polynomial is linear in its parameters, so is solved exactly
+    rather than with an optimiser. The sigma8 normalisation is absorbed by the fitted amplitude, so is not needed.
+    """
+    params = np.broadcast_arrays(*[np.full(len(pks), np.nan if v is None else v, dtype=float) for v in [om, ob, h0, ns, rs]])
+    design = np.empty(pks.shape + (6,))
+    for i, (om_i, ob_i, h0_i, ns_i, rs_i) in enumerate(zip(*params)):
+        design[i, :, 0] = ks**ns_i * __EH98_dewiggled(ks, om_i, ob_i, h0_i, None if np.isnan(rs_i) else rs_i) ** 2
+    design[..., 1:] = np.array([ks, np.ones(ks.shape), 1.0 / ks, 1.0 / ks**2, 1.0 / ks**3]).T
+    # Leave out the placeholder values CAMB gives below the smallest k it computes, which would dominate the fit
+    weights = np.where(pks > 1.0e-10 * np.max(pks, axis=1, keepdims=True), 1.0 / pks, 0.0)
+    x = _solve_weighted_least_squares(design * weights[..., None], pks * weights)
+    return np.einsum("nki,ni->nk", design, x)
+
+
 # Compute the Eisenstein and Hu dewiggled transfer function
 def __EH98_dewiggled(ks, om, ob, h0, rs):
 
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import pickle
 import logging
@@ -5,12 +6,45 @@ import inspect
 from abc import ABC
 
 import numpy as np
-from scipy.interpolate import splrep, splev
+from scipy.interpolate import make_interp_spline
 
 from barry.datasets.dataset import Dataset
 from barry.utils import break_matrix_and_get_blocks
 
 
+_binmat_cache = {}
+
+
+def get_binmat(ss, ds, ss_input, num_points=100):
+    """Computes the binning matrix, mapping a correlation function evaluated at ss_input to its volume weighted average
+    in bins of width ds centred on ss.
+
+    Parameters
+    ----------
+    ss : np.ndarray
+        The bin centres
+    ds : float
+        The bin width
+    ss_input : np.ndarray
+        The separations the correlation function is evaluated at, and interpolated from with a cubic spline
+    num_points : int, optional
+        The number of points used to integrate over each bin
+
+    Returns
+    -------
+    binmat : np.ndarray
+        The binning matrix, with shape (len(ss), len(ss_input))
+    """
+    # The spline of each unit basis vector, all sharing the same knots. Not-a-knot conditions match splrep.
+    spline = make_interp_spline(ss_input, np.eye(len(ss_input)), k=3)
+
+    kl, kr = ss - ds / 2, ss + ds / 2
+    sin = np.linspace(kl, kr, num_points, axis=1)
+    # Evaluating outside ss_input uses the end values, as with ext=3 in splev
+    basis = spline(np.clip(sin, ss_input[0], ss_input[-1]))
+    return np.trapz(sin[:, :, None] ** 2 * basis, x=sin[:, :, None], axis=1) * (3 / (kr**3 - kl**3))[:, None]
+
+
 class CorrelationFunction(Dataset, ABC):
     def __init__(
         self,
@@ -161,31 +195,34 @@ class CorrelationFunction(Dataset, ABC):
         self.logger.info(f"Computed cov {self.cov.shape}")
 
     def set_binmat(self):
+        """Sets the binning matrix, which maps a correlation function evaluated on `ss_input` to the volume weighted
+        average in each of the data's separation bins.
 
+        Spline interpolation is linear in the values being interpolated, so the interpolating spline of every unit basis
+        vector is built at once and integrated over all the bins together. As the matrix only depends on the separations,
+        it is cached on disk in the `generated` folder and reused by every dataset (and realisation) with the same bins.
+        """
         ds = self.ss[1] - self.ss[0]
         self.ss_input = np.linspace(1.0, 250.0, 249)
 
-        self.binmat = np.zeros((len(self.ss), len(self.ss_input)))
-        for ii in range(len(self.ss_input)):
-
-            # Define basis vector
-            xivec = np.zeros_like(self.ss_input)
-            xivec[ii] = 1
-
-            # Define the spline:
-            xivec_spline = splrep(self.ss_input, xivec)
+        key = hashlib.md5(np.concatenate([self.ss, [ds], self.ss_input]).astype(float).tobytes()).hexdigest()
+        if key in _binmat_cache:
+            self.binmat = _binmat_cache[key]
+            return
 
-            # Now compute binned basis vector:
-            tmp = np.zeros_like(self.ss)
-            for i, ss in enumerate(self.ss):
-                kl = ss - ds / 2
-                kr = ss + ds / 2
-                sin = np.linspace(kl, kr, 100)
-                tmp[i] = np.trapz(sin**2 * splev(sin, xivec_spline, ext=3), x=sin) * 3 / (kr**3 - kl**3)
-
-            self.binmat[:, ii] = tmp
-
-        return
+        data_dir = os.path.normpath(os.path.dirname(inspect.stack()[0][1]) + "/../generated/")
+        filename = os.path.join(data_dir, f"binmat_{key}.npy")
+        if os.path.exists(filename):
+            self.binmat = np.load(filename)
+        else:
+            self.binmat = get_binmat(self.ss, ds, self.ss_input)
+            os.makedirs(data_dir, exist_ok=True)
+            # Write to a temporary file first, so that other processes never read a partially written matrix
+            temp_filename = filename.replace(".npy", f"_{os.getpid()}.npy")
+            np.save(temp_filename, self.binmat)
+            os.replace(temp_filename, filename)
+            self.logger.info(f"Saved binning matrix to {filename}")
+        _binmat_cache[key] = self.binmat
 
     def get_data(self):
         d = {
@@ -30,6 +30,7 @@ class PowerSpectrum_SDSS_DR12(PowerSpectrum):
         realisation=None,
         isotropic=True,
         fit_poles=(0,),
+        compress_window=False,
     ):
 
         self.nredshift_bins = 3
@@ -69,6 +70,7 @@ class PowerSpectrum_SDSS_DR12(PowerSpectrum):
             realisation=realisation,
             isotropic=isotropic,
             fit_poles=fit_poles,
+            compress_window=compress_window,
         )
 
 
@@ -93,6 +95,7 @@ class PowerSpectrum_eBOSS_LRGpCMASS(PowerSpectrum):
         realisation=None,
         isotropic=True,
         fit_poles=(0,),
+        compress_window=False,
     ):
 
         self.nredshift_bins = 1
@@ -126,6 +129,7 @@ class PowerSpectrum_eBOSS_LRGpCMASS(PowerSpectrum):
             realisation=realisation,
             isotropic=isotropic,
             fit_poles=fit_poles,
+            compress_window=compress_window,
         )
 
 
@@ -151,6 +155,7 @@ class PowerSpectrum_Beutler2019(PowerSpectrum):
         realisation=None,
         isotropic=True,
         fit_poles=(0,),
+        compress_window=False,
     ):
 
         self.nredshift_bins = 2
@@ -188,6 +193,7 @@ class PowerSpectrum_Beutler2019(PowerSpectrum):
             realisation=realisation,
             isotropic=isotropic,
             fit_poles=fit_poles,
+            compress_window=compress_window,
         )
 
 
@@ -211,6 +217,7 @@ class PowerSpectrum_DESIMockChallenge_Post(PowerSpectrum):
         covtype="analytic",
         smoothtype=3,
         tracer="elghd",
+        compress_window=False,
     ):
 
         self.nredshift_bins = 1
@@ -251,6 +258,7 @@ class PowerSpectrum_DESIMockChallenge_Post(PowerSpectrum):
             realisation=realisation,
             isotropic=isotropic,
             fit_poles=fit_poles,
+            compress_window=compress_window,
         )
 
 
@@ -272,6 +280,7 @@ class PowerSpectrum_DESILightcone_Mocks_Recon(PowerSpectrum):
         isotropic=True,
         fit_poles=(0,),
         type="julian_reciso",
+        compress_window=False,
     ):
 
         self.nredshift_bins = 1
@@ -312,6 +321,7 @@ class PowerSpectrum_DESILightcone_Mocks_Recon(PowerSpectrum):
             realisation=realisation,
             isotropic=isotropic,
             fit_poles=fit_poles,
+            compress_window=compress_window,
         )
 
 
@@ -330,6 +340,7 @@ class PowerSpectrum_DESI_KP4(PowerSpectrum):
         fit_poles=(0,),
         datafile="desi_kp4_abacus_cubicbox_pk_lrg.pkl",
         data_location=None,
+        compress_window=False,
     ):
 
         if any(pole in [1, 3] for pole in fit_poles):
@@ -358,6 +369,7 @@ class PowerSpectrum_DESI_KP4(PowerSpectrum):
             isotropic=False,
             fit_poles=fit_poles,
             data_location=data_location,
+            compress_window=compress_window,
         )
 
 
@@ -28,6 +28,7 @@ class PowerSpectrum(Dataset, ABC):
         isotropic=True,
         fit_poles=(0,),
         data_location=None,
+        compress_window=False,
     ):
         current_file = os.path.dirname(inspect.stack()[0][1])
         self.data_location = (
@@ -37,6 +38,7 @@ class PowerSpectrum(Dataset, ABC):
         self.max_k = max_k
         self.step_size = step_size
         self.postprocess = postprocess
+        self.compress_window = compress_window
         if postprocess is not None and not self.isotropic:
             raise NotImplementedError("Postprocessing (i.e., BAOExtractor) not implemented for anisotropic fits")
 
@@ -93,7 +95,7 @@ class PowerSpectrum(Dataset, ABC):
         if not self.isotropic:
             self._load_comp_file()
 
-        self.icov, self.icov_w, self.icov_mw, self.icov_ww, self.icov_mww, self.icov_mwmw = None, None, None, None, None, None
+        self.icov, self.icov_chol, self.icov_w, self.icov_mw = None, None, None, None
         self.cov, self.cov_fit, self.corr, self.data = None, None, None, None
         self.set_realisation(realisation)
         self.set_cov(fake_diag=fake_diag)
@@ -160,11 +162,14 @@ class PowerSpectrum(Dataset, ABC):
                 if pole not in self.fit_poles:
                     w_mask_poles[i] = np.zeros(len(self.w_mask), dtype=bool)
             w_mask_poles = np.concatenate(w_mask_poles)
-            # self.icov_w = self.w_transform[w_mask_poles, :].T @ self.icov
-            # self.icov_mw = self.m_w_transform[w_mask_poles, :].T @ self.icov
-            # self.icov_ww = self.icov_w @ self.w_transform[w_mask_poles, :]
-            # self.icov_mww = self.icov_mw @ self.w_transform[w_mask_poles, :]
-            # self.icov_mwmw = self.icov_mw @ self.m_w_transform[w_mask_poles, :]
+            if self.compress_window:
+                # Fold the window function (and wide-angle) convolution into the Cholesky factor of the inverse covariance,
+                # icov = L @ L.T, so that models at the window function input ks can be compared directly to the whitened data.
+                # (L.T @ W).T @ (L.T @ W) is W.T @ icov @ W, but is much cheaper to store and apply than the dense product.
+                self.icov_chol = np.linalg.cholesky(self.icov)
+                self.icov_w = self.icov_chol.T @ self.w_transform[w_mask_poles, :]
+                self.icov_mw = self.icov_chol.T @ self.m_w_transform[w_mask_poles, :]
+                self.logger.info(f"Compressed window function into inverse covariance with shape {self.icov_mw.shape}")
             self.m_w_mask = w_mask_poles
 
     def _compute_cov(self):
@@ -264,7 +269,7 @@ class PowerSpectrum(Dataset, ABC):
             "ks": self.ks,
             "cov": self.cov,
             "icov": self.icov,
-            "icov_m_w": [self.icov_w, self.icov_mw, self.icov_ww, self.icov_mww, self.icov_mwmw],
+            "icov_m_w": [None, None, None],
             "ks_input": self.w_ks_input,
             "w_scale": self.w_k0_scale,
             "w_transform": self.w_transform,
@@ -292,6 +297,8 @@ class PowerSpectrum(Dataset, ABC):
             d.update({"w_mask": np.tile(self.w_mask, len(self.poles))})
             d.update({"m_w_mask": self.m_w_mask})
             d.update({"pk": self.data[:, self.fit_pole_indices].flatten("F")})
+            if self.icov_w is not None:
+                d.update({"icov_m_w": [self.icov_w, self.icov_mw, self.icov_chol.T @ d["pk"]]})
         d.update({f"pk{d}": np.split(self.data[:, i], self.ndata) for i, d in enumerate(self.poles)})
         return [d]
 
@@ -1,14 +1,19 @@
+import hashlib
 import logging
 import os
 import shutil
 import socket
 import sys
+import time
+import traceback
 import numpy as np
 
+from barry.chain_archive import ChainArchive
 from barry.config import get_config
 from barry.doJob import write_jobscript_slurm
+from barry.profiling import PROFILER
 from barry.samplers import DynestySampler
-from barry.utils import get_hpc
+from barry.utils import get_hpc, weighted_avg_and_std
 
 
 class Fitter(object):
@@ -48,6 +53,14 @@ class Fitter(object):
         self.sampler = None
         self.save_dims = save_dims
         self.remove_output = remove_output
+        self.profile = False
+        self.local_executor = False
+        self.num_processes = None
+        self.threads_per_process = 1
+        # Arrays shared between the data of the model-dataset pairs, by content hash and by identity, see _intern
+        self.interned = {}
+        self.interned_ids = {}
+        self.pair_nbytes = []
         os.makedirs(temp_dir, exist_ok=True)
         if not remove_output:
             self.logger.warning("OUTPUT IS NOT BEING REMOVED, BE WARNED IF THIS IS SUPPOSED TO BE A FRESH RUN")
@@ -71,7 +84,48 @@ class Fitter(object):
             extra_args["realisation"] = dataset.realisation
         if "name" not in extra_args:
             extra_args["name"] = dataset.get_name() + " + " + model.get_name()
-        self.model_datasets.append((model, dataset.get_data(), extra_args))
+
+        # Arrays that are the same as those of a previous pair (such as the window function and covariance when adding
+        # many realisations of a dataset) are replaced by the previous ones, so each pair only adds its data vector.
+        nbytes = [0]
+        data = self._intern(dataset.get_data(), nbytes)
+        self.pair_nbytes.append(nbytes[0])
+        self.logger.debug(f"Added {extra_args['name']} with {nbytes[0] / 1024:0.1f} KB of new data")
+        self.model_datasets.append((model, data, extra_args))
+
+    def _intern(self, value, nbytes):
+        """Returns value with every array in it (recursing into lists, tuples and dicts) replaced by the first array with
+        the same contents added to the Fitter, adding the size of any arrays not seen before to nbytes[0]"""
+        if isinstance(value, dict):
+            return {k: self._intern(v, nbytes) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._intern(v, nbytes) for v in value)
+        if not isinstance(value, np.ndarray) or value.dtype.hasobject:
+            return value
+
+        # Arrays which are already interned are found by identity. Any other array is hashed, and not kept if it is a
+        # duplicate, so the Fitter only ever holds one copy of each array.
+        if self.interned_ids.get(id(value)) is value:
+            return value
+        digest = hashlib.sha1(np.ascontiguousarray(value)).hexdigest()
+        key = (value.shape, value.dtype.str, type(value), digest)
+        interned = self.interned.get(key)
+        if interned is None:
+            interned = self.interned[key] = value
+            self.interned_ids[id(value)] = value
+            nbytes[0] += value.nbytes
+        return interned
+
+    def get_memory_footprint(self):
+        """Returns the memory used by the arrays in the data of the model-dataset pairs
+
+        Returns
+        -------
+        footprint : dict
+            Containing 'total', the bytes used by all the unique arrays, and 'per_pair', the bytes of new arrays added by
+            each pair, such that the first pair accounts for the shared window functions and covariances.
+        """
+        return {"total": sum([v.nbytes for v in self.interned.values()]), "per_pair": list(self.pair_nbytes)}
 
     def set_num_concurrent(self, num_concurrent=None):
         """Set the number of jobs allowed to run in the job array at once.
@@ -125,6 +179,44 @@ class Fitter(object):
         walker_index = index % self.num_walkers
         return model_index, walker_index
 
+    def set_profiling(self, profile=True):
+        """Turns on profiling of the likelihood pipeline during each fit.
+
+        When on, the time spent in each stage of the posterior (model computation, window function convolution,
+        pk2xi transforms, chi2 and marginalisation) and the model cache hit rates are logged at the end of each fit,
+        and saved to a json file next to the chain. Off by default, as it adds a small overhead to every posterior call.
+
+        Parameters
+        ----------
+        profile : bool, optional
+            Whether to profile the fits. Defaults to True.
+        """
+        self.profile = profile
+
+        return self
+
+    def set_local_executor(self, enabled=True, num_processes=None, threads_per_process=1):
+        """Runs every fit locally across a pool of processes, instead of just the first one.
+
+        When running locally (or when the config `hpc_submit_command` is `local`), calling `fit` will then schedule all
+        `get_num_jobs()` fits over the pool, skipping any which have already finished. Each
+        fit runs through the same `_run_fit` as a job on the HPC, in a fresh process.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            Whether to use the local executor. Defaults to True.
+        num_processes : int, optional
+            The number of fits to run at once. Defaults to the number of cores divided by `threads_per_process`.
+        threads_per_process : int, optional
+            The number of BLAS/OpenMP threads each fit may use. Defaults to 1, to avoid oversubscribing the cores.
+        """
+        self.local_executor = enabled
+        self.num_processes = num_processes
+        self.threads_per_process = threads_per_process
+
+        return self
+
     def set_sampler(self, sampler):
         """Sets the sampler
 
@@ -154,15 +246,86 @@ class Fitter(object):
         data = self.model_datasets[model_index][1]
 
         model.set_data(data)
-        uid = f"chain_{model_index}_{walker_index}"
+        uid = self._get_uid(model_index, walker_index)
 
         sampler = self.get_sampler()
 
         self.logger.info("Running fitting job, saving to %s" % self.temp_dir)
         self.logger.info(f"\tModel is {model}")
         self.logger.info(f"\tData is {' '.join([d['name'] for d in self.model_datasets[model_index][1]])}")
-        sampler.fit(model.get_posterior, model.get_start, model.get_num_dim(), model.unscale, uid=uid, save_dims=self.save_dims)
+        # Samplers that evaluate the whole ensemble at once can use the batched posterior
+        log_posterior = model.get_posterior_batch if getattr(sampler, "vectorize", False) else model.get_posterior
+        if self.profile:
+            PROFILER.reset()
+            PROFILER.enable()
+        try:
+            result = sampler.fit(log_posterior, model.get_start, model.get_num_dim(), model.unscale, uid=uid, save_dims=self.save_dims)
+        finally:
+            PROFILER.disable()
         self.logger.info("Finished sampling")
+        summary = sampler.load_summary(uid)
+        if summary is not None:
+            sampler.write_summary(uid, self._add_model_summary(summary, model, result, chi2=True))
+
+        if self.profile:
+            report = PROFILER.get_report(model)
+            PROFILER.log_report(report)
+            filename = os.path.join(self.temp_dir, f"{uid}_profile.json")
+            PROFILER.save_report(report, filename)
+            self.logger.info(f"Saved profile to {filename}")
+
+    def _get_uid(self, model_index, walker_index):
+        return f"chain_{model_index}_{walker_index}"
+
+    def _fit_complete(self, index):
+        """Whether a fit has finished. Samplers write chain files while running (so they can resume), but only write the
+        summary once the fit is done."""
+        uid = self._get_uid(*self._get_indexes_from_index(index))
+        return os.path.exists(self.get_sampler().get_summary_filename(uid))
+
+    def run_local(self, indexes=None):
+        """Runs fits over a local pool of processes, as configured by `set_local_executor`.
+
+        Parameters
+        ----------
+        indexes : list[int], optional
+            The job indexes to run. Defaults to all of them. Those which have already finished are skipped, and those which
+            were interrupted are resumed if their sampler supports it.
+
+        Returns
+        -------
+        failed : list[int]
+            The indexes of any fits that raised an exception. Their tracebacks are logged.
+        """
+        import multiprocessing
+
+        if indexes is None:
+            indexes = range(self.get_num_jobs())
+        todo = [i for i in indexes if not self._fit_complete(i)]
+        if len(todo) < len(indexes):
+            self.logger.info(f"Skipping {len(indexes) - len(todo)} fits which have already finished")
+        if not todo:
+            return []
+
+        num_processes = self.num_processes or max(1, (os.cpu_count() or 1) // self.threads_per_process)
+        num_processes = min(num_processes, len(todo))
+        self.logger.info(f"Running {len(todo)} fits over {num_processes} processes with {self.threads_per_process} threads each")
+
+        # Fork where we can, so the workers inherit the models and data rather than pickling them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        start, failed = time.time(), []
+        initargs = (self, self.threads_per_process)
+        with context.Pool(num_processes, initializer=_init_local_worker, initargs=initargs, maxtasksperchild=1) as pool:
+            for i, (index, error) in enumerate(pool.imap_unordered(_run_local_fit, todo)):
+                elapsed = time.time() - start
+                remaining = elapsed / (i + 1) * (len(todo) - i - 1)
+                if error is None:
+                    self.logger.info(f"Finished fit {index} ({i + 1}/{len(todo)}), {elapsed:0.0f}s elapsed, ~{remaining:0.0f}s remaining")
+                else:
+                    failed.append(index)
+                    self.logger.error(f"Fit {index} ({i + 1}/{len(todo)}) failed:\n{error}")
+        return sorted(failed)
 
     def is_local(self):
         return shutil.which(get_config()["hpc_determining_command"]) is None
@@ -184,7 +347,9 @@ class Fitter(object):
         num_models = len(self.model_datasets)
         self.logger.info(f"With {num_models} models+datasets and {self.num_walkers} walkers, " f"have {num_jobs} jobs")
 
-        if self.is_local() or self.is_interactive():
+        if (self.is_local() or self.is_interactive()) and self.local_executor:
+            self.run_local()
+        elif self.is_local() or self.is_interactive():
             mi, wi = self._get_indexes_from_index(index)
             self.logger.info("Running model_dataset %d, walker number %d" % (mi, wi))
             self._run_fit(mi, wi)
@@ -199,9 +364,14 @@ class Fitter(object):
                 filename = write_jobscript_slurm(
                     file, name=os.path.basename(file), num_tasks=self.get_num_jobs(), num_concurrent=num_concurrent, delete=False, hpc=hpc
                 )
-                self.logger.info("Running batch job at %s" % filename)
                 config = get_config()
-                os.system(f"{config['hpc_submit_command']} {filename}")
+                if config["hpc_submit_command"] == "local":
+                    # Stand-in for the submission, running the job array over local processes
+                    self.logger.info(f"Running the jobs in {filename} locally")
+                    self.run_local()
+                else:
+                    self.logger.info("Running batch job at %s" % filename)
+                    os.system(f"{config['hpc_submit_command']} {filename}")
             else:
                 # or if running a specific fit to a model+dataset pair
                 if sys.argv[1].isdigit():
@@ -234,6 +404,174 @@ class Fitter(object):
         result = np.hstack((posterior, weights, evidence, chain))
         return result
 
+    def _get_chain_files(self):
+        """Gets the chain files in the temp directory, as a dictionary of model index to a list of (walker index,
+        filename), both in increasing index order"""
+        files = {}
+        for f in os.listdir(self.temp_dir):
+            if f.endswith("chain.npy"):
+                mi, wi = int(f.split("_")[1]), int(f.split("_")[2])
+                files.setdefault(mi, []).append((wi, os.path.join(self.temp_dir, f)))
+        return {mi: sorted(files[mi]) for mi in sorted(files)}
+
+    def get_archive(self):
+        """Gets the `ChainArchive` of this fitter, which lives in the archive directory of temp_dir"""
+        return ChainArchive(os.path.join(self.temp_dir, "archive"))
+
+    def build_archive(self, num_processes=None):
+        """Consolidates the chain files of each fit into a memory-mapped archive, which `load` then reads from.
+
+        Only models whose chain files have changed since the archive was last built are ingested, so this can be
+        called again as more fits finish. The chain files are left in place.
+
+        Parameters
+        ----------
+        num_processes : int, optional
+            The number of processes to read the chain files with. Defaults to the number of CPUs.
+
+        Returns
+        -------
+        archive : `ChainArchive`
+            The updated archive
+        """
+        import multiprocessing
+
+        archive = self.get_archive()
+        todo = {}
+        for mi, walkers in self._get_chain_files().items():
+            sources = archive.get_sources([f for _, f in walkers])
+            if not archive.is_current(mi, sources):
+                todo[mi] = (walkers, sources)
+        if not todo:
+            self.logger.info(f"Chain archive in {archive.directory} is up to date")
+            return archive
+
+        start = time.time()
+        filenames = [f for walkers, _ in todo.values() for _, f in walkers]
+        num_processes = min(num_processes or os.cpu_count() or 1, len(filenames))
+        self.logger.info(f"Archiving {len(filenames)} chain files for {len(todo)} models over {num_processes} processes")
+        if num_processes == 1:
+            chains = map(self._load_file, filenames)
+            self._write_archive(archive, todo, chains)
+        else:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            with context.Pool(num_processes, initializer=_init_archive_worker, initargs=(self,)) as pool:
+                self._write_archive(archive, todo, pool.imap(_load_archive_file, filenames))
+        self.logger.info(f"Archived {len(filenames)} chain files in {time.time() - start:0.1f}s")
+        return archive
+
+    def _write_archive(self, archive, todo, chains):
+        for mi, (walkers, sources) in todo.items():
+            archive.write(mi, [(wi, next(chains)) for wi, _ in walkers], sources)
+
+    def iload(self, split_models=True, split_walkers=False, mmap=True):
+        """Lazily load the chains and fitting results, one fit at a time.
+
+        Takes the same arguments and yields the same elements as `load`. Models in the chain archive built by
+        `build_archive` are read from it (if their chain files haven't changed since), others from their chain files.
+
+        Parameters
+        ----------
+        mmap : bool, optional
+            Whether to memory-map chains from the archive, rather than read them into memory. Memory-mapped chains are
+            copy on write, so modifying them does not change the archive.
+        """
+        archive = self.get_archive()
+        key, group, model = None, [], None
+        for mi, walkers in self._get_chain_files().items():
+            if archive.exists() and archive.is_current(mi, archive.get_sources([f for _, f in walkers])):
+                chains = archive.read(mi, mmap=mmap, split_walkers=split_walkers)
+            else:
+                chains = [(wi, self._load_file(f)) for wi, f in walkers]
+            for wi, c in chains:
+                k = (mi if split_models else None, wi if split_walkers else None)
+                if group and k != key:
+                    yield self._get_fit(group, model)
+                    group = []
+                key, model = k, self.model_datasets[mi]
+                group.append(c)
+        if group:
+            yield self._get_fit(group, model)
+
+    def _get_fit(self, chains, model):
+        result = chains[0] if len(chains) == 1 else np.concatenate(chains)
+        posterior = result[:, 0]
+        weight = result[:, 1]
+        evidence = result[:, 2]
+        chain = result[:, 3:]
+        return posterior, weight, chain, evidence, model[0], model[1], model[2]
+
+    def _add_model_summary(self, summary, model, result, chi2=False):
+        """Adds the parts of a fit summary which need the model: the parameter 'names', the 'chi2' (minus twice the log
+        likelihood) at the maximum posterior point if chi2 is set, and the weighted 'mean', 'std' and maximum posterior
+        value 'max' of the 'derived' alpha_par and alpha_perp"""
+        names = model.get_names()[: len(summary["mean"])]
+        summary["names"] = names
+        summary.setdefault("chi2", None)
+        best = summary["max_posterior"]
+        if chi2 and best is not None and len(best) == model.get_num_dim():
+            ps = model.get_param_dict(best)
+            summary["chi2"] = float(-2.0 * np.sum([model.get_likelihood(ps, d) for d in model.data]))
+
+        if "alpha" in names:
+            chain = np.atleast_2d(result["chain"])
+            weights = result.get("weights")
+            weights = np.ones(chain.shape[0]) if weights is None else np.ravel(weights)
+            alpha = chain[:, names.index("alpha")]
+            alpha_par, alpha_perp = alpha, alpha
+            if not model.isotropic and "epsilon" in names:
+                alpha_par, alpha_perp = model.get_alphas(alpha, chain[:, names.index("epsilon")])
+            i = np.argmax(np.ravel(result["posterior"])) if result.get("posterior") is not None else None
+            summary["derived"] = {}
+            for name, values in [("alpha_par", alpha_par), ("alpha_perp", alpha_perp)]:
+                mean, std = weighted_avg_and_std(values, weights=weights)
+                summary["derived"][name] = {"mean": float(mean), "std": float(std), "max": None if i is None else float(values[i])}
+        return summary
+
+    def load_summaries(self, split_walkers=False, compute_missing=True):
+        """Load the summaries each sampler writes at the end of a fit, which is much faster than loading the chains.
+
+        Parameters
+        ----------
+        split_walkers : bool, optional
+            Return the summary of each walker, rather than combining the walkers of each model. Defaults to `False`
+        compute_missing : bool, optional
+            Computes (and saves) the summaries of fits which don't have one, such as those run before summaries were
+            written, from their chains. They have no chi2 or evaluation count. If `False`, these fits are skipped.
+
+        Returns
+        -------
+            summaries : list
+                A list of each model+dataset pair (or each walker, if `split_walkers` is set), each containing, in order:
+                    - the summary dictionary, as described in `Sampler.get_summary` and `_add_model_summary`
+                    - the model
+                    - the dataset
+                    - dict containing any `extra` information passed in.
+        """
+        sampler = self.get_sampler()
+        results = []
+        for mi, walkers in self._get_chain_files().items():
+            model, data, extra = self.model_datasets[mi]
+            summaries = []
+            for wi, filename in walkers:
+                uid = self._get_uid(mi, wi)
+                summary = sampler.load_summary(uid)
+                if summary is None or "names" not in summary:
+                    if not compute_missing:
+                        continue
+                    posterior, weight, chain, evidence = self._get_fit([self._load_file(filename)], self.model_datasets[mi])[:4]
+                    result = {"chain": chain, "weights": weight, "posterior": posterior, "evidence": evidence}
+                    summary = self._add_model_summary(summary or sampler.get_summary(result), model, result)
+                    sampler.write_summary(uid, summary)
+                summaries.append(summary)
+            if split_walkers:
+                results += [(s, model, data, extra) for s in summaries]
+            elif summaries:
+                results.append((sampler.combine_summaries(summaries), model, data, extra))
+        self.logger.info(f"Loaded {len(results)} summaries")
+        return results
+
     def load(self, split_models=True, split_walkers=False):
         """Load in all the chains and fitting results
 
@@ -253,50 +591,49 @@ class Fitter(object):
                     - log_posterior[steps]
                     - weights[steps] (not log)
                     - chain[steps:dimensions]
+                    - evidence[steps]
                     - the model
                     - the dataset
                     - dict containing any `extra` information passed in.
         """
         self.logger.info("Loading chains")
-        files = [f for f in os.listdir(self.temp_dir) if f.endswith("chain.npy")]
-        files.sort(key=lambda s: [int(s.split("_")[1]), int(s.split("_")[2])])
-        filenames = [self.temp_dir + "/" + f for f in files]
-        model_indexes = [int(f.split("_")[1]) for f in files]
-        walker_indexes = [int(f.split("_")[2]) for f in files]
-        chains = [self._load_file(f) for f in filenames]
-
-        results = []
-        results_models = []
-        prev_model, prev_walkers = 0, 0
-        stacked = None
-
-        to_sort = np.array(model_indexes) + 0.0001 * np.array(walker_indexes)
-        sorted_indexes = np.argsort(to_sort)
-
-        for index in sorted_indexes:
-            c, mi, wi = chains[index], model_indexes[index], walker_indexes[index]
-            if (prev_walkers != wi and split_walkers) or (prev_model != mi and split_models):
-                if stacked is not None:
-                    results.append(stacked)
-                    results_models.append(self.model_datasets[prev_model])
-                stacked = None
-                prev_model = mi
-                prev_walkers = wi
-            if stacked is None:
-                stacked = c
-            else:
-                stacked = np.vstack((stacked, c))
-        results_models.append(self.model_datasets[mi])
-        results.append(stacked)
-
-        finals = []
-        for result, model in zip(results, results_models):
-            posterior = result[:, 0]
-            weight = result[:, 1]
-            evidence = result[:, 2]
-            chain = result[:, 3:]
-            finals.append((posterior, weight, chain, evidence, model[0], model[1], model[2]))
+        finals = list(self.iload(split_models=split_models, split_walkers=split_walkers))
         self.logger.info(f"Loaded {len(finals)} chains")
         if len(finals) == 1:
             self.logger.info(f"Chain has shape {finals[0][2].shape}")
         return finals
+
+
+_local_fitter = None
+
+
+def _init_local_worker(fitter, threads):
+    """Sets up a worker process of `Fitter.run_local`, limiting its BLAS/OpenMP threads"""
+    global _local_fitter
+    _local_fitter = fitter
+    for var in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]:
+        os.environ[var] = str(threads)
+    try:
+        # The environment only affects libraries loaded after this point, so also limit any already loaded
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(threads)
+    except ImportError:
+        logging.getLogger("barry").debug("threadpoolctl not installed, only limiting threads through the environment")
+
+
+def _init_archive_worker(fitter):
+    global _local_fitter
+    _local_fitter = fitter
+
+
+def _load_archive_file(filename):
+    return _local_fitter._load_file(filename)
+
+
+def _run_local_fit(index):
+    try:
+        _local_fitter._run_fit(*_local_fitter._get_indexes_from_index(index))
+        return index, None
+    except Exception:
+        return index, traceback.format_exc()
@@ -8,6 +8,7 @@ sys.path.insert(0, os.path.abspath(".."))
 from barry.models import Model
 from barry.config import is_local, get_config
 from barry.cosmology.camb_generator import CambGenerator
+from barry.cosmology.power_spectrum_smoothing import get_smooth_methods_dict
 from barry.datasets.dataset import Dataset
 from tests.utils import get_concrete
 from barry.utils import get_hpc
@@ -68,6 +69,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", "--refresh", action="store_true", default=False)
     parser.add_argument("--desi", action="store_true", default=False)
+    parser.add_argument("-p", "--processes", type=int, default=None, help="Processes to generate CAMB grids with, defaults to one per CPU")
     args = parser.parse_args()
 
     base_names = [c for c in get_concrete(Dataset) if "DESI" not in c.__name__ or args.desi]
@@ -99,7 +101,9 @@ if __name__ == "__main__":
         logging.info(f"Ensuring cosmology {c} is generated")
         mnu = c.get("mnu", 0.0)
         generator = CambGenerator(om_resolution=101, h0_resolution=1, h0=c["h0"], ob=c["ob"], ns=c["ns"], redshift=c["z"], mnu=mnu)
-        generator.load_data(can_generate=True)
+        generator.load_data(can_generate=True, num_processes=args.processes)
+        for method in get_smooth_methods_dict():
+            generator.load_smoothed_data({"method": method})
 
     # This part should be run on a HPC for the PTGenerator side of things.
     assert not is_local(), "CAMB has been generated, but please upload and run again on your HPC system"
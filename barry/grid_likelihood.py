@@ -0,0 +1,194 @@
+import logging
+import time
+
+import numpy as np
+from scipy.special import logsumexp
+
+from barry.models.bao_power import PowerSpectrumFit
+
+
+class MockEnsembleGrid:
+    """Computes the posterior of every realisation of a mock ensemble on a grid of the active parameters at once.
+
+    With analytic marginalisation the model only depends on the active parameters (such as alpha and epsilon), so the
+    model and marginalisation templates are evaluated once per grid point, and the marginalised chi2 of all the mocks
+    is a handful of matrix products against the stacked (num_mocks, num_data) data vectors. This replaces one sampler
+    job per realisation with a single vectorised pass, giving per-mock posterior summaries on the grid.
+
+    Parameters
+    ----------
+    model : `barry.models.Model`
+        The model to fit, which must use analytic marginalisation ("full" or "partial")
+    dataset : `barry.datasets.Dataset`
+        The dataset with the mock realisations to fit
+    num_points : int, dict, optional
+        The number of grid points for every active parameter, or a dictionary of parameter name to the number of points
+    ranges : dict, optional
+        A dictionary of parameter name to the (min, max) of its grid. Defaults to the parameter's prior range.
+    chunk_size : int, optional
+        The number of grid points to evaluate together, which sets the memory used
+    max_size : int, optional
+        The largest number of grid points allowed. The grid grows as num_points to the power of the number of active
+        parameters, so fix the parameters you don't need (or use fewer points) to stay below it.
+    """
+
+    def __init__(self, model, dataset, num_points=41, ranges=None, chunk_size=64, max_size=100000):
+        self.logger = logging.getLogger("barry")
+        if not model.marg:
+            raise ValueError("The mock ensemble grid requires analytic marginalisation of the bias and polynomial terms")
+        if model.postprocess is not None:
+            raise NotImplementedError("Postprocessing is not supported by the batched models used for the mock ensemble grid")
+        self.model = model
+        self.dataset = dataset
+        self.chunk_size = chunk_size
+        self.key = "pk" if isinstance(model, PowerSpectrumFit) else "xi"
+
+        # The models are always convolved explicitly, so the compressed window (which depends on the data) isn't used
+        self.data = [{**d, "icov_m_w": [None] * len(d["icov_m_w"])} if "icov_m_w" in d else d for d in dataset.get_data()]
+        model.set_data(self.data)
+
+        ranges = ranges or {}
+        self.names = model.get_names()
+        self.axes = []
+        for name in self.names:
+            n = num_points.get(name, 41) if isinstance(num_points, dict) else num_points
+            low, high = ranges.get(name, (model.param_dict[name].min, model.param_dict[name].max))
+            self.axes.append(np.linspace(low, high, n))
+        self.shape = tuple(len(a) for a in self.axes)
+        self.size = int(np.prod(self.shape, dtype=float))
+        if self.size > max_size:
+            raise ValueError(
+                f"The grid over {self.names} would have {self.size} points, more than max_size={max_size}. "
+                f"Fix the parameters you don't need with model.set_fix_params, or use fewer points."
+            )
+        self.log_prior = np.concatenate([model.get_prior_batch(self.get_points(c)) for c in self.get_chunks()])
+
+    def get_chunks(self):
+        """The slices of grid point indexes to evaluate together"""
+        return [slice(start, min(start + self.chunk_size, self.size)) for start in range(0, self.size, self.chunk_size)]
+
+    def get_points(self, indexes):
+        """Gets the parameter values of the grid points with the given flat indexes (or slice), with shape (num, num_params)"""
+        if isinstance(indexes, slice):
+            indexes = np.arange(*indexes.indices(self.size))
+        return np.stack([a[i] for a, i in zip(self.axes, np.unravel_index(indexes, self.shape))], axis=-1)
+
+    def get_mock_data(self, realisations=None):
+        """Gets the stacked data vectors of the realisations, one array of shape (num_mocks, num_data) per data dictionary
+
+        Parameters
+        ----------
+        realisations : list[int], optional
+            The mock realisations to use. Defaults to all of them.
+        """
+        if realisations is None:
+            realisations = range(len(self.dataset.mock_data))
+        original = self.dataset.realisation
+        try:
+            mocks = []
+            for i in realisations:
+                self.dataset.set_realisation(i)
+                mocks.append([d[self.key] for d in self.dataset.get_data()])
+        finally:
+            self.dataset.set_realisation(original)
+        return [np.array(m) for m in zip(*mocks)]
+
+    def get_log_likelihood(self, mocks):
+        """Computes the log likelihood of every mock at every grid point
+
+        Parameters
+        ----------
+        mocks : list[np.ndarray]
+            The stacked data vectors for each data dictionary, from `get_mock_data`
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The log likelihood, with shape (num_grid_points, num_mocks)
+        """
+        log_likelihood = np.zeros((self.size, len(mocks[0])))
+        for d, data in zip(self.data, mocks):
+            icov = d["icov"]
+            F00 = np.sum((data @ icov) * data, axis=-1)
+            for chunk in self.get_chunks():
+                ps = self.model.get_param_dict(self.get_points(chunk))
+                model, marg_model = self.model.get_model_vectors_batch(ps, d)
+                log_likelihood[chunk] += self._get_marg_log_likelihood(model, marg_model, data, F00, icov, d)
+        return log_likelihood
+
+    def _get_marg_log_likelihood(self, model, marg_model, data, F00, icov, d):
+        """The analytically marginalised likelihood of all the mocks for a chunk of models, the same as
+        `Model.get_chi2_marg_likelihood_batch` (or the partial version) but with the data expanded out of the products"""
+        model_icov = model @ icov
+        marg_icov = marg_model @ icov
+        F02 = F00[None, :] - 2.0 * model_icov @ data.T + np.sum(model_icov * model, axis=-1)[:, None]
+        F11 = marg_icov @ data.T - np.einsum("gmi,gi->gm", marg_icov, model)[..., None]
+        F2 = marg_icov @ np.swapaxes(marg_model, -1, -2)
+
+        chi2 = np.full(F02.shape, np.inf)
+        logdet = np.zeros(len(F2))
+        for i in range(len(F2)):
+            try:
+                L = np.linalg.cholesky(F2[i])
+            except np.linalg.LinAlgError:
+                continue
+            z = np.linalg.solve(L, F11[i])
+            chi2[i] = F02[i] - np.sum(z**2, axis=0)
+            logdet[i] = 2.0 * np.sum(np.log(np.diag(L)))
+
+        num_mocks, num_data = d["num_mocks"], len(d[self.key])
+        if self.model.marg_type == "partial":
+            return self.model.get_corrected_likelihood(chi2, num_mocks=num_mocks, num_data=num_data)
+        return self.model.get_corrected_marg_likelihood(chi2, logdet[:, None], F2.shape[-1], num_mocks=num_mocks, num_data=num_data)
+
+    def run(self, realisations=None):
+        """Computes the grid posterior of each mock realisation and summarises it
+
+        Parameters
+        ----------
+        realisations : list[int], optional
+            The mock realisations to fit. Defaults to all of them.
+
+        Returns
+        -------
+        results : dict
+            Containing the parameter 'names', the grid 'axes', the 'realisations', and for each mock (along the first axis)
+            the posterior 'mean' and 'std' of each parameter, the maximum posterior grid point 'max_posterior' and its
+            log posterior 'max_log_posterior', the 'log_evidence' of the grid and the 1D 'marginals' of each parameter
+            on its grid axis.
+        """
+        start = time.time()
+        if realisations is None:
+            realisations = range(len(self.dataset.mock_data))
+        realisations = list(realisations)
+        mocks = self.get_mock_data(realisations)
+        log_posterior = self.get_log_likelihood(mocks) + self.log_prior[:, None]
+
+        weights = np.exp(log_posterior - np.max(log_posterior, axis=0))
+        weights /= np.sum(weights, axis=0)
+        mean, mean_sq = np.zeros((len(realisations), len(self.names))), np.zeros((len(realisations), len(self.names)))
+        for chunk in self.get_chunks():
+            points = self.get_points(chunk)
+            mean += weights[chunk].T @ points
+            mean_sq += weights[chunk].T @ points**2
+        std = np.sqrt(np.maximum(mean_sq - mean**2, 0.0))
+        best = np.argmax(log_posterior, axis=0)
+
+        weights = weights.reshape(self.shape + (len(realisations),))
+        marginals = []
+        for i in range(len(self.names)):
+            marginals.append(np.sum(weights, axis=tuple(j for j in range(len(self.names)) if j != i)).T)
+        cell = np.prod([a[1] - a[0] if len(a) > 1 else 1.0 for a in self.axes])
+
+        self.logger.info(f"Fit {len(realisations)} mocks on a grid of {self.size} points in {time.time() - start:0.1f}s")
+        return {
+            "names": self.names,
+            "axes": self.axes,
+            "realisations": np.array(realisations),
+            "mean": mean,
+            "std": std,
+            "max_posterior": self.get_points(best),
+            "max_log_posterior": log_posterior[best, np.arange(len(realisations))],
+            "log_evidence": logsumexp(log_posterior, axis=0) + np.log(cell),
+            "marginals": marginals,
+        }
@@ -5,10 +5,10 @@ from barry.cosmology.pk2xi import PowerToCorrelationFFTLog, PowerToCorrelationGa
 from barry.cosmology.power_spectrum_smoothing import validate_smooth_method, smooth_func
 from barry.models.model import Model, Omega_m_z, Correction
 from barry.models.bao_power import PowerSpectrumFit
+from barry.profiling import profile
 from scipy.interpolate import splev, splrep
-from scipy.integrate import simps
 
-from barry.utils import break_vector_and_get_blocks
+from barry.utils import break_vector_and_get_blocks, get_mu_quadrature, splev_batch
 
 
 class CorrelationFunctionFit(Model):
@@ -27,6 +27,7 @@ class CorrelationFunctionFit(Model):
         marg=None,
         includeb2=True,
         n_poly=3,
+        mu_quadrature=None,
     ):
 
         """Generic correlation function model
@@ -43,6 +44,9 @@ class CorrelationFunctionFit(Model):
         smooth : bool, optional
             Whether to generate a smooth model without the BAO feature. Defaults to `false`.
         correction : `Correction` enum. Defaults to `Correction.SELLENTIN
+        mu_quadrature : dict, optional
+            The method and number of nodes used to integrate over mu, passed to `get_mu_quadrature`.
+            Defaults to `{"method": "simpson", "nmu": 100}`
         """
         super().__init__(name, correction=correction, isotropic=isotropic, marg=marg)
         self.parent = PowerSpectrumFit(
@@ -53,6 +57,7 @@ class CorrelationFunctionFit(Model):
             isotropic=isotropic,
             marg=marg,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
         if smooth_type is None:
             self.smooth_type = {"method": "hinton2017"}
@@ -76,11 +81,18 @@ class CorrelationFunctionFit(Model):
         # Set up data structures for model fitting
         self.smooth = smooth
 
-        self.nmu = 100
-        self.mu = np.linspace(0.0, 1.0, self.nmu)
+        if mu_quadrature is None:
+            mu_quadrature = {"method": "simpson", "nmu": 100}
+        self.mu_quadrature = mu_quadrature
+        self.mu, mu_weights = get_mu_quadrature(**self.mu_quadrature)
+        self.nmu = len(self.mu)
+
+        # Weights to compute the mu, 3mu^2 and 35mu^4 moments of a 2D correlation function with a single matrix product
+        self.mu_weights = mu_weights[:, None] * np.array([np.ones(self.nmu), 3.0 * self.mu**2, 35.0 * self.mu**4]).T
         self.pk2xi_0 = None
         self.pk2xi_2 = None
         self.pk2xi_4 = None
+        self.pk2xi = None
 
         self.fixed_xi = False
         self.store_xi = [None, None, None]
@@ -131,9 +143,17 @@ class CorrelationFunctionFit(Model):
         self.pk2xi_0 = PowerToCorrelationSphericalBessel(qs=cambpk["ks"], ell=0)
         self.pk2xi_2 = PowerToCorrelationSphericalBessel(qs=cambpk["ks"], ell=2)
         self.pk2xi_4 = PowerToCorrelationSphericalBessel(qs=cambpk["ks"], ell=4)
+        # Transforms all three multipoles at once, the kernels for each order match those of the separate transforms
+        self.pk2xi = PowerToCorrelationSphericalBessel(qs=cambpk["ks"], ell=4)
         self.set_bias(data[0])
         self.parent.set_data(data, parent=True)
 
+    def get_xi_multipole_splines(self, ks, pks, finedist):
+        """Transforms the monopole, quadrupole and hexadecapole of the power spectrum to the correlation function on the
+        fixed grid finedist in a single batched transform, and returns the spline representation of each."""
+        xis = self.pk2xi.transform(ks, np.array([pks[0], pks[2], pks[4]]), finedist, [0, 2, 4])
+        return [splrep(finedist, xi) for xi in xis]
+
     def set_bias(self, data, sval=50.0, width=0.3):
         """Sets the bias default value by comparing the data monopole and linear model
 
@@ -170,6 +190,11 @@ class CorrelationFunctionFit(Model):
                 beta = self.get_default("beta")
                 self.logger.info(f"Using default RSD parameter of beta={beta:0.5f}")
 
+    def get_cache_info(self):
+        caches = super().get_cache_info()
+        caches.update({f"parent.{k}": v for k, v in self.parent.get_cache_info().items()})
+        return caches
+
     def declare_parameters(self):
         """Defines model parameters, their bounds and default value."""
         self.add_param("om", r"$\Omega_m$", 0.1, 0.5, 0.31)  # Cosmology
@@ -216,18 +241,42 @@ class CorrelationFunctionFit(Model):
         muprime = self.mu / np.sqrt(musq + (1.0 - musq) / (1.0 + epsilon) ** 6)
         return muprime
 
-    def integrate_mu(self, xi2d, mu=None, isotropic=False):
-        if mu is None:
-            mu = self.mu
-        xi0 = simps(xi2d, self.mu, axis=1)
+    def get_dilation_batch(self, dist, alpha, epsilon):
+        """Computes the dilated s and mu values for many values of alpha and epsilon at once, the batched equivalent of
+        `get_sprimefac` and `get_muprime`
+
+        Parameters
+        ----------
+        dist : np.ndarray
+            The undilated distances
+        alpha : np.ndarray
+            The isotropic dilation of each model
+        epsilon : np.ndarray
+            The anisotropic warping of each model
+
+        Returns
+        -------
+        sprime : np.ndarray
+            The dilated distances, with shape (len(alpha), len(dist), nmu)
+        muprime : np.ndarray
+            The dilated mu values, with shape (len(alpha), 1, nmu)
+        """
+        musq = self.mu**2
+        epsilonsq = (1.0 + np.asarray(epsilon, dtype=float)[:, None, None]) ** 2
+        sprimefac = np.sqrt(musq * epsilonsq**2 + (1.0 - musq) / epsilonsq)
+        sprime = dist[None, :, None] * np.asarray(alpha, dtype=float)[:, None, None] * sprimefac
+        muprime = self.mu / np.sqrt(musq + (1.0 - musq) / epsilonsq**3)
+        return sprime, muprime
+
+    def integrate_mu(self, xi2d, isotropic=False):
+        """Projects the 2D correlation function, with mu along the last axis, onto the monopole, quadrupole and
+        hexadecapole. Any leading axes (such as a batch of models) are kept."""
         if isotropic:
-            xi2 = None
-            xi4 = None
-        else:
-            xi2 = 3.0 * simps(xi2d * mu**2, self.mu, axis=1)
-            xi4 = 35.0 * simps(xi2d * mu**4, self.mu, axis=1)
-        return xi0, xi2, xi4
+            return xi2d @ self.mu_weights[:, 0], None, None
+        xi = xi2d @ self.mu_weights
+        return xi[..., 0], xi[..., 1], xi[..., 2]
 
+    @profile("compute_basic_correlation_function")
     def compute_basic_correlation_function(self, dist, p, smooth=False):
         """Computes the basic correlation function computes usig the parent Power spectrum class
 
@@ -290,24 +339,18 @@ class CorrelationFunctionFit(Model):
             if self.fixed_xi:
                 if smooth:
                     if self.store_xi_smooth[0] is None:
-                        pk2xi0 = splrep(finedist, self.pk2xi_0.__call__(ks, pks[0], finedist))
-                        pk2xi2 = splrep(finedist, self.pk2xi_2.__call__(ks, pks[2], finedist))
-                        pk2xi4 = splrep(finedist, self.pk2xi_4.__call__(ks, pks[4], finedist))
+                        pk2xi0, pk2xi2, pk2xi4 = self.get_xi_multipole_splines(ks, pks, finedist)
                         self.store_xi_smooth = [pk2xi0, pk2xi2, pk2xi4]
                     else:
                         pk2xi0, pk2xi2, pk2xi4 = self.store_xi_smooth
                 else:
                     if self.store_xi[0] is None:
-                        pk2xi0 = splrep(finedist, self.pk2xi_0.__call__(ks, pks[0], finedist))
-                        pk2xi2 = splrep(finedist, self.pk2xi_2.__call__(ks, pks[2], finedist))
-                        pk2xi4 = splrep(finedist, self.pk2xi_4.__call__(ks, pks[4], finedist))
+                        pk2xi0, pk2xi2, pk2xi4 = self.get_xi_multipole_splines(ks, pks, finedist)
                         self.store_xi = [pk2xi0, pk2xi2, pk2xi4]
                     else:
                         pk2xi0, pk2xi2, pk2xi4 = self.store_xi
             else:
-                pk2xi0 = splrep(finedist, self.pk2xi_0.__call__(ks, pks[0], finedist))
-                pk2xi2 = splrep(finedist, self.pk2xi_2.__call__(ks, pks[2], finedist))
-                pk2xi4 = splrep(finedist, self.pk2xi_4.__call__(ks, pks[4], finedist))
+                pk2xi0, pk2xi2, pk2xi4 = self.get_xi_multipole_splines(ks, pks, finedist)
 
             xi0 = splev(sprime, pk2xi0)
             xi2 = splev(sprime, pk2xi2)
@@ -316,10 +359,51 @@ class CorrelationFunctionFit(Model):
             xi2d = xi0 + 0.5 * (3.0 * muprime**2 - 1) * xi2 + 0.125 * (35.0 * muprime**4 - 30.0 * muprime**2 + 3.0) * xi4
 
             # Now compute the dilated xi multipoles
-            xi[0], xi[1], xi[2] = self.integrate_mu(xi2d, self.mu)
+            xi[0], xi[1], xi[2] = self.integrate_mu(xi2d)
 
         return sprime, xi
 
+    @profile("compute_basic_correlation_function_batch")
+    def compute_basic_correlation_function_batch(self, dist, ps, smooth=False):
+        """Batched version of `compute_basic_correlation_function`, with the power spectra, Hankel transforms, dilation and
+        Legendre projection of the anisotropic models evaluated over a leading batch axis
+
+        Parameters
+        ----------
+        dist : np.ndarray
+            Array of distances in the correlation function to compute
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        smooth : bool, optional
+            Whether or not to generate a smooth model without the BAO feature
+
+        Returns
+        -------
+        xi : np.ndarray
+            The model monopole, quadrupole and hexadecapole of each model, with shape (len(ps), 3, len(dist))
+        """
+        if self.isotropic:
+            return np.array([self.compute_basic_correlation_function(dist, p, smooth=smooth)[1] for p in ps])
+
+        sprime, muprime = self.get_dilation_batch(dist, [p["alpha"] for p in ps], [p["epsilon"] for p in ps])
+        if self.fixed_xi:
+            stored = self.store_xi_smooth if smooth else self.store_xi
+            if stored[0] is None:
+                self.compute_basic_correlation_function(dist, ps[0], smooth=smooth)
+                stored = self.store_xi_smooth if smooth else self.store_xi
+            xi0, xi2, xi4 = [splev(sprime, tck) for tck in stored]
+        else:
+            finedist = np.linspace(0.0, 300.0, 601)
+            ks = self.parent.camb.ks
+            _, pks, _ = self.parent.compute_power_spectrum_batch(ks, ps, smooth=smooth, for_corr=True)
+            xi0, xi2, xi4 = splev_batch(sprime, finedist, self.pk2xi.transform(ks, pks[:, [0, 2, 4]], finedist, [0, 2, 4]))
+
+        xi2d = xi0 + 0.5 * (3.0 * muprime**2 - 1) * xi2 + 0.125 * (35.0 * muprime**4 - 30.0 * muprime**2 + 3.0) * xi4
+
+        # Now compute the dilated xi multipoles
+        return np.stack(self.integrate_mu(xi2d), axis=1)
+
+    @profile("compute_correlation_function")
     def compute_correlation_function(self, dist, p, smooth=False):
         """Computes the correlation function model using the Beutler et. al., 2017 power spectrum
             and 3 bias parameters but no polynomial terms
@@ -348,6 +432,48 @@ class CorrelationFunctionFit(Model):
 
         return sprime, xi, poly
 
+    def compute_correlation_function_batch(self, dist, ps, smooth=False):
+        """Computes the correlation function model for many parameter locations at once
+
+        Parameters
+        ----------
+        dist : np.ndarray
+            Array of distances in the correlation function to compute
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        smooth : bool, optional
+            Whether or not to generate a smooth model without the BAO feature
+
+        Returns
+        -------
+        xi : np.ndarray
+            The model monopole, quadrupole and hexadecapole of each model, with shape (len(ps), 3, len(dist))
+        poly: np.ndarray
+            The additive terms in each model, necessary for analytical marginalisation, along the first axis.
+            'None' if not marginalising.
+        """
+        xi_comp = self.compute_basic_correlation_function_batch(dist, ps, smooth=smooth)
+        return self.add_poly_batch(dist, ps, xi_comp)
+
+    def get_xi_multipoles_batch(self, dist, ps, smooth=False):
+        """Computes the undilated correlation function multipoles of the parent power spectrum model (which does the
+        dilation itself) for many parameter locations at once, transforming them all in a single batched transform
+
+        Returns
+        -------
+        xi_comp : np.ndarray
+            The monopole, quadrupole and hexadecapole of each model, with shape (len(ps), 3, len(dist)). The quadrupole and
+            hexadecapole are zero for isotropic models.
+        """
+        ks = self.parent.camb.ks
+        _, pks, _ = self.parent.compute_power_spectrum_batch(ks, ps, smooth=smooth, nopoly=True)
+        xi_comp = np.zeros((len(ps), 3, len(dist)))
+        if self.isotropic:
+            xi_comp[:, :1] = self.pk2xi.transform(ks, pks[:, :1], dist, [0])
+        else:
+            xi_comp[:] = self.pk2xi.transform(ks, pks[:, [0, 2, 4]], dist, [0, 2, 4])
+        return xi_comp
+
     def add_poly(self, dist, p, xi_comp):
         """Converts the xi components to a full model but with 3 polynomial terms for each multipole
 
@@ -399,6 +525,26 @@ class CorrelationFunctionFit(Model):
 
         return xi, poly
 
+    def add_poly_batch(self, dist, ps, xi_comp):
+        """Batched version of `add_poly`, with the models along the first axis of xi_comp and of the returned xi and poly.
+        'None' is returned for poly if not marginalising."""
+        if self.isotropic:
+            models = [self.add_poly(dist, p, xi) for p, xi in zip(ps, xi_comp)]
+            return np.array([m[0] for m in models]), np.array([m[1] for m in models]) if self.marg else None
+
+        xi = np.array(xi_comp)
+        polyvec = np.array([1.0 / dist ** (ip - 1) for ip in range(self.n_poly)])
+        if self.marg:
+            poly = np.zeros((self.n_poly * len(self.poly_poles), 3, len(dist)))
+            for npole, pole in enumerate(self.poly_poles):
+                poly[self.n_poly * npole : self.n_poly * (npole + 1), npole] = polyvec
+            return xi, np.broadcast_to(poly, (len(ps),) + poly.shape)
+
+        for pole in self.poly_poles:
+            coefficients = np.array([[p[f"a{{{pole}}}_{{{ip+1}}}_{1}"] for ip in range(self.n_poly)] for p in ps])
+            xi[:, int(pole / 2)] += coefficients @ polyvec
+        return xi, None
+
     def add_three_poly(self, dist, p, xi_comp):
         """Converts the xi components to a full model but with 3 polynomial terms for each multipole
 
@@ -485,6 +631,7 @@ class CorrelationFunctionFit(Model):
 
         return xi, poly
 
+    @profile("get_model")
     def get_model(self, p, d, smooth=False):
         """Gets the model prediction using the data passed in and parameter location specified
 
@@ -553,7 +700,7 @@ class CorrelationFunctionFit(Model):
         num_mocks = d["num_mocks"]
         num_data = len(d["xi"])
 
-        xi_model, poly_model = self.get_model(p, d, smooth=self.smooth)
+        xi_model, poly_model = self.get_template_model(p, d, lambda q: self.get_model(q, d, smooth=self.smooth))
 
         if self.isotropic:
             xi_model_fit = xi_model
@@ -602,6 +749,95 @@ class CorrelationFunctionFit(Model):
                 num_data=num_data,
             )
 
+    @profile("get_model_batch")
+    def get_model_batch(self, ps, d, smooth=False):
+        """Gets the model predictions for many parameter locations at once, binning them all with a single matrix product
+
+        Parameters
+        ----------
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        d : dict
+            A specific set of data to compute the model for. For correlation functions, this needs to
+            have a key of 'dist' which contains the Mpc/h value of distances to compute.
+        smooth : bool, optional
+            Whether to only generate a smooth model without the BAO feature
+
+        Returns
+        -------
+        xi_model : np.ndarray
+            The concatenated xi_{\\ell}(s) predictions, with shape (len(ps), len(poles) * len(d['dist']))
+        poly_model : np.ndarray
+            the functions describing any polynomial terms, with shape (len(ps), nmarg, len(poles) * len(d['dist'])).
+            'None' if not marginalising.
+        """
+
+        xi, poly = self.compute_correlation_function_batch(d["dist_input"], ps, smooth=smooth)
+        npoles = 1 if self.isotropic else (3 if 4 in d["poles"] else 2)
+
+        # Convolve all the xi models with the binning matrix at once
+        xi_model = (xi[:, :npoles] @ d["binmat"]).reshape((len(ps), -1))
+
+        poly_model = None
+        if self.marg:
+            if not self.isotropic:
+                poly = poly[:, :, :npoles]
+            poly_model = (poly @ d["binmat"]).reshape((len(ps), np.shape(poly)[1], -1))
+
+        return xi_model, poly_model
+
+    def get_model_vectors_batch(self, ps, d):
+        """Gets the binned models for many parameter locations at once, restricted to the fitted multipoles as in the
+        data vector d['xi']
+
+        Returns
+        -------
+        xi_model : np.ndarray
+            The model predictions without any nuisance parameters, with shape (len(ps), len(d['xi']))
+        poly_model : np.ndarray
+            The parts of the model that depend on the analytically marginalised parameters, with shape
+            (len(ps), nmarg, len(d['xi'])). 'None' if not marginalising
+        """
+        xi_model, poly_model = self.get_model_batch(ps, d, smooth=self.smooth)
+
+        if not self.isotropic:
+            xi_model = xi_model.reshape((len(ps), len(d["poles"]), -1))[:, d["fit_pole_indices"]].reshape((len(ps), -1))
+            if self.marg:
+                poly_model = poly_model.reshape(poly_model.shape[:2] + (len(d["poles"]), -1))[:, :, d["fit_pole_indices"]]
+                poly_model = poly_model.reshape(poly_model.shape[:2] + (-1,))
+        return xi_model, poly_model
+
+    def get_likelihood_batch(self, ps, d):
+        """Uses the stated likelihood correction and `get_model_batch` to compute the likelihood of many parameter locations at once
+
+        Parameters
+        ----------
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        d : dict
+            A specific set of data to compute the model for.
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The corrected log likelihoods
+        """
+        # Tabulated models are cheaper to interpolate one at a time
+        if self.template_config is not None:
+            return super().get_likelihood_batch(ps, d)
+
+        num_mocks = d["num_mocks"]
+        num_data = len(d["xi"])
+
+        xi_model, poly_model = self.get_model_vectors_batch(ps, d)
+
+        if self.marg_type == "partial":
+            return self.get_chi2_partial_marg_likelihood_batch(d["xi"], xi_model, poly_model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+        elif self.marg_type == "full":
+            return self.get_chi2_marg_likelihood_batch(d["xi"], xi_model, poly_model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+        else:
+            return self.get_chi2_likelihood_batch(d["xi"], xi_model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+
     def plot(self, params, smooth_params=None, figname=None, title=None, display=True):
         import matplotlib.pyplot as plt
 
@@ -5,6 +5,7 @@ sys.path.append("../..")
 
 from barry.models import PowerBeutler2017
 from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.profiling import profile
 from scipy.interpolate import splev, splrep
 import numpy as np
 
@@ -25,6 +26,7 @@ class CorrBeutler2017(CorrelationFunctionFit):
         marg=None,
         dilate_smooth=True,
         n_poly=3,
+        mu_quadrature=None,
     ):
 
         self.dilate_smooth = dilate_smooth
@@ -41,6 +43,7 @@ class CorrBeutler2017(CorrelationFunctionFit):
             marg=marg,
             includeb2=False,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
         self.parent = PowerBeutler2017(
             fix_params=fix_params,
@@ -52,6 +55,7 @@ class CorrBeutler2017(CorrelationFunctionFit):
             marg=marg,
             dilate_smooth=dilate_smooth,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         self.set_marg(fix_params, poly_poles, n_poly, do_bias=False)
@@ -70,6 +74,7 @@ class CorrBeutler2017(CorrelationFunctionFit):
             for ip in range(self.n_poly):
                 self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{1}}}", f"$a_{{{pole},{ip+1},1}}$", -100.0, 100.0, 0)
 
+    @profile("compute_correlation_function")
     def compute_correlation_function(self, dist, p, smooth=False):
         """Computes the correlation function model using the Beutler et. al., 2017 power spectrum
             and 3 bias parameters and polynomial terms per multipole
@@ -105,6 +110,10 @@ class CorrBeutler2017(CorrelationFunctionFit):
 
         return dist, xi, poly
 
+    def compute_correlation_function_batch(self, dist, ps, smooth=False):
+        xi_comp = self.get_xi_multipoles_batch(dist, ps, smooth=smooth)
+        return self.add_poly_batch(dist, ps, xi_comp)
+
 
 if __name__ == "__main__":
     import sys
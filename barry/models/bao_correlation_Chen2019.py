@@ -5,6 +5,7 @@ sys.path.append("../..")
 
 from barry.models import PowerChen2019
 from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.profiling import profile
 from scipy.interpolate import splev, splrep
 import numpy as np
 
@@ -28,6 +29,7 @@ class CorrChen2019(CorrelationFunctionFit):
         poly_poles=(0, 2),
         marg=None,
         n_poly=3,
+        mu_quadrature=None,
     ):
 
         super().__init__(
@@ -41,6 +43,7 @@ class CorrChen2019(CorrelationFunctionFit):
             marg=marg,
             includeb2=False,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
         self.parent = PowerChen2019(
             fix_params=fix_params,
@@ -51,6 +54,7 @@ class CorrChen2019(CorrelationFunctionFit):
             isotropic=isotropic,
             marg=marg,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         self.set_marg(fix_params, poly_poles, n_poly, do_bias=False)
@@ -64,6 +68,7 @@ class CorrChen2019(CorrelationFunctionFit):
             for ip in range(self.n_poly):
                 self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{1}}}", f"$a_{{{pole},{ip+1},1}}$", -100.0, 100.0, 0)
 
+    @profile("compute_correlation_function")
     def compute_correlation_function(self, dist, p, smooth=False):
         """Computes the correlation function model using the Chen et. al., 2019 ZA model power spectrum
             and 3 polynomial terms per multipole
@@ -98,6 +103,10 @@ class CorrChen2019(CorrelationFunctionFit):
 
         return dist, xi, poly
 
+    def compute_correlation_function_batch(self, dist, ps, smooth=False):
+        xi_comp = self.get_xi_multipoles_batch(dist, ps, smooth=smooth)
+        return self.add_poly_batch(dist, ps, xi_comp)
+
 
 if __name__ == "__main__":
     import sys
@@ -5,6 +5,7 @@ sys.path.append("../..")
 
 from barry.models import PowerBeutler2017
 from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.profiling import profile
 from scipy.interpolate import splev, splrep
 import numpy as np
 
@@ -25,6 +26,7 @@ class CorrRoss2017(CorrelationFunctionFit):
         marg=None,
         includeb2=True,
         n_poly=3,
+        mu_quadrature=None,
     ):
 
         super().__init__(
@@ -38,6 +40,7 @@ class CorrRoss2017(CorrelationFunctionFit):
             marg=marg,
             includeb2=includeb2,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
         self.parent = PowerBeutler2017(
             fix_params=fix_params,
@@ -48,6 +51,7 @@ class CorrRoss2017(CorrelationFunctionFit):
             isotropic=isotropic,
             marg=marg,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         self.set_marg(fix_params, poly_poles, n_poly, do_bias=True)
@@ -75,6 +79,7 @@ class CorrRoss2017(CorrelationFunctionFit):
                 for ip in range(self.n_poly):
                     self.add_param(f"a{{{pole}}}_{{{ip + 1}}}_{{{1}}}", f"$a_{{{pole},{ip + 1},1}}$", -100.0, 100.0, 0)
 
+    @profile("compute_correlation_function")
     def compute_correlation_function(self, dist, p, smooth=False):
         """Computes the correlation function model using the Beutler et. al., 2017 power spectrum
             and 3 bias parameters and polynomial terms per multipole
@@ -182,6 +187,10 @@ class CorrRoss2017(CorrelationFunctionFit):
 
         return xi, poly
 
+    def add_poly_batch(self, dist, ps, xi_comp):
+        models = [self.add_poly(dist, p, xi) for p, xi in zip(ps, xi_comp)]
+        return np.array([m[0] for m in models]), np.array([m[1] for m in models]) if self.marg else None
+
     def add_zero_poly(self, dist, p, xi_comp):
         """Converts the xi components to a full model but without any polynomial terms
 
@@ -3,6 +3,7 @@ import logging
 import numpy as np
 from barry.models import PowerSeo2016
 from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.profiling import profile
 
 
 class CorrSeo2016(CorrelationFunctionFit):
@@ -24,6 +25,7 @@ class CorrSeo2016(CorrelationFunctionFit):
         marg=None,
         includeb2=True,
         n_poly=3,
+        mu_quadrature=None,
     ):
 
         super().__init__(
@@ -37,6 +39,7 @@ class CorrSeo2016(CorrelationFunctionFit):
             marg=marg,
             includeb2=False,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
         self.parent = PowerSeo2016(
             fix_params=fix_params,
@@ -47,6 +50,7 @@ class CorrSeo2016(CorrelationFunctionFit):
             isotropic=isotropic,
             marg=marg,
             n_poly=n_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         self.set_marg(fix_params, poly_poles, n_poly, do_bias=False)
@@ -61,6 +65,7 @@ class CorrSeo2016(CorrelationFunctionFit):
             for ip in range(self.n_poly):
                 self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{1}}}", f"$a_{{{pole},{ip+1},1}}$", -100.0, 100.0, 0)
 
+    @profile("compute_correlation_function")
     def compute_correlation_function(self, dist, p, smooth=False):
         """Computes the correlation function model using the Seo et. al., 2016 model power spectrum
             and 3 polynomial terms per multipole
@@ -95,6 +100,10 @@ class CorrSeo2016(CorrelationFunctionFit):
 
         return dist, xi, poly
 
+    def compute_correlation_function_batch(self, dist, ps, smooth=False):
+        xi_comp = self.get_xi_multipoles_batch(dist, ps, smooth=smooth)
+        return self.add_poly_batch(dist, ps, xi_comp)
+
 
 if __name__ == "__main__":
     import sys
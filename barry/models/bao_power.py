@@ -1,14 +1,15 @@
 from functools import lru_cache
 
-from scipy.integrate import simps
 from scipy.interpolate import splev, splrep
 from scipy.linalg import block_diag
 
-from barry.cosmology.power_spectrum_smoothing import smooth_func, validate_smooth_method
+from barry.cosmology.power_spectrum_smoothing import validate_smooth_method
 from barry.models.model import Model, Omega_m_z, Correction
+from barry.models.damping import DampingEngine
+from barry.profiling import profile
 import numpy as np
 
-from barry.utils import break_vector_and_get_blocks
+from barry.utils import break_vector_and_get_blocks, get_mu_quadrature
 
 
 class PowerSpectrumFit(Model):
@@ -30,6 +31,7 @@ class PowerSpectrumFit(Model):
         n_data=1,
         data_share_bias=False,
         data_share_poly=False,
+        mu_quadrature=None,
     ):
         """Generic power spectrum function model
 
@@ -47,6 +49,9 @@ class PowerSpectrumFit(Model):
             Whether to generate a smooth model without the BAO feature. Defaults to `false`.
         correction : `Correction` enum.
             Defaults to `Correction.SELLENTIN
+        mu_quadrature : dict, optional
+            The method and number of nodes used to integrate over mu, passed to `get_mu_quadrature`.
+            Defaults to `{"method": "simpson", "nmu": 100}`. `{"method": "gauss", "nmu": 12}` is much faster.
         """
         super().__init__(name, postprocess=postprocess, correction=correction, isotropic=isotropic, marg=marg, n_data=n_data)
         if smooth_type is None:
@@ -84,13 +89,29 @@ class PowerSpectrumFit(Model):
         # Set up data structures for model fitting
         self.smooth = smooth
 
-        self.nmu = 100
-        self.mu = np.linspace(0.0, 1.0, self.nmu)
+        if mu_quadrature is None:
+            mu_quadrature = {"method": "simpson", "nmu": 100}
+        self.mu_quadrature = mu_quadrature
+        self.mu, mu_weights = get_mu_quadrature(**self.mu_quadrature)
+        self.nmu = len(self.mu)
+
+        # Weights to project a 2D power spectrum onto the l=0, 2 and 4 Legendre multipoles with a single matrix product
+        legendre = [np.ones(self.nmu), 2.5 * (3.0 * self.mu**2 - 1.0), 1.125 * (35.0 * self.mu**4 - 30.0 * self.mu**2 + 3.0)]
+        self.mu_weights = mu_weights[:, None] * np.array(legendre).T
 
         self.kvals = None
         self.pksmooth = None
         self.pkratio = None
 
+        # Cache of B-spline representations of the template power spectra, which only depend on om
+        self.spline_cache = {}
+        self.spline_cache_size = 1024
+        self.spline_cache_hits = 0
+        self.spline_cache_misses = 0
+
+        # Engines evaluating the BAO damping kernels for each set of k values
+        self.damping_engines = {}
+
     def set_marg(self, fix_params, poly_poles, n_poly, do_bias=False):
 
         if self.marg:
@@ -193,21 +214,109 @@ class PowerSpectrumFit(Model):
             the ratio pk_lin / pk_smooth, transitioned using sigma_nl
 
         """
-        # Get base linear power spectrum from camb
-        res = self.camb.get_data(om=om, h0=self.camb.h0)
-        pk_smooth_lin = smooth_func(
-            self.camb.ks,
-            res["pk_lin"],
-            om=om,
-            h0=self.camb.h0,
-            ob=self.camb.omega_b,
-            ns=self.camb.ns,
-            rs=res["r_s"],
-            **self.smooth_type,
-        )  # Get the smoothed power spectrum
-        pk_ratio = res["pk_lin"] / pk_smooth_lin - 1.0  # Get the ratio
+        # Interpolate the smoothed linear power spectrum and wiggle ratio tabulated on the camb grid
+        pk_smooth_lin, pk_ratio = self.camb.get_smoothed_data(om=om, h0=self.camb.h0, smooth_type=self.smooth_type)
         return pk_smooth_lin, pk_ratio
 
+    def get_spline(self, name, key, compute):
+        """Returns the B-spline representation of a template curve, only refitting it if it isn't already cached
+
+        Parameters
+        ----------
+        name : str
+            The name of the curve, e.g. 'pk_smooth_lin'
+        key : tuple
+            Everything the curve depends on, e.g. om and the smoothing method.
+        compute : function
+            A function returning the (x, y) values to fit the spline to if the curve isn't cached.
+
+        Returns
+        -------
+        tck : tuple
+            The knots, coefficients and degree of the spline, to be passed to `splev`
+        """
+        key = (name,) + key
+        tck = self.spline_cache.get(key)
+        if tck is None:
+            self.spline_cache_misses += 1
+            tck = splrep(*compute())
+            if len(self.spline_cache) >= self.spline_cache_size:
+                self.spline_cache.pop(next(iter(self.spline_cache)))
+            self.spline_cache[key] = tck
+        else:
+            self.spline_cache_hits += 1
+        return tck
+
+    def get_spline_cache_info(self):
+        """Returns the hits, misses and current size of the template spline cache"""
+        return {"hits": self.spline_cache_hits, "misses": self.spline_cache_misses, "size": len(self.spline_cache)}
+
+    def get_damping_engine(self, data_name=None):
+        """Gets the `DampingEngine` used to evaluate the BAO damping terms for the model
+
+        Parameters
+        ----------
+        data_name : str, optional
+            The name of the dataset whose window function input ks the damping is evaluated at. If None, or for isotropic
+            models, the damping is evaluated at the CAMB ks.
+
+        Returns
+        -------
+        engine : DampingEngine
+            The engine, with kernels of shape (nmu, nk) for isotropic models, and (nk, nmu) otherwise
+        """
+        ks = self.camb.ks if data_name is None or self.isotropic else self.data_dict[data_name]["ks_input"]
+        engine = self.damping_engines.get(data_name)
+        if engine is None or engine.ks is not ks:
+            engine = DampingEngine(ks, self.mu, k_first=not self.isotropic)
+            self.damping_engines[data_name] = engine
+        return engine
+
+    def get_cache_info(self):
+        caches = super().get_cache_info()
+        caches["spline_cache"] = self.get_spline_cache_info()
+        caches["damping_engines"] = self.get_damping_cache_info()
+        return caches
+
+    def get_damping_cache_info(self):
+        """Returns the hits, misses and number of buffered damping terms, summed over the damping engines"""
+        infos = [e.get_cache_info() for e in self.damping_engines.values()]
+        return {k: sum([i[k] for i in infos]) for k in ["hits", "misses", "size"]}
+
+    def get_basic_power_spectrum_splines(self, om):
+        """Gets the B-spline representations of the smoothed linear power spectrum and the wiggle ratio
+
+        Uses the user supplied template (`kvals`, `pksmooth` and `pkratio`) if present, otherwise
+        the output of `compute_basic_power_spectrum` for the given om.
+
+        Parameters
+        ----------
+        om : float
+            The Omega_m value to get the splines for
+
+        Returns
+        -------
+        tck_smooth : tuple
+            The spline representation of the smoothed linear power spectrum
+        tck_ratio : tuple
+            The spline representation of the wiggle ratio
+
+        """
+        if self.kvals is None or self.pksmooth is None or self.pkratio is None:
+            key = (om, self.camb.filename_unique, str(self.smooth_type))
+            tck_smooth = self.get_spline("pk_smooth_lin", key, lambda: (self.camb.ks, self.compute_basic_power_spectrum(om)[0]))
+            tck_ratio = self.get_spline("pk_ratio", key, lambda: (self.camb.ks, self.compute_basic_power_spectrum(om)[1]))
+        else:
+            key = (id(self.kvals), id(self.pksmooth), id(self.pkratio))
+            tck_smooth = self.get_spline("pk_smooth_lin", key, lambda: (self.kvals, self.pksmooth))
+            tck_ratio = self.get_spline("pk_ratio", key, lambda: (self.kvals, self.pkratio))
+        return tck_smooth, tck_ratio
+
+    def get_smoothing_kernel_spline(self):
+        """Gets the B-spline representation of the reconstruction smoothing kernel on the camb k values"""
+        key = (self.camb.filename_unique, self.camb.recon_smoothing_scale)
+        return self.get_spline("smoothing_kernel", key, lambda: (self.camb.ks, self.camb.smoothing_kernel))
+
     @lru_cache(maxsize=32)
     def get_kprimefac(self, epsilon):
         """Computes the prefactor to dilate a k value given epsilon, such that kprime = k * kprimefac / alpha
@@ -247,17 +356,42 @@ class PowerSpectrumFit(Model):
         muprime = self.mu / np.sqrt(musq + (1.0 + epsilon) ** 6 * (1.0 - musq))
         return muprime
 
+    def get_dilation_batch(self, k, alpha, epsilon):
+        """Computes the dilated k and mu values for many values of alpha and epsilon at once, the batched equivalent of
+        `get_kprimefac` and `get_muprime`
+
+        Parameters
+        ----------
+        k : np.ndarray
+            The undilated k values
+        alpha : np.ndarray
+            The isotropic dilation of each model
+        epsilon : np.ndarray
+            The anisotropic warping of each model
+
+        Returns
+        -------
+        kprime : np.ndarray
+            The dilated k values, with shape (len(alpha), len(k), nmu)
+        muprime : np.ndarray
+            The dilated mu values, with shape (len(alpha), 1, nmu)
+        """
+        musq = self.mu**2
+        epsilonsq = (1.0 + np.asarray(epsilon, dtype=float)[:, None, None]) ** 2
+        kprimefac = np.sqrt(musq / epsilonsq**2 + (1.0 - musq) * epsilonsq)
+        kprime = k[None, :, None] / np.asarray(alpha, dtype=float)[:, None, None] * kprimefac
+        muprime = self.mu / np.sqrt(musq + epsilonsq**3 * (1.0 - musq))
+        return kprime, muprime
+
     def integrate_mu(self, pk2d, isotropic=False):
-        pk0 = simps(pk2d, self.mu, axis=1)
+        """Projects the 2D power spectrum, with mu along the last axis, onto the monopole, quadrupole and hexadecapole.
+        Any leading axes (such as a batch of models) are kept."""
         if isotropic:
-            pk2 = None
-            pk4 = None
-        else:
-            pk2 = 3.0 * simps(pk2d * self.mu**2, self.mu)
-            pk4 = 1.125 * (35.0 * simps(pk2d * self.mu**4, self.mu, axis=1) - 10.0 * pk2 + 3.0 * pk0)
-            pk2 = 2.5 * (pk2 - pk0)
-        return pk0, pk2, pk4
+            return pk2d @ self.mu_weights[:, 0], None, None
+        pk = pk2d @ self.mu_weights
+        return pk[..., 0], pk[..., 1], pk[..., 2]
 
+    @profile("compute_power_spectrum")
     def compute_power_spectrum(self, k, p, smooth=False, for_corr=False, data_name=None):
         """Get raw ks and p(k) multipoles for a given parametrisation dilated based on the values of alpha and epsilon
 
@@ -282,12 +416,7 @@ class PowerSpectrumFit(Model):
 
         """
         # Get the basic power spectrum components
-        if self.kvals is None or self.pksmooth is None or self.pkratio is None:
-            ks = self.camb.ks
-            pk_smooth_lin, pk_ratio = self.compute_basic_power_spectrum(p["om"])
-        else:
-            ks = self.kvals
-            pk_smooth_lin, pk_ratio = self.pksmooth, self.pkratio
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(p["om"])
 
         # We split for isotropic and anisotropic here for consistency with our previous isotropic convention, which
         # differs from our implementation of the Beutler2017 isotropic model quite a bit. This results in some duplication
@@ -297,7 +426,7 @@ class PowerSpectrumFit(Model):
         if self.isotropic:
             pk = [np.zeros(len(k))]
             kprime = k if for_corr else k / p["alpha"]
-            pk_smooth = splev(kprime, splrep(ks, pk_smooth_lin))
+            pk_smooth = splev(kprime, tck_smooth)
             if not for_corr:
                 pk_smooth *= p["b{0}"]
 
@@ -305,8 +434,7 @@ class PowerSpectrumFit(Model):
                 pk[0] = pk_smooth if for_corr else pk_smooth
             else:
                 # Compute the propagator
-                C = np.ones(len(ks))
-                propagator = splev(kprime, splrep(ks, (1.0 + pk_ratio * C)))
+                propagator = 1.0 + splev(kprime, tck_ratio)
                 pk[0] = pk_smooth * propagator
 
             poly = np.zeros((1, len(k)))
@@ -320,10 +448,10 @@ class PowerSpectrumFit(Model):
             kprime = np.tile(k, (self.nmu, 1)).T if for_corr else np.outer(k / p["alpha"], self.get_kprimefac(epsilon))
             muprime = self.mu if for_corr else self.get_muprime(epsilon)
             if self.recon_type.lower() == "iso":
-                kaiser_prefac = 1.0 + p["beta"] * muprime**2 * (1.0 - splev(kprime, splrep(self.camb.ks, self.camb.smoothing_kernel)))
+                kaiser_prefac = 1.0 + p["beta"] * muprime**2 * (1.0 - splev(kprime, self.get_smoothing_kernel_spline()))
             else:
                 kaiser_prefac = 1.0 + p["beta"] * muprime**2
-            pk_smooth = kaiser_prefac**2 * splev(kprime, splrep(ks, pk_smooth_lin))
+            pk_smooth = kaiser_prefac**2 * splev(kprime, tck_smooth)
             if not for_corr:
                 pk_smooth *= p["b{0}"]
 
@@ -331,8 +459,7 @@ class PowerSpectrumFit(Model):
             if smooth:
                 pk2d = pk_smooth
             else:
-                C = np.ones(len(ks))
-                pk2d = pk_smooth * (1.0 + splev(kprime, splrep(ks, pk_ratio)) * C)
+                pk2d = pk_smooth * (1.0 + splev(kprime, tck_ratio))
 
             pk0, pk2, pk4 = self.integrate_mu(pk2d)
 
@@ -352,6 +479,41 @@ class PowerSpectrumFit(Model):
 
         return kprime, pk, poly
 
+    def compute_power_spectrum_batch(self, k, ps, smooth=False, for_corr=False, data_name=None, nopoly=False):
+        """Computes the power spectrum model for many parameter locations at once. This evaluates `compute_power_spectrum`
+        for each one in turn, and should be overwritten by models that can be evaluated over a batch axis.
+
+        Parameters
+        ----------
+        k : np.ndarray
+            Array of (undilated) k-values to compute the model at.
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        smooth : bool, optional
+            Whether or not to generate a smooth model without the BAO feature
+        for_corr : bool, optional
+            Whether the model is for the correlation function, so is undilated and without the bias
+        data_name : str, optional
+            The name used to access precomputed values.
+        nopoly : bool, optional
+            Whether to skip the polynomial terms
+
+        Returns
+        -------
+        kprime : np.ndarray
+            The wavenumbers of the computed pk for each model, along the first axis
+        pk : np.ndarray
+            The multipoles of each model, with shape (len(ps), num_poles, len(k))
+        poly : np.ndarray
+            The additive terms in each model, with shape (len(ps), nmarg, num_poles, len(k)). 'None' if for_corr or nopoly.
+        """
+        kwargs = {"nopoly": True} if nopoly else {}
+        models = [self.compute_power_spectrum(k, p, smooth=smooth, for_corr=for_corr, data_name=data_name, **kwargs) for p in ps]
+        kprime = np.array([m[0] for m in models])
+        pk = np.array([m[1] for m in models])
+        poly = None if models[0][2] is None else np.array([m[2] for m in models])
+        return kprime, pk, poly
+
     def add_poly(self, k, kpoly, p, prefac, pk):
         """Returns the polynomial components for 3 terms per multipole
 
@@ -405,6 +567,41 @@ class PowerSpectrumFit(Model):
 
         return shape, poly
 
+    def add_poly_batch(self, k, ps, pk):
+        """Batched version of `add_poly` for the anisotropic models, with a prefactor of one
+
+        Parameters
+        ----------
+        k : np.ndarray
+            Array of k values for the shape and polynomial terms
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        pk : np.ndarray
+            The power spectrum multipoles of each model without polynomials, with shape (len(ps), 6, len(k))
+
+        Returns
+        -------
+        shape : np.ndarray
+            The polynomial terms to be added directly to each multipole, with shape (len(ps), 6, len(k))
+        poly: np.ndarray
+            The additive terms in the model, necessary for analytical marginalisation, with shape (len(ps), nmarg, 6, len(k))
+        """
+        shape = np.zeros((len(ps), 6, len(k)))
+        polyvec = np.array([k ** (ip - 1) for ip in range(self.n_poly)])
+        if self.marg:
+            poly = np.zeros((len(ps), self.n_poly * len(self.poly_poles) + 1, 6, len(k)))
+            poly[:, 0] = pk
+            for i, pole in enumerate(self.poly_poles):
+                poly[:, self.n_poly * i + 1 : self.n_poly * (i + 1) + 1, pole] = polyvec
+        else:
+            poly = np.zeros((len(ps), 1, 6, len(k)))
+            for pole in self.poly_poles:
+                coefficients = np.array([[p[f"a{{{pole}}}_{{{ip+1}}}"] for ip in range(self.n_poly)] for p in ps])
+                shape[:, pole] = coefficients @ polyvec
+
+        return shape, poly
+
+    @profile("adjust_model_window_effects")
     def adjust_model_window_effects(self, pk_generated, data, window=True, wide_angle=True):
         """Take the window effects into account.
 
@@ -493,7 +690,9 @@ class PowerSpectrumFit(Model):
         num_mocks = d["num_mocks"]
         num_data = len(d["pk"])
 
-        pk_model, pk_model_odd, poly_model, poly_model_odd, mask = self.get_model(p, d, smooth=self.smooth, data_name=d["name"])
+        pk_model, pk_model_odd, poly_model, poly_model_odd, mask = self.get_template_model(
+            p, d, lambda q: self.get_model(q, d, smooth=self.smooth, data_name=d["name"])
+        )
 
         if self.isotropic or d["icov_m_w"][0] is None:
             pk_model, pk_model_odd = pk_model[mask], pk_model_odd[mask]
@@ -543,6 +742,41 @@ class PowerSpectrumFit(Model):
                 num_data=num_data,
             )
 
+    def validate_compressed_likelihood(self, params=None, rtol=1e-6, atol=1e-3):
+        """Checks the likelihood computed with the window function compressed into the inverse covariance
+        (datasets created with `compress_window=True`) against convolving the model and then computing the chi2.
+
+        Parameters
+        ----------
+        params : list, optional
+            The values of the active parameters. Defaults to the model defaults.
+        rtol : float, optional
+            The relative tolerance allowed between the two likelihoods
+        atol : float, optional
+            The absolute tolerance allowed between the two likelihoods
+
+        Returns
+        -------
+        compressed : np.ndarray
+            The likelihood for each dataset using the compressed inverse covariance
+        convolved : np.ndarray
+            The likelihood for each dataset using the convolved model
+        """
+        ps = self.get_param_dict(self.get_defaults() if params is None else params)
+
+        compressed, convolved = [], []
+        for d in self.data:
+            assert d["icov_m_w"][0] is not None, "Dataset has no compressed inverse covariance, create it with compress_window=True"
+            compressed.append(self.get_likelihood(ps, d))
+            convolved.append(self.get_likelihood(ps, {**d, "icov_m_w": [None] * len(d["icov_m_w"])}))
+        compressed, convolved = np.array(compressed), np.array(convolved)
+
+        if np.allclose(compressed, convolved, rtol=rtol, atol=atol):
+            self.logger.info(f"Compressed likelihoods {compressed} match convolved likelihoods {convolved}")
+        else:
+            self.logger.warning(f"Compressed likelihoods {compressed} do not match convolved likelihoods {convolved}")
+        return compressed, convolved
+
     def deal_with_ndata(self, params, i):
 
         p = params.copy()
@@ -555,16 +789,15 @@ class PowerSpectrumFit(Model):
 
         return p
 
-    def get_model(self, params, d, smooth=False, data_name=None, window=True):
-        """Gets the model prediction using the data passed in and parameter location specified
+    def get_model_generated(self, params, d, smooth=False, data_name=None):
+        """Gets the model prediction at the window function input ks, before any window function or wide-angle effects
 
         Parameters
         ----------
         params : dict
             A dictionary of parameter names to parameter values
         d : dict
-            A specific set of data to compute the model for. For correlation functions, this needs to
-            have a key of 'dist' which contains the Mpc/h value of distances to compute.
+            A specific set of data to compute the model for.
         smooth : bool, optional
             Whether to only generate a smooth model without the BAO feature
         data_name : str, optional
@@ -572,11 +805,14 @@ class PowerSpectrumFit(Model):
 
         Returns
         -------
-        pk_model : np.ndarray
-            The p(k) predictions given p and data, k values correspond to d['ks_output']
-        poly_model : np.ndarray
-            the functions describing any polynomial terms, used for analytical marginalisation
-            k values correspond to d['ks_output']
+        pk_generated : np.ndarray
+            The concatenated even multipoles of the model at k values d['ks_input']
+        pk_generated_odd : np.ndarray
+            The concatenated odd multipoles of the model at k values d['ks_input']. 'None' if the model is isotropic
+        poly_generated : np.ndarray
+            The even multipoles of the polynomial terms, used for analytical marginalisation. 'None' if not marginalising
+        poly_generated_odd : np.ndarray
+            The odd multipoles of the polynomial terms. 'None' if not marginalising or the model is isotropic
         """
 
         # Loop over the constituent (correlated) datasets in d and generate their models
@@ -592,32 +828,19 @@ class PowerSpectrumFit(Model):
 
         all_polys = np.array(all_polys)
 
-        # Morph it into a model representative of our survey and its selection/window/binning effects
         # Split the model into even and odd components
+        even_poles = d["poles"][d["poles"] % 2 == 0]
+        nk = d["ndata"] * len(ks)
         if self.isotropic:
             pk_generated = np.concatenate([all_pks[i][0] for i in range(d["ndata"])])
+            pk_generated_odd = None
         else:
-            pk_generated = np.concatenate(
-                [np.concatenate([all_pks[i][l] for i in range(d["ndata"])]) for l in d["poles"][d["poles"] % 2 == 0]]
-            )
-
-        if self.isotropic:
-            pk_model, mask = self.adjust_model_window_effects(pk_generated, d, window=window), d["m_w_mask"]
-            if self.postprocess is not None:
-                pk_model = self.postprocess(ks=d["ks_output"], pk=pk_model, mask=mask)
-            pk_model_odd = np.zeros(d["ndata"] * len(d["ks_output"]))
-        else:
-            pk_model_odd = np.zeros(d["ndata"] * 6 * len(ks))
-            pk_model_odd[1 * d["ndata"] * len(ks) : 2 * d["ndata"] * len(ks)] += np.concatenate([all_pks[i][1] for i in range(d["ndata"])])
-            pk_model_odd[3 * d["ndata"] * len(ks) : 4 * d["ndata"] * len(ks)] += np.concatenate([all_pks[i][3] for i in range(d["ndata"])])
-            pk_model_odd[5 * d["ndata"] * len(ks) : 6 * d["ndata"] * len(ks)] += np.concatenate([all_pks[i][5] for i in range(d["ndata"])])
-            if d["icov_m_w"][0] is None:
-                pk_model, mask = self.adjust_model_window_effects(pk_generated, d, window=window), d["m_w_mask"]
-                pk_model_odd = self.adjust_model_window_effects(pk_model_odd, d, window=window, wide_angle=False)
-            else:
-                pk_model, mask = pk_generated, np.ones(len(pk_generated), dtype=bool)
+            pk_generated = np.concatenate([np.concatenate([all_pks[i][l] for i in range(d["ndata"])]) for l in even_poles])
+            pk_generated_odd = np.zeros(6 * nk)
+            for l in [1, 3, 5]:
+                pk_generated_odd[l * nk : (l + 1) * nk] += np.concatenate([all_pks[i][l] for i in range(d["ndata"])])
 
-        poly_model, poly_model_odd = None, None
+        poly_generated, poly_generated_odd = None, None
         if self.marg:
 
             # Concatenate the poly matrix in the correct way for our datasets based on the parameters they are sharing
@@ -643,46 +866,241 @@ class PowerSpectrumFit(Model):
                     # Nothing shared
                     poly = np.array([block_diag(*all_polys[:, :, l]) for l in range(nell)]).transpose((1, 0, 2))
 
-            nell = np.shape(poly)[1] - 1 if d["icov_m_w"][0] is None else np.shape(poly)[1] - 3
-            len_poly_k = d["ndata"] * len(d["ks_output"]) if d["icov_m_w"][0] is None else d["ndata"] * len(d["ks_input"])
-            len_poly = d["ndata"] * len(d["ks_output"]) if self.isotropic else len_poly_k * nell
-            len_poly_odd = d["ndata"] * len(d["ks_output"]) if self.isotropic else len_poly_k * (np.shape(poly)[1] - 1)
-            poly_model = np.zeros((np.shape(poly)[0], len_poly))
-            poly_model_odd = np.zeros((np.shape(poly)[0], len_poly_odd))
-            for n in range(np.shape(poly)[0]):
+            if self.isotropic:
+                poly_generated = poly[:, 0]
+            else:
+                poly_generated = np.concatenate([poly[:, l, :] for l in even_poles], axis=1)
+                poly_generated_odd = np.zeros((np.shape(poly)[0], 6 * nk))
+                for l in [1, 3, 5]:
+                    poly_generated_odd[:, l * nk : (l + 1) * nk] += poly[:, l]
 
-                # poly_split = np.split(poly[n], d["ndata"], axis=-1)
+        return pk_generated, pk_generated_odd, poly_generated, poly_generated_odd
 
-                if self.isotropic:
-                    poly_generated = poly[n, 0]
-                else:
-                    poly_generated = np.concatenate([poly[n, l, :] for l in d["poles"][d["poles"] % 2 == 0]])
+    def get_model_generated_batch(self, ps, d, smooth=False, data_name=None):
+        """Batched version of `get_model_generated`, with each output having the models along its first axis.
+        Data made of several correlated datasets are generated one model at a time."""
+        if d["ndata"] > 1:
+            generated = [self.get_model_generated(p, d, smooth=smooth, data_name=data_name) for p in ps]
+            return tuple(None if g[0] is None else np.array(g) for g in zip(*generated))
 
-                if self.isotropic:
-                    poly_model_long = self.adjust_model_window_effects(poly_generated, d, window=window)
-                    if self.postprocess is not None:
-                        poly_model_long = self.postprocess(ks=d["ks_output"], pk=poly_model_long, mask=mask)
-                    poly_model[n] = poly_model_long
-                else:
-                    nk = d["ndata"] * len(ks)
-                    poly_generated_odd = np.zeros(d["ndata"] * 6 * len(ks))
-                    poly_generated_odd[1 * nk : 2 * nk] += poly[n, 1]
-                    poly_generated_odd[3 * nk : 4 * nk] += poly[n, 3]
-                    poly_generated_odd[5 * nk : 6 * nk] += poly[n, 5]
-                    if d["icov_m_w"][0] is None:
-                        poly_model[n] = self.adjust_model_window_effects(poly_generated, d, window=window)
-                        poly_model_odd[n] = self.adjust_model_window_effects(poly_generated_odd, d, window=window, wide_angle=False)
-                    else:
-                        poly_model[n], poly_model_odd[n] = poly_generated, poly_generated_odd
+        ps = [self.deal_with_ndata(p, 0) for p in ps]
+        ks, pks, poly = self.compute_power_spectrum_batch(d["ks_input"], ps, smooth=smooth, data_name=data_name)
+
+        # Split the model into even and odd components
+        even_poles = d["poles"][d["poles"] % 2 == 0]
+        nk = len(d["ks_input"])
+        if self.isotropic:
+            pk_generated = pks[:, 0]
+            pk_generated_odd = None
+        else:
+            pk_generated = pks[:, even_poles].reshape((len(ps), -1))
+            pk_generated_odd = np.zeros((len(ps), 6 * nk))
+            for l in [1, 3, 5]:
+                pk_generated_odd[:, l * nk : (l + 1) * nk] += pks[:, l]
+
+        poly_generated, poly_generated_odd = None, None
+        if self.marg:
+            if self.isotropic:
+                poly_generated = poly[:, :, 0]
+            else:
+                poly_generated = poly[:, :, even_poles].reshape(poly.shape[:2] + (-1,))
+                poly_generated_odd = np.zeros(poly.shape[:2] + (6 * nk,))
+                for l in [1, 3, 5]:
+                    poly_generated_odd[:, :, l * nk : (l + 1) * nk] += poly[:, :, l]
+
+        return pk_generated, pk_generated_odd, poly_generated, poly_generated_odd
+
+    @profile("get_model")
+    def get_model(self, params, d, smooth=False, data_name=None, window=True):
+        """Gets the model prediction using the data passed in and parameter location specified
+
+        Parameters
+        ----------
+        params : dict
+            A dictionary of parameter names to parameter values
+        d : dict
+            A specific set of data to compute the model for. For correlation functions, this needs to
+            have a key of 'dist' which contains the Mpc/h value of distances to compute.
+        smooth : bool, optional
+            Whether to only generate a smooth model without the BAO feature
+        data_name : str, optional
+            The name used to access precomputed values.
+
+        Returns
+        -------
+        pk_model : np.ndarray
+            The p(k) predictions given p and data, k values correspond to d['ks_output']
+        poly_model : np.ndarray
+            the functions describing any polynomial terms, used for analytical marginalisation
+            k values correspond to d['ks_output']
+        """
+
+        pk_generated, pk_generated_odd, poly_generated, poly_generated_odd = self.get_model_generated(
+            params, d, smooth=smooth, data_name=data_name
+        )
+
+        # Morph it into a model representative of our survey and its selection/window/binning effects
+        if self.isotropic:
+            pk_model, mask = self.adjust_model_window_effects(pk_generated, d, window=window), d["m_w_mask"]
+            if self.postprocess is not None:
+                pk_model = self.postprocess(ks=d["ks_output"], pk=pk_model, mask=mask)
+            pk_model_odd = np.zeros(d["ndata"] * len(d["ks_output"]))
+        else:
+            if d["icov_m_w"][0] is None:
+                pk_model, mask = self.adjust_model_window_effects(pk_generated, d, window=window), d["m_w_mask"]
+                pk_model_odd = self.adjust_model_window_effects(pk_generated_odd, d, window=window, wide_angle=False)
+            else:
+                pk_model, mask = pk_generated, np.ones(len(pk_generated), dtype=bool)
+                pk_model_odd = pk_generated_odd
+
+        poly_model, poly_model_odd = None, None
+        if self.marg:
+            if self.isotropic:
+                poly_model = np.array([self.adjust_model_window_effects(pg, d, window=window) for pg in poly_generated])
+                if self.postprocess is not None:
+                    poly_model = np.array([self.postprocess(ks=d["ks_output"], pk=pm, mask=mask) for pm in poly_model])
+                poly_model_odd = np.zeros(np.shape(poly_model))
+            elif d["icov_m_w"][0] is None:
+                poly_model = np.array([self.adjust_model_window_effects(pg, d, window=window) for pg in poly_generated])
+                poly_model_odd = np.array(
+                    [self.adjust_model_window_effects(pg, d, window=window, wide_angle=False) for pg in poly_generated_odd]
+                )
+            else:
+                poly_model, poly_model_odd = poly_generated, poly_generated_odd
 
         return pk_model, pk_model_odd, poly_model, poly_model_odd, mask
 
+    @profile("adjust_model_window_effects_batch")
+    def adjust_model_window_effects_batch(self, pk_generated, data, wide_angle=True):
+        """Take the window effects into account for many models at once. Batched version of `adjust_model_window_effects`
+        that only supports window function convolution.
+
+        Parameters
+        ----------
+        pk_generated : np.ndarray
+            The p(k) values generated at the window function input ks, with the input ks along the last axis
+        data : dict
+            The data dictionary containing the window scale `w_scale`,
+            transformation matrix `w_transform`, integral constraint `w_pk`
+            and mask `w_mask`
+
+        Returns
+        -------
+        pk_normalised : np.ndarray
+            The transformed, corrected power spectra, with the output ks along the last axis.
+        """
+        if self.isotropic:
+            integral_constraint = (pk_generated @ data["w_scale"])[..., None] * data["w_pk"]
+            return pk_generated @ data["w_transform"].T - integral_constraint
+        elif wide_angle:
+            return pk_generated @ data["w_m_transform"].T
+        else:
+            return pk_generated @ data["w_transform"].T
+
+    @profile("get_model_batch")
+    def get_model_batch(self, ps, d, smooth=False, data_name=None):
+        """Gets the window convolved model predictions for many parameter locations at once
+
+        Parameters
+        ----------
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        d : dict
+            A specific set of data to compute the model for.
+        smooth : bool, optional
+            Whether to only generate a smooth model without the BAO feature
+        data_name : str, optional
+            The name used to access precomputed values.
+
+        Returns
+        -------
+        pk_model : np.ndarray
+            The p(k) predictions, with shape (len(ps), len(mask))
+        pk_model_odd : np.ndarray
+            The odd multipole p(k) predictions, with shape (len(ps), len(mask))
+        poly_model : np.ndarray
+            The polynomial terms used for analytical marginalisation, with shape (len(ps), nmarg, len(mask)). 'None' if not marginalising
+        poly_model_odd : np.ndarray
+            The odd multipole polynomial terms, as for poly_model.
+        mask : np.ndarray
+            A boolean mask used for selecting the final data out of the model.
+        """
+        pk_generated, pk_generated_odd, poly_generated, poly_generated_odd = self.get_model_generated_batch(
+            ps, d, smooth=smooth, data_name=data_name
+        )
+
+        pk_model = self.adjust_model_window_effects_batch(pk_generated, d)
+        if self.isotropic:
+            pk_model_odd = np.zeros(pk_model.shape)
+        else:
+            pk_model_odd = self.adjust_model_window_effects_batch(pk_generated_odd, d, wide_angle=False)
+
+        poly_model, poly_model_odd = None, None
+        if self.marg:
+            poly_model = self.adjust_model_window_effects_batch(poly_generated, d)
+            if self.isotropic:
+                poly_model_odd = np.zeros(poly_model.shape)
+            else:
+                poly_model_odd = self.adjust_model_window_effects_batch(poly_generated_odd, d, wide_angle=False)
+
+        return pk_model, pk_model_odd, poly_model, poly_model_odd, d["m_w_mask"]
+
+    def get_model_vectors_batch(self, ps, d):
+        """Gets the window convolved models for many parameter locations at once, masked to the fitted data vector
+        d['pk'] and with the odd multipoles added on, as compared to the data in the likelihood
+
+        Returns
+        -------
+        model : np.ndarray
+            The model predictions without any nuisance parameters, with shape (len(ps), len(d['pk']))
+        marg_model : np.ndarray
+            The parts of the model that depend on the analytically marginalised parameters, with shape
+            (len(ps), nmarg, len(d['pk'])). 'None' if not marginalising
+        """
+        pk_model, pk_model_odd, poly_model, poly_model_odd, mask = self.get_model_batch(ps, d, smooth=self.smooth, data_name=d["name"])
+        model = (pk_model + pk_model_odd)[:, mask]
+        marg_model = None if poly_model is None else (poly_model + poly_model_odd)[:, :, mask]
+        return model, marg_model
+
+    def get_likelihood_batch(self, ps, d):
+        """Uses the stated likelihood correction and `get_model_batch` to compute the likelihood of many parameter locations at once
+
+        Parameters
+        ----------
+        ps : list[dict]
+            A list of dictionaries of parameter names to parameter values
+        d : dict
+            A specific set of data to compute the model for.
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The corrected log likelihoods
+        """
+
+        # Postprocessing and unconvolved models aren't supported by the batched model, so evaluate them one at a time,
+        # as are tabulated models which are cheaper to interpolate one at a time
+        if self.postprocess is not None or (not self.isotropic and d["icov_m_w"][0] is not None) or self.template_config is not None:
+            return super().get_likelihood_batch(ps, d)
+
+        num_mocks = d["num_mocks"]
+        num_data = len(d["pk"])
+
+        model, marg_model = self.get_model_vectors_batch(ps, d)
+
+        if self.marg_type == "partial":
+            return self.get_chi2_partial_marg_likelihood_batch(d["pk"], model, marg_model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+        elif self.marg_type == "full":
+            return self.get_chi2_marg_likelihood_batch(d["pk"], model, marg_model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+        else:
+            return self.get_chi2_likelihood_batch(d["pk"], model, d["icov"], num_mocks=num_mocks, num_data=num_data)
+
     def plot(self, params, window=True, smooth_params=None, figname=None, title=None, display=True):
         import matplotlib.pyplot as plt
 
         # Ensures we plot the window convolved model
         icov_m_w = self.data[0]["icov_m_w"]
-        self.data[0]["icov_m_w"][0] = None
+        self.data[0]["icov_m_w"] = [None] * len(icov_m_w)
 
         ks = self.data[0]["ks"]
         err = np.sqrt(np.diag(self.data[0]["cov"]))
@@ -1,6 +1,8 @@
 import numpy as np
 from barry.models.bao_power import PowerSpectrumFit
 from scipy.interpolate import splev, splrep
+from barry.profiling import profile
+from barry.utils import splev_many
 
 
 class PowerBeutler2017(PowerSpectrumFit):
@@ -27,6 +29,7 @@ class PowerBeutler2017(PowerSpectrumFit):
         n_data=1,
         data_share_bias=False,
         data_share_poly=False,
+        mu_quadrature=None,
     ):
 
         self.dilate_smooth = dilate_smooth
@@ -46,6 +49,7 @@ class PowerBeutler2017(PowerSpectrumFit):
             n_data=n_data,
             data_share_bias=data_share_bias,
             data_share_poly=data_share_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         self.set_marg(fix_params, poly_poles, n_poly, do_bias=True)
@@ -64,6 +68,7 @@ class PowerBeutler2017(PowerSpectrumFit):
                 for ip in range(self.n_poly):
                     self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{i+1}}}", f"$a_{{{pole},{ip+1},{i+1}}}$", -20000.0, 20000.0, 0)
 
+    @profile("compute_power_spectrum")
     def compute_power_spectrum(self, k, p, smooth=False, for_corr=False, data_name=None, nopoly=False):
         """Computes the power spectrum model using the Beutler et. al., 2017 method
 
@@ -91,12 +96,7 @@ class PowerBeutler2017(PowerSpectrumFit):
         """
 
         # Get the basic power spectrum components
-        if self.kvals is None or self.pksmooth is None or self.pkratio is None:
-            ks = self.camb.ks
-            pk_smooth_lin, pk_ratio = self.compute_basic_power_spectrum(p["om"])
-        else:
-            ks = self.kvals
-            pk_smooth_lin, pk_ratio = self.pksmooth, self.pkratio
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(p["om"])
 
         # We split for isotropic and anisotropic here for consistency with our previous isotropic convention, which
         # differs from our implementation of the Beutler2017 isotropic model quite a bit. This results in some duplication
@@ -111,9 +111,9 @@ class PowerBeutler2017(PowerSpectrumFit):
             pk = [np.zeros(len(k))]
             kprime = k if for_corr else k / p["alpha"]
             if self.dilate_smooth:
-                pk_smooth = splev(kprime, splrep(ks, pk_smooth_lin)) / (1.0 + kprime**2 * p["sigma_s"] ** 2 / 2.0) ** 2
+                pk_smooth = splev(kprime, tck_smooth) / (1.0 + kprime**2 * p["sigma_s"] ** 2 / 2.0) ** 2
             else:
-                pk_smooth = splev(k, splrep(ks, pk_smooth_lin)) / (1.0 + k**2 * p["sigma_s"] ** 2 / 2.0) ** 2
+                pk_smooth = splev(k, tck_smooth) / (1.0 + k**2 * p["sigma_s"] ** 2 / 2.0) ** 2
             if not for_corr:
                 pk_smooth *= p["b{0}"]
 
@@ -125,7 +125,7 @@ class PowerBeutler2017(PowerSpectrumFit):
             else:
                 # Compute the propagator
                 C = np.exp(-0.5 * kprime**2 * p["sigma_nl"] ** 2)
-                propagator = 1.0 + splev(kprime, splrep(ks, pk_ratio)) * C
+                propagator = 1.0 + splev(kprime, tck_ratio) * C
             prefac = np.ones(len(kprime)) if smooth else propagator
 
             if for_corr or nopoly:
@@ -142,15 +142,15 @@ class PowerBeutler2017(PowerSpectrumFit):
             muprime = self.mu if for_corr else self.get_muprime(epsilon)
             if self.dilate_smooth:
                 fog = 1.0 / (1.0 + muprime**2 * kprime**2 * p["sigma_s"] ** 2 / 2.0) ** 2
-                reconfac = splev(kprime, splrep(self.camb.ks, self.camb.smoothing_kernel)) if self.recon_type.lower() == "iso" else 0.0
+                reconfac = splev(kprime, self.get_smoothing_kernel_spline()) if self.recon_type.lower() == "iso" else 0.0
                 kaiser_prefac = 1.0 + p["beta"] * muprime**2 * (1.0 - reconfac)
-                pk_smooth = kaiser_prefac**2 * splev(kprime, splrep(ks, pk_smooth_lin))
+                pk_smooth = kaiser_prefac**2 * splev(kprime, tck_smooth)
             else:
                 ktile = np.tile(k, (self.nmu, 1)).T
                 fog = 1.0 / (1.0 + muprime**2 * ktile**2 * p["sigma_s"] ** 2 / 2.0) ** 2
-                reconfac = splev(ktile, splrep(self.camb.ks, self.camb.smoothing_kernel)) if self.recon_type.lower() == "iso" else 0.0
+                reconfac = splev(ktile, self.get_smoothing_kernel_spline()) if self.recon_type.lower() == "iso" else 0.0
                 kaiser_prefac = 1.0 + p["beta"] * muprime**2 * (1.0 - reconfac)
-                pk_smooth = kaiser_prefac**2 * splev(ktile, splrep(ks, pk_smooth_lin))
+                pk_smooth = kaiser_prefac**2 * splev(ktile, tck_smooth)
 
             if not for_corr:
                 pk_smooth *= p["b{0}"]
@@ -163,7 +163,7 @@ class PowerBeutler2017(PowerSpectrumFit):
                 pk2d = pk_smooth * fog
             else:
                 C = np.exp(-0.5 * kprime**2 * (muprime**2 * p["sigma_nl_par"] ** 2 + (1.0 - muprime**2) * p["sigma_nl_perp"] ** 2))
-                pk2d = pk_smooth * (fog + splev(kprime, splrep(ks, pk_ratio)) * C)
+                pk2d = pk_smooth * (fog + splev(kprime, tck_ratio) * C)
 
             pk0, pk2, pk4 = self.integrate_mu(pk2d)
 
@@ -183,6 +183,63 @@ class PowerBeutler2017(PowerSpectrumFit):
 
         return kprime, pk, poly
 
+    @profile("compute_power_spectrum_batch")
+    def compute_power_spectrum_batch(self, k, ps, smooth=False, for_corr=False, data_name=None, nopoly=False):
+        """Computes the anisotropic Beutler et. al., 2017 power spectrum model for many parameter locations at once, with
+        the dilation, damping and Legendre projection evaluated over a leading batch axis. See `compute_power_spectrum`
+        for the parameters, and `PowerSpectrumFit.compute_power_spectrum_batch` for the shapes returned.
+        """
+        if self.isotropic or not self.dilate_smooth or len({p["om"] for p in ps}) > 1:
+            return super().compute_power_spectrum_batch(k, ps, smooth=smooth, for_corr=for_corr, data_name=data_name, nopoly=nopoly)
+
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(ps[0]["om"])
+        if not for_corr:
+            ps = [p if "b{0}" in p else self.deal_with_ndata(p, 0) for p in ps]
+        names = ["alpha", "beta", "sigma_s", "sigma_nl_par", "sigma_nl_perp"]
+        values = {name: np.array([p[name] for p in ps]) for name in names + ([] if for_corr else ["epsilon", "b{0}"])}
+        alpha, beta, sigma_s, sigma_nl_par, sigma_nl_perp = [values[name][:, None, None] for name in names]
+
+        if for_corr:
+            kprime, muprime = np.broadcast_to(k[None, :, None], (len(ps), len(k), self.nmu)), self.mu
+        else:
+            kprime, muprime = self.get_dilation_batch(k, values["alpha"], values["epsilon"])
+        # Evaluate all the splines at the dilated k values together, as they are usually fit on the same k values
+        tcks = [tck_smooth] + ([] if smooth else [tck_ratio])
+        if self.recon_type.lower() == "iso":
+            tcks.append(self.get_smoothing_kernel_spline())
+        splines = splev_many(kprime, tcks)
+
+        fog = 1.0 / (1.0 + muprime**2 * kprime**2 * sigma_s**2 / 2.0) ** 2
+        reconfac = splines[-1] if self.recon_type.lower() == "iso" else 0.0
+        kaiser_prefac = 1.0 + beta * muprime**2 * (1.0 - reconfac)
+        pk_smooth = kaiser_prefac**2 * splines[0]
+        if not for_corr:
+            pk_smooth *= values["b{0}"][:, None, None]
+
+        # Volume factor
+        pk_smooth /= alpha**3
+
+        # Compute the propagator
+        if smooth:
+            pk2d = pk_smooth * fog
+        else:
+            C = np.exp(-0.5 * kprime**2 * (muprime**2 * sigma_nl_par**2 + (1.0 - muprime**2) * sigma_nl_perp**2))
+            pk2d = pk_smooth * (fog + splines[1] * C)
+
+        pk0, pk2, pk4 = self.integrate_mu(pk2d)
+        zeros = np.zeros(pk0.shape)
+        pk = np.stack([pk0, zeros, pk2, zeros, pk4, zeros], axis=1)
+
+        if for_corr or nopoly:
+            return np.broadcast_to(k, (len(ps), len(k))), pk, None
+
+        shape, poly = self.add_poly_batch(k, ps, pk)
+        if self.marg:
+            pk = np.zeros(pk.shape)
+        else:
+            pk += shape
+        return kprime, pk, poly
+
 
 if __name__ == "__main__":
     import sys
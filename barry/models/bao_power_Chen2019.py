@@ -1,10 +1,10 @@
 import logging
-from functools import lru_cache
 import numpy as np
 from scipy import integrate
 from scipy.special import jn
 from barry.models.bao_power import PowerSpectrumFit
 from scipy.interpolate import splev, splrep
+from barry.profiling import profile
 
 
 class PowerChen2019(PowerSpectrumFit):
@@ -30,6 +30,7 @@ class PowerChen2019(PowerSpectrumFit):
         n_data=1,
         data_share_bias=False,
         data_share_poly=False,
+        mu_quadrature=None,
     ):
 
         self.marg_bias = False
@@ -49,6 +50,7 @@ class PowerChen2019(PowerSpectrumFit):
             n_data=n_data,
             data_share_bias=data_share_bias,
             data_share_poly=data_share_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         if self.recon_type == "ani":
@@ -75,143 +77,6 @@ class PowerChen2019(PowerSpectrumFit):
             "sigma_sd_ss": integrate.simps(pk_lin * 0.5 * s**2, ks) / (6.0 * np.pi**2),
         }
 
-    @lru_cache(maxsize=4)
-    def get_damping(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_dd(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma_dd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_sd(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma_sd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_sd_iso(self, growth, om):
-        inner = (
-            (1.0 + (2.0 + growth) * growth * self.mu**2) * self.get_pregen("sigma_sd_dd", om)
-            + (1.0 + growth * self.mu**2) * self.get_pregen("sigma_sd_sd", om)
-            + self.get_pregen("sigma_sd_ss", om)
-        )
-        return np.exp(-np.outer(inner, self.camb.ks**2))
-
-    @lru_cache(maxsize=4)
-    def get_damping_ss(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma_ss_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_dd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_dd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_sd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_sd_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_dd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_sd_dd", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_dd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_sd_dd", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_sd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + growth) * ks**2, self.mu**2) * self.get_pregen("sigma_sd_sd", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_sd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_sd_sd", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_ss_par(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, self.mu**2) * self.get_pregen("sigma_sd_ss", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_sd_ss_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_sd_ss", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_ss_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_ss_nl", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_ss_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_ss_nl", om))
-
     def declare_parameters(self):
         super().declare_parameters()
         self.add_param("beta", r"$\beta$", 0.01, 1.0, None)  # Growth rate of structure
@@ -221,6 +86,7 @@ class PowerChen2019(PowerSpectrumFit):
                 for ip in range(self.n_poly):
                     self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{i+1}}}", f"$a_{{{pole}}},{{{ip+1}}},{{{i+1}}}$", -20000.0, 20000.0, 0)
 
+    @profile("compute_power_spectrum")
     def compute_power_spectrum(self, k, p, smooth=False, for_corr=False, data_name=None, nopoly=False):
         """Computes the power spectrum model using the Ding et. al., 2018 EFT0 propagator
 
@@ -257,6 +123,7 @@ class PowerChen2019(PowerSpectrumFit):
         else:
             ks = self.kvals
             pk_smooth_lin, pk_ratio = self.pksmooth, self.pkratio
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(p["om"])
 
         if not for_corr:
             if "b{0}" not in p:
@@ -283,10 +150,20 @@ class PowerChen2019(PowerSpectrumFit):
                 growth = np.round(bias * p["beta"], decimals=5)
 
                 # Compute the BAO damping
+                engine = self.get_damping_engine(data_name)
+                kaiser = (2.0 + growth) * growth * engine.mu2
                 if self.recon:
-                    damping_dd = self.get_damping_dd(growth, om)
-                    damping_sd = self.get_damping_sd_iso(growth, om) if self.recon_type == "iso" else self.get_damping_sd(growth, om)
-                    damping_ss = self.get_damping_ss(growth, om)
+                    damping_dd = engine.get_damping("dd", (1.0 + kaiser) * self.get_pregen("sigma_dd_nl", om))
+                    if self.recon_type == "iso":
+                        sd = (
+                            (1.0 + kaiser) * self.get_pregen("sigma_sd_dd", om)
+                            + (1.0 + growth * engine.mu2) * self.get_pregen("sigma_sd_sd", om)
+                            + self.get_pregen("sigma_sd_ss", om)
+                        )
+                    else:
+                        sd = (1.0 + kaiser) * self.get_pregen("sigma_sd_nl", om)
+                    damping_sd = engine.get_damping("sd", sd)
+                    damping_ss = engine.get_damping("ss", (1.0 + kaiser) * self.get_pregen("sigma_ss_nl", om))
 
                     dd_prefac = (
                         1.0 + np.outer(p["beta"] * self.mu**2, 1.0 - self.camb.smoothing_kernel) - self.camb.smoothing_kernel / bias
@@ -299,23 +176,23 @@ class PowerChen2019(PowerSpectrumFit):
                     sd_prefac = dd_prefac * ss_prefac
                     propagator = dd_prefac**2 * damping_dd + 2.0 * sd_prefac * damping_sd + ss_prefac**2 * damping_ss
                 else:
-                    damping = self.get_damping(growth, om)
+                    damping = engine.get_damping("nl", (1.0 + kaiser) * self.get_pregen("sigma_nl", om))
                     kaiser_prefac = 1.0 + np.tile(p["beta"] * self.mu**2, (len(ks), 1)).T
                     propagator = kaiser_prefac**2 * damping
 
             if smooth:
                 prefac = np.ones(len(kprime))
             else:
-                prefac = splev(kprime, splrep(ks, integrate.simps((fog + pk_ratio * propagator), self.mu, axis=0)))
+                prefac = splev(kprime, splrep(ks, self.mu_weights[:, 0] @ (fog + pk_ratio * propagator)))
 
             if for_corr or nopoly:
                 poly = None
-                pk1d = integrate.simps(pk_smooth * (fog + pk_ratio * propagator), self.mu, axis=0)
+                pk1d = self.mu_weights[:, 0] @ (pk_smooth * (fog + pk_ratio * propagator))
             else:
                 shape, poly = self.add_poly(ks, k, p, prefac, np.zeros(len(k)))
                 if self.marg:
                     poly = poly[1:]  # Remove the bias marginalisation.
-                pk1d = integrate.simps((pk_smooth + shape) * (fog + pk_ratio * propagator), self.mu, axis=0)
+                pk1d = self.mu_weights[:, 0] @ ((pk_smooth + shape) * (fog + pk_ratio * propagator))
 
             pk[0] = splev(kprime, splrep(ks, pk1d))
 
@@ -328,10 +205,10 @@ class PowerChen2019(PowerSpectrumFit):
             om = np.round(p["om"], decimals=5)
             growth = np.round(p["b{0}"] * p["beta"], decimals=5)
 
-            sprime = splev(kprime, splrep(ks, self.camb.smoothing_kernel)) if self.recon else 0.0
+            sprime = splev(kprime, self.get_smoothing_kernel_spline()) if self.recon else 0.0
 
             fog = 1.0 / (1.0 + muprime**2 * kprime**2 * p["sigma_s"] ** 2 / 2.0) ** 2
-            pk_smooth = splev(kprime, splrep(ks, pk_smooth_lin))
+            pk_smooth = splev(kprime, tck_smooth)
 
             # Volume factor
             pk_smooth /= p["alpha"] ** 3
@@ -342,33 +219,23 @@ class PowerChen2019(PowerSpectrumFit):
                 # Compute the BAO damping
                 power_par = 1.0 / (p["alpha"] ** 2 * (1.0 + epsilon) ** 4)
                 power_perp = (1.0 + epsilon) ** 2 / p["alpha"] ** 2
+                engine = self.get_damping_engine(data_name)
+                kaiser = 1.0 + (2.0 + growth) * growth
                 if self.recon:
-                    damping_dd = (
-                        self.get_damping_aniso_dd_par(growth, om, data_name=data_name) ** power_par
-                        * self.get_damping_aniso_dd_perp(om, data_name=data_name) ** power_perp
-                    )
+                    sigma = self.get_pregen("sigma_dd_nl", om)
+                    damping_dd = engine.get_damping("dd", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
                     if self.recon_type == "iso":
-                        damping_sd = (
-                            self.get_damping_aniso_sd_dd_par(growth, om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_sd_dd_perp(om, data_name=data_name) ** power_perp
-                            * self.get_damping_aniso_sd_sd_par(growth, om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_sd_sd_perp(om, data_name=data_name) ** power_perp
-                            * self.get_damping_aniso_sd_ss_par(om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_sd_ss_perp(om, data_name=data_name) ** power_perp
-                        )
-                        damping_ss = (
-                            self.get_damping_aniso_ss_par(0.0, om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_ss_perp(om, data_name=data_name) ** power_perp
-                        )
+                        sigma_dd, sigma_sd, sigma_ss = [self.get_pregen(f"sigma_sd_{n}", om) for n in ["dd", "sd", "ss"]]
+                        par = kaiser * sigma_dd + (1.0 + growth) * sigma_sd + sigma_ss
+                        perp = sigma_dd + sigma_sd + sigma_ss
+                        damping_sd = engine.get_damping("sd", engine.get_coefficient(power_par * par, power_perp * perp))
+                        sigma = self.get_pregen("sigma_ss_nl", om)
+                        damping_ss = engine.get_damping("ss", engine.get_coefficient(power_par * sigma, power_perp * sigma))
                     else:
-                        damping_sd = (
-                            self.get_damping_aniso_sd_par(growth, om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_sd_perp(om, data_name=data_name) ** power_perp
-                        )
-                        damping_ss = (
-                            self.get_damping_aniso_ss_par(growth, om, data_name=data_name) ** power_par
-                            * self.get_damping_aniso_ss_perp(om, data_name=data_name) ** power_perp
-                        )
+                        sigma = self.get_pregen("sigma_sd_nl", om)
+                        damping_sd = engine.get_damping("sd", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
+                        sigma = self.get_pregen("sigma_ss_nl", om)
+                        damping_ss = engine.get_damping("ss", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
 
                     # Compute propagator
                     dd_prefac = p["b{0}"] + growth * muprime**2 * (1.0 - sprime) - sprime
@@ -377,16 +244,14 @@ class PowerChen2019(PowerSpectrumFit):
                     broadband = (dd_prefac + ss_prefac) ** 2 * fog
                 else:
                     dd_prefac = p["b{0}"] + growth * muprime**2
-                    damping = (
-                        self.get_damping_aniso_par(growth, om, data_name=data_name) ** power_par
-                        * self.get_damping_aniso_perp(om, data_name=data_name) ** power_perp
-                    )
+                    sigma = self.get_pregen("sigma_nl", om)
+                    damping = engine.get_damping("nl", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
 
                     # Compute propagator
                     propagator = dd_prefac**2 * damping
                     broadband = dd_prefac**2 * fog
 
-                pk2d = pk_smooth * (broadband + splev(kprime, splrep(ks, pk_ratio)) * propagator)
+                pk2d = pk_smooth * (broadband + splev(kprime, tck_ratio) * propagator)
 
             pk0, pk2, pk4 = self.integrate_mu(pk2d)
 
@@ -9,6 +9,7 @@ from scipy.special import jn
 from barry.cosmology.power_spectrum_smoothing import smooth_func
 from barry.models.bao_power import PowerSpectrumFit
 from barry.cosmology.camb_generator import Omega_m_z
+from barry.profiling import profile
 
 
 class PowerNoda2019(PowerSpectrumFit):
@@ -23,7 +24,7 @@ class PowerNoda2019(PowerSpectrumFit):
         name="Pk Noda 2019",
         fix_params=("om", "f", "gamma"),
         gammaval=None,
-        smooth_type="hinton2017",
+        smooth_type=None,
         nonlinear_type="spt",
         recon=None,
         postprocess=None,
@@ -31,6 +32,7 @@ class PowerNoda2019(PowerSpectrumFit):
         correction=None,
         isotropic=True,
         n_data=1,
+        mu_quadrature=None,
     ):
         self.recon = recon
         if gammaval is None:
@@ -52,6 +54,7 @@ class PowerNoda2019(PowerSpectrumFit):
             n_poly=0,
             n_data=n_data,
             data_share_poly=False,
+            mu_quadrature=mu_quadrature,
         )
 
         if self.recon_type == "ani":
@@ -66,7 +69,7 @@ class PowerNoda2019(PowerSpectrumFit):
         self.set_marg(fix_params, [], 0, do_bias=True)
 
     def get_unique_cosmo_name(self):
-        return self.__class__.__name__ + "_" + self.camb.filename_unique + "_" + self.smooth_type + ".pkl"
+        return self.__class__.__name__ + "_" + self.camb.filename_unique + "_" + self.smooth_type["method"] + ".pkl"
 
     def precompute(self, camb, om, h0):
 
@@ -86,9 +89,9 @@ class PowerNoda2019(PowerSpectrumFit):
         # Get the smoothed linear power spectrum which we need to calculate the
         # BAO damping and SPT integrals used in the Noda2017 model
 
-        pk_smooth_lin = smooth(ks, pk_lin, method=self.smooth_type, om=om, h0=h0)
-        pk_smooth_nonlin_0 = smooth(ks, pk_nonlin_0, method=self.smooth_type, om=om, h0=h0)
-        pk_smooth_nonlin_z = smooth(ks, pk_nonlin_z, method=self.smooth_type, om=om, h0=h0)
+        pk_smooth_lin = smooth_func(ks, pk_lin, om=om, h0=h0, **self.smooth_type)
+        pk_smooth_nonlin_0 = smooth_func(ks, pk_nonlin_0, om=om, h0=h0, **self.smooth_type)
+        pk_smooth_nonlin_z = smooth_func(ks, pk_nonlin_z, om=om, h0=h0, **self.smooth_type)
         pk_smooth_spline = splrep(ks, pk_smooth_lin)
 
         # Sigma^2_dd,rs, Sigma^2_ss,rs (Noda2019 model)
@@ -212,41 +215,6 @@ class PowerNoda2019(PowerSpectrumFit):
             logging.getLogger("barry").error(f"Smoothing method is {self.nonlinear_type} and not in list {types}")
             return False
 
-    @lru_cache(maxsize=32)
-    def get_damping(self, growth, om, gamma):
-        return np.exp(
-            -np.outer(
-                (1.0 + (2.0 + growth) * growth * self.mu**2) * self.get_pregen("sigma_dd_rs", om)
-                + (growth * self.mu**2 * (self.mu**2 - 1.0)) * self.get_pregen("sigma_ss_rs", om),
-                self.camb.ks**2,
-            )
-            / gamma
-        )
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_dd_rs", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_dd_rs", om))
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_ss_perp(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(np.outer(growth * ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_ss_rs", om))
-
     @lru_cache(maxsize=32)
     def get_nonlinear(self, growth, om):
         return (
@@ -269,6 +237,7 @@ class PowerNoda2019(PowerSpectrumFit):
         self.add_param("gamma", r"$\gamma_{rec}$", 1.0, 8.0, 1.0)  # Describes the sharpening of the BAO post-reconstruction
         self.add_param("A", r"$A$", -10, 30.0, 10)  # Fingers-of-god damping
 
+    @profile("compute_power_spectrum")
     def compute_power_spectrum(self, k, p, smooth=False, for_corr=False, data_name=None):
         """Computes the power spectrum model using the model from Noda et. al., 2019
 
@@ -305,6 +274,7 @@ class PowerNoda2019(PowerSpectrumFit):
         else:
             ks = self.kvals
             pk_smooth_lin, pk_ratio = self.pksmooth, self.pkratio
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(p["om"])
 
         if self.isotropic:
 
@@ -334,11 +304,15 @@ class PowerNoda2019(PowerSpectrumFit):
 
             # Integrate over mu
             if smooth:
-                pk1d = integrate.simps(pk_smooth * (kaiser_prefac**2 + pk_nonlinear), self.mu, axis=0)
+                pk1d = self.mu_weights[:, 0] @ (pk_smooth * (kaiser_prefac**2 + pk_nonlinear))
             else:
                 # Compute the BAO damping/propagator
-                propagator = self.get_damping(growth, om, gamma)
-                pk1d = integrate.simps(pk_smooth * ((1.0 + pk_ratio * propagator) * kaiser_prefac**2 + pk_nonlinear), self.mu, axis=0)
+                engine = self.get_damping_engine(data_name)
+                coefficient = (1.0 + (2.0 + growth) * growth * engine.mu2) * self.get_pregen("sigma_dd_rs", om) + (
+                    growth * engine.mu2 * (engine.mu2 - 1.0)
+                ) * self.get_pregen("sigma_ss_rs", om)
+                propagator = engine.get_damping("propagator", coefficient / gamma)
+                pk1d = self.mu_weights[:, 0] @ (pk_smooth * ((1.0 + pk_ratio * propagator) * kaiser_prefac**2 + pk_nonlinear))
 
             poly = np.zeros((1, len(k)))
             pk[0] = splev(kprime, splrep(ks, pk1d))
@@ -348,7 +322,7 @@ class PowerNoda2019(PowerSpectrumFit):
             kprime = np.outer(k / p["alpha"], self.get_kprimefac(epsilon))
             muprime = self.get_muprime(epsilon)
             fog = np.exp(-p["A"] * muprime**2 * kprime**2)
-            pk_smooth = p["b{0}"] ** 2 * splev(kprime, splrep(ks, pk_smooth_lin)) * fog
+            pk_smooth = p["b{0}"] ** 2 * splev(kprime, tck_smooth) * fog
 
             # Volume factor
             pk_smooth /= p["alpha"] ** 3
@@ -359,7 +333,7 @@ class PowerNoda2019(PowerSpectrumFit):
             gamma = np.round(p["gamma"], decimals=5)
 
             if self.recon:
-                sprime = splev(kprime, splrep(ks, self.camb.smoothing_kernel))
+                sprime = splev(kprime, self.get_smoothing_kernel_spline())
                 kaiser_prefac = 1.0 + p["beta"] * muprime**2 * (1.0 - sprime)
             else:
                 kaiser_prefac = 1.0 + p["beta"] * muprime**2
@@ -378,12 +352,12 @@ class PowerNoda2019(PowerSpectrumFit):
                 # Compute the BAO damping
                 power_par = 1.0 / (p["alpha"] ** 2 * (1.0 + epsilon) ** 4 * gamma)
                 power_perp = (1.0 + epsilon) ** 2 / (p["alpha"] ** 2 * gamma)
-                propagator = (
-                    self.get_damping_aniso_dd_par(growth, om, data_name=data_name) ** power_par
-                    * self.get_damping_aniso_dd_perp(om, data_name=data_name) ** power_perp
-                    * self.get_damping_aniso_ss_perp(growth, om, data_name=data_name) ** (power_perp * muprime**2)
-                )
-                pk2d = pk_smooth * ((1.0 + splev(kprime, splrep(ks, pk_ratio)) * propagator) * kaiser_prefac**2 + pk_nonlinear)
+                engine = self.get_damping_engine(data_name)
+                sigma_dd, sigma_ss = self.get_pregen("sigma_dd_rs", om), self.get_pregen("sigma_ss_rs", om)
+                par = power_par * (1.0 + (2.0 + growth) * growth) * sigma_dd
+                perp = power_perp * (sigma_dd - growth * sigma_ss * muprime**2)
+                propagator = engine.get_damping("propagator", engine.get_coefficient(par, perp))
+                pk2d = pk_smooth * ((1.0 + splev(kprime, tck_ratio) * propagator) * kaiser_prefac**2 + pk_nonlinear)
 
             pk0, pk2, pk4 = self.integrate_mu(pk2d)
 
@@ -4,6 +4,7 @@ import numpy as np
 from scipy import integrate
 from barry.models.bao_power import PowerSpectrumFit
 from scipy.interpolate import splev, splrep
+from barry.profiling import profile
 
 
 class PowerSeo2016(PowerSpectrumFit):
@@ -28,6 +29,7 @@ class PowerSeo2016(PowerSpectrumFit):
         n_data=1,
         data_share_bias=False,
         data_share_poly=False,
+        mu_quadrature=None,
     ):
 
         self.marg_bias = False
@@ -46,6 +48,7 @@ class PowerSeo2016(PowerSpectrumFit):
             n_data=n_data,
             data_share_bias=data_share_bias,
             data_share_poly=data_share_poly,
+            mu_quadrature=mu_quadrature,
         )
 
         if self.recon_type == "sym" or self.recon_type == "ani":
@@ -101,66 +104,6 @@ class PowerSeo2016(PowerSpectrumFit):
     def get_pt_data(self, om):
         return self.PT.get_data(om=om)
 
-    @lru_cache(maxsize=4)
-    def get_damping(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_dd(self, growth, om):
-        return np.exp(-np.outer(1.0 + (2.0 + growth) * growth * self.mu**2, self.camb.ks**2) * self.get_pregen("sigma_dd", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_ss(self, om):
-        return np.exp(-np.tile(self.camb.ks**2, (self.nmu, 1)) * self.get_pregen("sigma_ss", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_par(self, growth, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer((1.0 + (2.0 + growth) * growth) * ks**2, self.mu**2) * self.get_pregen("sigma_dd", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_dd_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_dd", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_ss_par(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, self.mu**2) * self.get_pregen("sigma_ss", om) / 2.0)
-
-    @lru_cache(maxsize=4)
-    def get_damping_aniso_ss_perp(self, om, data_name=None):
-        if data_name is None:
-            ks = self.camb.ks
-        else:
-            ks = self.data_dict[data_name]["ks_input"]
-        return np.exp(-np.outer(ks**2, 1.0 - self.mu**2) * self.get_pregen("sigma_ss", om) / 2.0)
-
     def declare_parameters(self):
         super().declare_parameters()
         self.add_param("beta", r"$\beta$", 0.01, 4.0, None)  # RSD parameter f/b
@@ -170,6 +113,7 @@ class PowerSeo2016(PowerSpectrumFit):
                 for ip in range(self.n_poly):
                     self.add_param(f"a{{{pole}}}_{{{ip+1}}}_{{{i+1}}}", f"$a_{{{pole}}},{{{ip+1}}},{{{i+1}}}$", -20000.0, 20000.0, 0)
 
+    @profile("compute_power_spectrum")
     def compute_power_spectrum(self, k, p, smooth=False, for_corr=False, data_name=None, nopoly=False):
         """Computes the power spectrum model using the Seo et. al., 2016 method
 
@@ -203,6 +147,7 @@ class PowerSeo2016(PowerSpectrumFit):
         else:
             ks = self.kvals
             pk_smooth_lin, pk_ratio = self.pksmooth, self.pkratio
+        tck_smooth, tck_ratio = self.get_basic_power_spectrum_splines(p["om"])
 
         if not for_corr:
             if "b{0}" not in p:
@@ -230,16 +175,18 @@ class PowerSeo2016(PowerSpectrumFit):
                 growth = np.round(p["beta"] * p["b{0}"], decimals=5)
 
                 # Compute the BAO damping
+                engine = self.get_damping_engine(data_name)
+                kaiser = (2.0 + growth) * growth * engine.mu2
                 if self.recon:
-                    damping_dd = self.get_damping_dd(growth, om)
-                    damping_ss = self.get_damping_ss(om)
+                    damping_dd = engine.get_damping("dd", (1.0 + kaiser) * self.get_pregen("sigma_dd", om) / 2.0)
+                    damping_ss = engine.get_damping("ss", self.get_pregen("sigma_ss", om) / 2.0)
 
                     # Compute propagator
                     smooth_prefac = np.tile(self.camb.smoothing_kernel / p["b{0}"], (self.nmu, 1))
                     kaiser_prefac = 1.0 + np.outer(p["beta"] * self.mu**2, 1.0 - self.camb.smoothing_kernel)
                     propagator = (kaiser_prefac * damping_dd + smooth_prefac * (damping_ss - damping_dd)) ** 2
                 else:
-                    damping = self.get_damping(growth, om)
+                    damping = engine.get_damping("nl", (1.0 + kaiser) * self.get_pregen("sigma", om) / 2.0)
 
                     prefac_k = 1.0 + np.tile(
                         3.0 / 7.0 * (self.get_pregen("R1", om) * (1.0 - 4.0 / (9.0 * p["b{0}"])) + self.get_pregen("R2", om)), (self.nmu, 1)
@@ -255,16 +202,16 @@ class PowerSeo2016(PowerSpectrumFit):
             if smooth:
                 prefac = np.ones(len(kprime))
             else:
-                prefac = splev(kprime, splrep(ks, integrate.simps((fog + pk_ratio * propagator), self.mu, axis=0)))
+                prefac = splev(kprime, splrep(ks, self.mu_weights[:, 0] @ (fog + pk_ratio * propagator)))
 
             if for_corr or nopoly:
                 poly = None
-                pk1d = integrate.simps(pk_smooth * (fog + pk_ratio * propagator), self.mu, axis=0)
+                pk1d = self.mu_weights[:, 0] @ (pk_smooth * (fog + pk_ratio * propagator))
             else:
                 shape, poly = self.add_poly(ks, k, p, prefac, np.zeros(len(k)))
                 if self.marg:
                     poly = poly[1:]  # Remove the bias marginalisation.
-                pk1d = integrate.simps((pk_smooth + shape) * (fog + pk_ratio * propagator), self.mu, axis=0)
+                pk1d = self.mu_weights[:, 0] @ ((pk_smooth + shape) * (fog + pk_ratio * propagator))
 
             pk[0] = splev(kprime, splrep(ks, pk1d))
 
@@ -278,10 +225,10 @@ class PowerSeo2016(PowerSpectrumFit):
             om = np.round(p["om"], decimals=5)
             growth = np.round(p["beta"] * p["b{0}"], decimals=5)
 
-            sprime = splev(kprime, splrep(ks, self.camb.smoothing_kernel)) if self.recon else 0.0
+            sprime = splev(kprime, self.get_smoothing_kernel_spline()) if self.recon else 0.0
             kaiser_prefac = 1.0 + growth / p["b{0}"] * muprime**2 * (1.0 - sprime)
 
-            pk_smooth = p["b{0}"] ** 2 * kaiser_prefac**2 * splev(kprime, splrep(ks, pk_smooth_lin))
+            pk_smooth = p["b{0}"] ** 2 * kaiser_prefac**2 * splev(kprime, tck_smooth)
 
             # Volume factor
             pk_smooth /= p["alpha"] ** 3
@@ -292,27 +239,24 @@ class PowerSeo2016(PowerSpectrumFit):
                 # Compute the BAO damping
                 power_par = 1.0 / (p["alpha"] ** 2 * (1.0 + epsilon) ** 4)
                 power_perp = (1.0 + epsilon) ** 2 / p["alpha"] ** 2
+                engine = self.get_damping_engine(data_name)
+                kaiser = 1.0 + (2.0 + growth) * growth
                 if self.recon:
-                    damping_dd = (
-                        self.get_damping_aniso_dd_par(growth, om, data_name=data_name) ** power_par
-                        * self.get_damping_aniso_dd_perp(om, data_name=data_name) ** power_perp
-                    )
-                    damping_ss = (
-                        self.get_damping_aniso_ss_par(om, data_name=data_name) ** power_par
-                        * self.get_damping_aniso_ss_perp(om, data_name=data_name) ** power_perp
-                    )
+                    sigma = self.get_pregen("sigma_dd", om) / 2.0
+                    damping_dd = engine.get_damping("dd", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
+                    sigma = self.get_pregen("sigma_ss", om) / 2.0
+                    damping_ss = engine.get_damping("ss", engine.get_coefficient(power_par * sigma, power_perp * sigma))
 
                     # Compute propagator
                     smooth_prefac = sprime / p["b{0}"]
                     propagator = (damping_dd + smooth_prefac / kaiser_prefac * (damping_ss - damping_dd)) ** 2
                 else:
-                    damping = (
-                        self.get_damping_aniso_par(growth, om, data_name=data_name) ** power_par
-                        * self.get_damping_aniso_perp(om, data_name=data_name) ** power_perp
-                    )
+                    sigma = self.get_pregen("sigma", om) / 2.0
+                    damping = engine.get_damping("nl", engine.get_coefficient(power_par * kaiser * sigma, power_perp * sigma))
 
-                    R1_kprime = splev(kprime, splrep(ks, self.get_pregen("R1", om)))
-                    R2_kprime = splev(kprime, splrep(ks, self.get_pregen("R2", om)))
+                    key = (om, self.camb.filename_unique)
+                    R1_kprime = splev(kprime, self.get_spline("R1", key, lambda: (ks, self.get_pregen("R1", om))))
+                    R2_kprime = splev(kprime, self.get_spline("R2", key, lambda: (ks, self.get_pregen("R2", om))))
 
                     prefac_k = 3.0 / 7.0 * (R1_kprime * (1.0 - 4.0 / (9.0 * p["b{0}"])) + R2_kprime)
                     prefac_mu = muprime**2 * (
@@ -320,7 +264,7 @@ class PowerSeo2016(PowerSpectrumFit):
                     )
                     propagator = ((1.0 + prefac_k / kaiser_prefac + prefac_mu / kaiser_prefac) * damping) ** 2
 
-                pk2d = pk_smooth * (fog + splev(kprime, splrep(ks, pk_ratio)) * propagator)
+                pk2d = pk_smooth * (fog + splev(kprime, tck_ratio) * propagator)
 
             pk0, pk2, pk4 = self.integrate_mu(pk2d)
 
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class DampingEngine:
+    """Evaluates the Gaussian BAO damping kernels used by the power spectrum models, exp(-k^2 * c(mu)),
+    for a fixed set of k and mu values.
+
+    The k^2 and mu^2 factors are computed once, and each named damping term is evaluated straight into its own reusable
+    buffer. A term is only recomputed when its coefficients change, so fits with a fixed growth rate (and alpha, epsilon
+    for anisotropic fits) reuse the previous kernel.
+
+    Parameters
+    ----------
+    ks : np.ndarray
+        The wavenumbers to evaluate the damping at
+    mu : np.ndarray
+        The mu values to evaluate the damping at
+    k_first : bool, optional
+        If True (default), kernels have shape (nk, nmu) as for the anisotropic models, otherwise (nmu, nk).
+    """
+
+    def __init__(self, ks, mu, k_first=True):
+        self.ks = ks
+        self.k2 = ks**2
+        self.mu2 = mu**2
+        self.k_first = k_first
+        self.shape = (len(ks), len(mu)) if k_first else (len(mu), len(ks))
+        self.buffers = {}
+        self.keys = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_coefficient(self, par, perp):
+        """Gets the damping coefficient at each mu, c(mu) = par * mu^2 + perp * (1 - mu^2), for the damping scales along and
+        perpendicular to the line-of-sight. Either can be an array over mu."""
+        return par * self.mu2 + perp * (1.0 - self.mu2)
+
+    def get_damping(self, name, coefficient):
+        """Gets the damping kernel exp(-k^2 * c(mu)) for a named term
+
+        Parameters
+        ----------
+        name : str
+            The name of the damping term, e.g. 'dd'. Each name has its own buffer.
+        coefficient : float, np.ndarray
+            The coefficient c(mu), either a single value or one per mu
+
+        Returns
+        -------
+        damping : np.ndarray
+            The damping kernel. This is the buffer for the named term, so is only valid until the next call with the same
+            name, and must not be modified.
+        """
+        coefficient = np.broadcast_to(np.asarray(coefficient, dtype=float), self.mu2.shape)
+        key = coefficient.tobytes()
+        if self.keys.get(name) == key:
+            self.hits += 1
+            return self.buffers[name]
+
+        self.misses += 1
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = np.empty(self.shape)
+        if self.k_first:
+            np.multiply.outer(self.k2, -coefficient, out=buffer)
+        else:
+            np.multiply.outer(-coefficient, self.k2, out=buffer)
+        np.exp(buffer, out=buffer)
+        self.keys[name] = key
+        return buffer
+
+    def get_cache_info(self):
+        """Returns the hits, misses and number of buffered damping terms"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.buffers)}
@@ -8,6 +8,7 @@ from numpy.random import uniform, normal
 import numpy as np
 from scipy.stats import truncnorm
 from scipy.special import loggamma
+from scipy.linalg import solve_triangular
 from scipy.optimize import basinhopping, differential_evolution
 from enum import Enum, unique
 from dataclasses import dataclass
@@ -15,6 +16,8 @@ from functools import lru_cache
 
 
 from barry.cosmology.camb_generator import Omega_m_z, getCambGenerator
+from barry.profiling import profile
+from barry.models.template import TemplateGrid
 
 
 @dataclass
@@ -29,6 +32,84 @@ class Param:
     active: bool
 
 
+class ParameterLayout:
+    """A compiled, array based view of a list of parameters, used to scale, unscale and compute priors
+    for the active parameters without looping over them. Built by `Model.get_layout` and rebuilt whenever
+    the parameters, their defaults or which of them are fixed change.
+
+    Parameters
+    ----------
+    params : list[Param]
+        The parameters of the model, in order
+    """
+
+    def __init__(self, params):
+        self.params = list(params)
+        self.active = [p for p in self.params if p.active]
+        self.inactive = [p for p in self.params if not p.active]
+        self.names = [p.name for p in self.active]
+        self.active_index = np.array([i for i, p in enumerate(self.params) if p.active], dtype=int)
+        self.index = {p.name: i for i, p in enumerate(self.active)}
+        self.fixed = OrderedDict([(p.name, p.default) for p in self.inactive])
+
+        self.mins = np.array([p.min for p in self.active], dtype=float)
+        self.maxes = np.array([p.max for p in self.active], dtype=float)
+        self.defaults = np.array([p.default for p in self.active], dtype=float)
+        self.sigmas = np.array([p.sigma for p in self.active], dtype=float)
+        self.gaussian = np.array([p.prior == "gaussian" for p in self.active], dtype=bool)
+        self.flat = ~self.gaussian
+
+        # The bounds of the truncated gaussians in units of sigma, as used by scipy.stats.truncnorm
+        sigmas = self.sigmas[self.gaussian]
+        self.lower = (self.mins[self.gaussian] - self.defaults[self.gaussian]) / sigmas
+        self.upper = (self.maxes[self.gaussian] - self.defaults[self.gaussian]) / sigmas
+
+    def get_prior(self, params):
+        """The log prior of the active parameter values, flat or truncated gaussian for each parameter.
+
+        Parameters
+        ----------
+        params : np.ndarray
+            The values of the active parameters, with shape (num_dim,) or (N, num_dim)
+
+        Returns
+        -------
+        log_prior : float, np.ndarray
+            The log prior, -np.inf where a parameter falls outside its bounds. An array of shape (N,) for batched input.
+        """
+        params = np.asarray(params, dtype=float)
+        log_prior = -0.5 * np.sum(((params[..., self.gaussian] - self.defaults[self.gaussian]) / self.sigmas[self.gaussian]) ** 2, axis=-1)
+        log_prior = np.where(np.any((params < self.mins) | (params > self.maxes), axis=-1), -np.inf, log_prior)
+        return log_prior if params.ndim > 1 else float(log_prior)
+
+    def scale(self, params):
+        """Scale active parameter values, with shape (num_dim,) or (N, num_dim), to the unit hypercube."""
+        params = np.asarray(params, dtype=float)
+        scaled = (params - self.mins) / (self.maxes - self.mins)
+        if np.any(self.gaussian):
+            g = self.gaussian
+            scaled[..., g] = truncnorm.cdf(params[..., g], self.lower, self.upper, loc=self.defaults[g], scale=self.sigmas[g])
+        return scaled
+
+    def unscale(self, scaled):
+        """Unscale from the unit hypercube, with shape (num_dim,) or (N, num_dim), to active parameter values."""
+        scaled = np.asarray(scaled, dtype=float)
+        params = self.mins + scaled * (self.maxes - self.mins)
+        if np.any(self.gaussian):
+            g = self.gaussian
+            params[..., g] = truncnorm.ppf(scaled[..., g], self.lower, self.upper, loc=self.defaults[g], scale=self.sigmas[g])
+        return params
+
+    def get_param_dict(self, params):
+        """Converts active parameter values into a dictionary of all parameter values, or a list of
+        dictionaries if params has shape (N, num_dim)"""
+        if np.ndim(params) > 1:
+            return [self.get_param_dict(p) for p in params]
+        ps = OrderedDict(zip(self.names, params))
+        ps.update(self.fixed)
+        return ps
+
+
 @unique
 class Correction(Enum):
     """Various corrections that we should apply when computing our likelihood.
@@ -84,6 +165,7 @@ class Model(ABC):
         self.params = []
         self.fix_params = []
         self.param_dict = {}
+        self.layout = None
         self.postprocess = postprocess
         if postprocess is not None and not self.isotropic:
             raise NotImplementedError("Postprocessing (i.e., BAOExtractor) not implemented for anisotropic fits")
@@ -91,6 +173,11 @@ class Model(ABC):
             correction = Correction.NONE
         self.correction = correction
         self.correction_data = {}  # Empty dict to store correction specific data for speeding up computation
+        self.marg_cache = {}  # Per dataset cache of the parts of the marginalisation matrices that don't change
+        self.template_config = None  # Settings of the frozen template mode, see set_template_grid
+        self.template_grids = {}  # Per dataset tabulated models for the frozen template mode
+        self.template_hits = 0
+        self.template_misses = 0
         assert isinstance(self.correction, Correction), "Correction should be an enum of Correction"
         self.logger.info(
             f"Created model {name} of {self.__class__.__name__} with correction {correction} and postprocess {str(postprocess)}"
@@ -135,12 +222,21 @@ class Model(ABC):
                     ns=c["ns"],
                     mnu=c["mnu"],
                     recon_smoothing_scale=c["reconsmoothscale"],
+                    backend=c.get("backend", "camb"),
                 )
                 self.camb.omch2s = [(self.get_default("om") - c["ob"]) * c["h0"] ** 2 - c["mnu"] / 93.14]
 
             else:
                 self.camb = getCambGenerator(
-                    h0=c["h0"], ob=c["ob"], redshift=c["z"], ns=c["ns"], mnu=c["mnu"], recon_smoothing_scale=c["reconsmoothscale"]
+                    h0=c["h0"],
+                    ob=c["ob"],
+                    redshift=c["z"],
+                    ns=c["ns"],
+                    mnu=c["mnu"],
+                    recon_smoothing_scale=c["reconsmoothscale"],
+                    om_resolution=c.get("om_resolution", 101),
+                    interpolation=c.get("interpolation", "linear"),
+                    backend=c.get("backend", "camb"),
                 )
             self.pregen_path = os.path.abspath(os.path.join(self.data_location, self.get_unique_cosmo_name()))
             self.cosmology = c
@@ -162,6 +258,8 @@ class Model(ABC):
             data = [data]
         self.data = data
         self.data_dict = dict([(d["name"], d) for d in data])
+        self.marg_cache = {}
+        self.template_grids = {}
         self.set_cosmology(data[0]["cosmology"])
         assert data[0]["isotropic"] == self.isotropic, "ERROR: Data and model isotropic mismatch: Data is %s while model is %s" % (
             "isotropic" if data[0]["isotropic"] else "anisotropic",
@@ -173,6 +271,7 @@ class Model(ABC):
         p = Param(name, label, min, max, sigma, default, prior, name not in self.fix_params)
         self.params.append(p)
         self.param_dict[name] = p
+        self.layout = None
 
     def set_fix_params(self, params):
         if params is None:
@@ -180,17 +279,146 @@ class Model(ABC):
         self.fix_params = params
         for p in self.params:
             p.active = p.name not in params
+        self.layout = None
 
     def get_param(self, dic, name):
         return dic.get(name, self.get_default(name))
 
+    def get_layout(self):
+        """Returns the compiled `ParameterLayout` of the parameters, building it if they have changed"""
+        if self.layout is None:
+            self.layout = ParameterLayout(self.params)
+        return self.layout
+
+    def get_cache_info(self):
+        """Returns the hits, misses and size of each of the model's caches, used when profiling the likelihood.
+
+        Covers every `lru_cache` decorated method of the model (note these are shared between instances of the same
+        class) and the CAMB data cache. Subclasses extend this with their own caches.
+        """
+        caches = {}
+        for name in dir(type(self)):
+            info = getattr(getattr(type(self), name, None), "cache_info", None)
+            if callable(info):
+                info = info()
+                caches[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+        if self.camb is not None:
+            caches["camb"] = self.camb.get_cache_info()
+        if self.template_config is not None:
+            size = sum([g.get_size() for g in self.template_grids.values() if g is not None])
+            caches["template_grids"] = {"hits": self.template_hits, "misses": self.template_misses, "size": size}
+        return caches
+
+    def set_template_grid(self, params=None, num_points=31, ranges=None, order=3, rtol=1.0e-3, num_test=10, max_size=100000):
+        """Turns on the frozen template mode, where the model for each dataset is tabulated on a grid of some of the
+        parameters the first time it is needed, and interpolated from then on.
+
+        This is only worthwhile when the undilated model is the same at every step, i.e., the cosmology is fixed,
+        and requires analytic marginalisation so that the polynomial terms are added linearly by the marginalisation
+        rather than being grid dimensions. The model still depends on every other active parameter (such as the damping
+        scales, or the bias in models which do not marginalise over it), so whenever one of them differs from its value
+        when the grid was tabulated, the model is evaluated exactly instead. It is best suited to fits of alpha and
+        epsilon with the other parameters fixed. Points too close to the edge of the grid to interpolate also fall back
+        to evaluating the model exactly, as does the whole dataset if the interpolation error at random test points
+        exceeds rtol.
+
+        Parameters
+        ----------
+        params : list[str], optional
+            The parameters to tabulate the model over. Defaults to alpha and, if active, epsilon.
+        num_points : int, dict, optional
+            The number of grid points for every parameter, or a dictionary of parameter name to the number of grid points.
+        ranges : dict, optional
+            A dictionary of parameter name to the (min, max) of its grid. Defaults to the parameter's prior range.
+        order : int, optional
+            The order of the interpolating polynomials
+        rtol : float, optional
+            The largest interpolation error allowed, relative to the largest value of each model output
+        num_test : int, optional
+            The number of random points to test the interpolation error at
+        max_size : int, optional
+            The largest number of grid points (i.e., exact model evaluations to tabulate) allowed
+        """
+        if not self.marg:
+            raise ValueError("The frozen template mode requires analytic marginalisation of the bias and polynomial terms")
+        active = [p.name for p in self.get_active_params()]
+        if params is None:
+            params = [n for n in ["alpha", "epsilon"] if n in active]
+        missing = [n for n in params if n not in self.param_dict]
+        if missing:
+            raise ValueError(f"Cannot tabulate the model over unknown parameters {missing}")
+        sizes = [num_points.get(n, 31) if isinstance(num_points, dict) else num_points for n in params]
+        size = int(np.prod(sizes, dtype=float))
+        if size > max_size:
+            raise ValueError(f"The template grid over {params} would have {size} points, more than max_size={max_size}")
+        others = [n for n in active if n not in params]
+        if others:
+            self.logger.warning(f"The template grid only interpolates the model while the active parameters {others} keep their values")
+        self.template_config = {
+            "params": list(params),
+            "num_points": sizes,
+            "ranges": ranges or {},
+            "order": order,
+            "rtol": rtol,
+            "num_test": num_test,
+        }
+        self.template_grids = {}
+        self.template_hits, self.template_misses = 0, 0
+
+    def get_template_model(self, p, d, compute):
+        """Gets the model for the data d at the parameters p, interpolating it from the tabulated grid if the frozen
+        template mode is on (see `set_template_grid`) and calling compute(p) otherwise
+
+        Parameters
+        ----------
+        p : dict
+            A dictionary of parameter names to parameter values
+        d : dict
+            The data to compute the model for
+        compute : callable
+            Takes a dictionary of parameter values and returns the exact model as a tuple
+
+        Returns
+        -------
+        model : tuple
+            The model, as returned by compute
+        """
+        if self.template_config is None:
+            return compute(p)
+        if d["name"] not in self.template_grids:
+            self.template_grids[d["name"]] = self.build_template_grid(p, d, compute)
+        grid = self.template_grids[d["name"]]
+        model = None if grid is None or not grid.matches(p) else grid(p)
+        if model is None:
+            self.template_misses += 1
+            return compute(p)
+        self.template_hits += 1
+        return model
+
+    def build_template_grid(self, p, d, compute):
+        """Tabulates the model for the data d on the grid configured in `set_template_grid`, returning None if the
+        interpolation is not accurate enough to use"""
+        c = self.template_config
+        names = c["params"]
+        ranges = [c["ranges"].get(n, (self.param_dict[n].min, self.param_dict[n].max)) for n in names]
+        grid = TemplateGrid(compute, p, names, *zip(*ranges), c["num_points"], order=c["order"])
+        error = grid.validate(compute, num_test=c["num_test"])
+        if error > c["rtol"]:
+            self.logger.warning(
+                f"Interpolation error {error:0.2e} of the tabulated model for {d['name']} exceeds {c['rtol']:0.2e}, "
+                f"evaluating it exactly instead. Try more grid points or narrower ranges."
+            )
+            return None
+        self.logger.info(f"Using tabulated model for {d['name']}, with interpolation error {error:0.2e}")
+        return grid
+
     def get_active_params(self):
         """Returns a list of the active (non-fixed) parameters"""
-        return [p for p in self.params if p.active]
+        return list(self.get_layout().active)
 
     def get_inactive_params(self):
         """Returns a list of the inactive (fixed) parameters"""
-        return [p for p in self.params if not p.active]
+        return list(self.get_layout().inactive)
 
     def get_default(self, name):
         """Returns the default value of a given parameter name"""
@@ -208,10 +436,11 @@ class Model(ABC):
         if prior.lower() != "flat":
             assert prior.lower() == "gaussian", "ERROR: Prior must be flat or gaussian"
             self.param_dict[name].prior = prior
+        self.layout = None
 
     def get_defaults(self):
         """Returns a list of default values for all active parameters"""
-        return [x.default for x in self.get_active_params()]
+        return [x.default for x in self.get_layout().active]
 
     def get_defaults_dict(self):
         """Returns a list of default values for all active parameters"""
@@ -243,6 +472,22 @@ class Model(ABC):
                 log_prior += -0.5 * ((val - self.param_dict[pname].default) / self.param_dict[pname].sigma) ** 2
         return log_prior
 
+    def get_prior_batch(self, params):
+        """The prior for a batch of parameter vectors, vectorised version of `get_prior`.
+
+        Parameters
+        ----------
+        params : np.ndarray
+            The values of the active parameters, with shape (N, num_dim)
+
+        Returns
+        -------
+        log_prior : np.ndarray
+            The log prior for each row of params, -np.inf where a parameter falls outside its bounds.
+        """
+        return self.get_layout().get_prior(np.atleast_2d(params))
+
+    @profile("chi2")
     def get_chi2_likelihood(self, data, model, model_odd, icov, icov_m_w, num_mocks=None, num_data=None):
         """Computes the chi2 corrected likelihood.
 
@@ -252,6 +497,9 @@ class Model(ABC):
             The difference between the model predictions and data observations
         icov : np.ndarray
             Inverted covariance matrix.
+        icov_m_w : list
+            The Cholesky factor of icov multiplied by the window function with and without wide-angle effects,
+            and by the data. If the first element is None, the model is assumed to already be convolved.
         num_mocks : int, optional
             The number of mocks used to estimate the covariance. Used for corrections.
         num_data : int, optional
@@ -267,15 +515,29 @@ class Model(ABC):
             diff = data - (model + model_odd)
             chi2 = diff.T @ icov @ diff
         else:
-            chi2 = (
-                data.T @ icov @ data
-                - 2.0 * model_odd.T @ icov_m_w[0] @ data
-                - 2.0 * model.T @ icov_m_w[1] @ data
-                + model_odd.T @ icov_m_w[2] @ model_odd
-                + 2.0 * model.T @ icov_m_w[3] @ model_odd
-                + model.T @ icov_m_w[4] @ model.T
-            )
+            # The window function is folded into the Cholesky factor of icov, so compare directly to the whitened data
+            diff = icov_m_w[2] - icov_m_w[1] @ model - icov_m_w[0] @ model_odd
+            chi2 = diff @ diff
 
+        return self.get_corrected_likelihood(chi2, num_mocks=num_mocks, num_data=num_data)
+
+    def get_corrected_likelihood(self, chi2, num_mocks=None, num_data=None):
+        """Converts chi2 values into (corrected) log-likelihoods.
+
+        Parameters
+        ----------
+        chi2 : float, np.ndarray
+            The chi2 value, or an array of chi2 values
+        num_mocks : int, optional
+            The number of mocks used to estimate the covariance. Used for corrections.
+        num_data : int, optional
+            The length of the data vector. Used for corrections.
+
+        Returns
+        -------
+        log_likelihood : float, np.ndarray
+            The (corrected) log-likelihood value(s), with the same shape as chi2.
+        """
         if self.correction in [Correction.HARTLAP, Correction.SELLENTIN]:
             assert (
                 num_mocks > 0
@@ -301,6 +563,7 @@ class Model(ABC):
         else:
             return -0.5 * chi2
 
+    @profile("chi2_marg")
     def get_chi2_marg_likelihood(self, data, model, model_odd, marg_model, marg_model_odd, icov, icov_m_w, num_mocks=None, num_data=None):
         """Computes the chi2 corrected likelihood.
 
@@ -325,39 +588,111 @@ class Model(ABC):
             The (corrected) log-likelihood value from the computed chi2.
         """
         if icov_m_w[0] is None:
-            model += model_odd
-            marg_model += marg_model_odd
-            diff = data - model
+            diff = data - (model + model_odd)
+            marg_model = marg_model + marg_model_odd
+            key = id(icov)
             F02 = diff @ icov @ diff
-            F11 = marg_model @ icov @ diff
-            F2 = marg_model @ icov @ marg_model.T
-            F2inv = np.linalg.inv(F2)
         else:
-            F02 = (
-                data @ icov @ data
-                - 2.0 * model_odd @ icov_m_w[0] @ data
-                - 2.0 * model @ icov_m_w[1] @ data
-                + model_odd @ icov_m_w[2] @ model_odd
-                + 2.0 * model @ icov_m_w[3] @ model_odd
-                + model @ icov_m_w[4] @ model
-            )
-            F11 = (
-                marg_model_odd @ icov_m_w[0] @ data
-                + marg_model @ icov_m_w[1] @ data
-                - marg_model_odd @ icov_m_w[2] @ model_odd
-                - marg_model @ icov_m_w[3] @ model_odd
-                - marg_model_odd @ icov_m_w[3].T @ model
-                - marg_model @ icov_m_w[4] @ model
-            )
-            F2 = (
-                marg_model_odd @ icov_m_w[2] @ marg_model_odd.T
-                + marg_model @ icov_m_w[3] @ marg_model_odd.T
-                + marg_model_odd @ icov_m_w[3].T @ marg_model.T
-                + marg_model @ icov_m_w[4] @ marg_model.T
-            )
-            F2inv = np.linalg.inv(F2)
-        chi2 = F02 - F11 @ F2inv @ F11
+            diff = icov_m_w[2] - icov_m_w[1] @ model - icov_m_w[0] @ model_odd
+            marg_model = marg_model @ icov_m_w[1].T + marg_model_odd @ icov_m_w[0].T
+            icov, key = None, id(icov_m_w[1])
+            F02 = diff @ diff
+
+        factor = self.get_marg_cho_factor(marg_model, icov, key=key)
+        if factor is None:
+            return -np.inf
+        L, marg_icov, order = factor
+        z = solve_triangular(L, marg_icov @ diff, lower=True, check_finite=False)
+        chi2 = F02 - z @ z
+
+        logdet = 2.0 * np.sum(np.log(np.diag(L)))
+
+        return self.get_corrected_marg_likelihood(chi2, logdet, len(order), num_mocks=num_mocks, num_data=num_data)
+
+    @profile("marg_cho_factor")
+    def get_marg_cho_factor(self, marg_model, icov, key=None):
+        """Computes the Cholesky factorisation of F2 = marg_model @ icov @ marg_model.T, the Fisher matrix of the
+        analytically marginalised parameters. Rows of marg_model that haven't changed since the previous call, i.e.,
+        the polynomial terms that don't depend on the sampled parameters, have their block of F2 factorised once
+        and cached per dataset.
+
+        Parameters
+        ----------
+        marg_model : np.ndarray
+            The parts of the model that depend on nuisance parameters, with shape (nmarg, len(data))
+        icov : np.ndarray
+            Inverted covariance matrix. If None, the identity is used (i.e., marg_model has already been whitened).
+        key : hashable, optional
+            Identifies the dataset to cache the factorisation for. Defaults to the identity of icov.
+
+        Returns
+        -------
+        L : np.ndarray
+            The lower triangular Cholesky factor of F2, with rows and columns reordered by `order`
+        marg_icov : np.ndarray
+            marg_model @ icov, with rows reordered by `order`
+        order : np.ndarray
+            The order of the nuisance parameters in L and marg_icov
+        None is returned instead if F2 is not positive definite.
+        """
+        nmarg = marg_model.shape[0]
+        key = (id(icov) if key is None else key, marg_model.shape)
+        cache = self.marg_cache.get(key)
+        if cache is None or cache["icov"] is not icov:
+            cache = {"icov": icov, "rows": marg_model.copy(), "const": None}
+            self.marg_cache[key] = cache
+
+        # Reuse the cached block if all its rows are unchanged, otherwise refactorise the rows that haven't changed
+        fixed = np.all(marg_model == cache["rows"], axis=1)
+        if cache["const"] is None or not np.all(fixed[cache["const"]]):
+            const = np.where(fixed)[0]
+            marg_icov_c = marg_model[const] if icov is None else marg_model[const] @ icov
+            try:
+                L_c = np.linalg.cholesky(marg_icov_c @ marg_model[const].T)
+            except np.linalg.LinAlgError:
+                const, marg_icov_c, L_c = const[:0], marg_icov_c[:0], np.zeros((0, 0))
+            vary = np.setdiff1d(np.arange(nmarg), const, assume_unique=True)
+            cache.update({"rows": marg_model.copy(), "const": const, "vary": vary, "marg_icov": marg_icov_c, "L": L_c})
+        const, vary, marg_icov_c, L_c = cache["const"], cache["vary"], cache["marg_icov"], cache["L"]
+
+        marg_icov_v = marg_model[vary] if icov is None else marg_model[vary] @ icov
+        F2_vv = marg_icov_v @ marg_model[vary].T
+        L_vc = np.zeros((len(vary), len(const)))
+        if len(const):
+            L_vc = solve_triangular(L_c, marg_icov_c @ marg_model[vary].T, lower=True, check_finite=False).T
+        try:
+            L_vv = np.linalg.cholesky(F2_vv - L_vc @ L_vc.T)
+        except np.linalg.LinAlgError:
+            return None
+
+        nc = len(const)
+        L = np.zeros((nmarg, nmarg))
+        L[:nc, :nc] = L_c
+        L[nc:, :nc] = L_vc
+        L[nc:, nc:] = L_vv
+        return L, np.vstack([marg_icov_c, marg_icov_v]), np.concatenate([const, vary])
+
+    def get_corrected_marg_likelihood(self, chi2, logdet, num_marg, num_mocks=None, num_data=None):
+        """Converts analytically marginalised chi2 values into (corrected) log-likelihoods.
+
+        Parameters
+        ----------
+        chi2 : float, np.ndarray
+            The marginalised chi2 value, or an array of them
+        logdet : float, np.ndarray
+            The log-determinant of the nuisance parameter Fisher matrix F2, matching chi2
+        num_marg : int
+            The number of analytically marginalised parameters
+        num_mocks : int, optional
+            The number of mocks used to estimate the covariance. Used for corrections.
+        num_data : int, optional
+            The length of the data vector. Used for corrections.
 
+        Returns
+        -------
+        log_likelihood : float, np.ndarray
+            The (corrected) log-likelihood value(s), with the same shape as chi2.
+        """
         if self.correction in [Correction.HARTLAP]:
             assert (
                 num_mocks > 0
@@ -368,10 +703,121 @@ class Model(ABC):
             if key not in self.correction_data:
                 self.correction_data[key] = (num_mocks - num_data - 2.0) / (num_mocks - 1.0)
             c_p = self.correction_data[key]
-            return -0.5 * (chi2 * c_p + np.log(np.linalg.det(F2)) + np.shape(F2)[0] * np.log(c_p))
+            return -0.5 * (chi2 * c_p + logdet + num_marg * np.log(c_p))
         else:
-            return -0.5 * (chi2 + np.log(np.linalg.det(F2)))
+            return -0.5 * (chi2 + logdet)
+
+    @profile("chi2_batch")
+    def get_chi2_likelihood_batch(self, data, model, icov, num_mocks=None, num_data=None):
+        """Computes the chi2 corrected likelihood for a batch of models at once.
+
+        Only supports the case where the model has already been convolved with the window function,
+        i.e., where odd multipoles have been added onto `model` and `icov_m_w` is not used.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The data vector
+        model : np.ndarray
+            The model predictions, with shape (N, len(data))
+        icov : np.ndarray
+            Inverted covariance matrix.
+        num_mocks : int, optional
+            The number of mocks used to estimate the covariance. Used for corrections.
+        num_data : int, optional
+            The length of the data vector. Used for corrections.
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The (corrected) log-likelihood values, with shape (N,).
+        """
+        diff = data - model
+        chi2 = np.sum((diff @ icov) * diff, axis=-1)
+        return self.get_corrected_likelihood(chi2, num_mocks=num_mocks, num_data=num_data)
+
+    @profile("chi2_marg_batch")
+    def get_chi2_marg_likelihood_batch(self, data, model, marg_model, icov, num_mocks=None, num_data=None):
+        """Computes the analytically marginalised chi2 corrected likelihood for a batch of models at once.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The data vector
+        model : np.ndarray
+            The model predictions without any nuisance parameters, with shape (N, len(data))
+        marg_model : np.ndarray
+            The parts of the model that depend on nuisance parameters, with shape (N, nmarg, len(data))
+        icov : np.ndarray
+            Inverted covariance matrix.
+        num_mocks : int, optional
+            The number of mocks used to estimate the covariance. Used for corrections.
+        num_data : int, optional
+            The length of the data vector. Used for corrections.
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The (corrected) log-likelihood values, with shape (N,).
+        """
+        diff = data - model
+        marg_icov = marg_model @ icov
+        F02 = np.sum((diff @ icov) * diff, axis=-1)
+        F11 = np.einsum("nmi,ni->nm", marg_icov, diff)
+        F2 = marg_icov @ np.swapaxes(marg_model, -1, -2)
+        try:
+            L = np.linalg.cholesky(F2)
+        except np.linalg.LinAlgError:
+            # At least one F2 is not positive definite, so give those models zero likelihood and evaluate the rest individually
+            if len(F2) == 1:
+                return np.full(1, -np.inf)
+            return np.concatenate(
+                [
+                    self.get_chi2_marg_likelihood_batch(data, model[i : i + 1], marg_model[i : i + 1], icov, num_mocks, num_data)
+                    for i in range(len(F2))
+                ]
+            )
+        z = np.linalg.solve(L, F11[..., None])[..., 0]
+        chi2 = F02 - np.sum(z**2, axis=-1)
+        logdet = 2.0 * np.sum(np.log(np.diagonal(L, axis1=-2, axis2=-1)), axis=-1)
+
+        return self.get_corrected_marg_likelihood(chi2, logdet, np.shape(F2)[-1], num_mocks=num_mocks, num_data=num_data)
+
+    @profile("chi2_partial_marg_batch")
+    def get_chi2_partial_marg_likelihood_batch(self, data, model, marg_model, icov, num_mocks=None, num_data=None):
+        """Computes the chi2 corrected likelihood for a batch of models at once, with the nuisance parameters
+        set to their maximum likelihood values.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The data vector
+        model : np.ndarray
+            The model predictions without any nuisance parameters, with shape (N, len(data))
+        marg_model : np.ndarray
+            The parts of the model that depend on nuisance parameters, with shape (N, nmarg, len(data))
+        icov : np.ndarray
+            Inverted covariance matrix.
+        num_mocks : int, optional
+            The number of mocks used to estimate the covariance. Used for corrections.
+        num_data : int, optional
+            The length of the data vector. Used for corrections.
+
+        Returns
+        -------
+        log_likelihood : np.ndarray
+            The (corrected) log-likelihood values, with shape (N,).
+        """
+        marg_icov = marg_model @ icov
+        F11 = np.einsum("nmi,ni->nm", marg_icov, data - model)
+        F2 = marg_icov @ np.swapaxes(marg_model, -1, -2)
+        bband = np.linalg.solve(F2, F11[..., None])[..., 0]
+
+        model = model + np.einsum("nm,nmi->ni", bband, marg_model)
 
+        return self.get_chi2_likelihood_batch(data, model, icov, num_mocks=num_mocks, num_data=num_data)
+
+    @profile("chi2_partial_marg")
     def get_chi2_partial_marg_likelihood(
         self, data, model, model_odd, marg_model, marg_model_odd, icov, icov_m_w, num_mocks=None, num_data=None
     ):
@@ -407,31 +853,27 @@ class Model(ABC):
 
         return self.get_chi2_likelihood(data, model, model_odd, icov, icov_m_w, num_mocks=num_mocks, num_data=num_data)
 
+    @profile("ML_nuisance")
     def get_ML_nuisance(self, data, model, model_odd, marg_model, marg_model_odd, icov, icov_m_w):
 
         if icov_m_w[0] is None:
-            full_model = model + model_odd
-            full_marg_model = marg_model + marg_model_odd
-            F11 = full_marg_model @ icov @ (data - full_model)
-            F2 = full_marg_model @ icov @ full_marg_model.T
-            F2inv = np.linalg.inv(F2)
+            diff = data - (model + model_odd)
+            marg_model = marg_model + marg_model_odd
+            key = id(icov)
         else:
-            F11 = (
-                marg_model_odd @ icov_m_w[0] @ data
-                + marg_model @ icov_m_w[1] @ data
-                - marg_model_odd @ icov_m_w[2] @ model_odd
-                - marg_model @ icov_m_w[3] @ model_odd
-                - marg_model_odd @ icov_m_w[3].T @ model
-                - marg_model @ icov_m_w[4] @ model
-            )
-            F2 = (
-                marg_model_odd @ icov_m_w[2] @ marg_model_odd.T
-                + 2.0 * marg_model @ icov_m_w[3] @ marg_model_odd.T
-                + marg_model @ icov_m_w[4] @ marg_model.T
-            )
-            F2inv = np.linalg.inv(F2)
-
-        bband = F2inv @ F11
+            diff = icov_m_w[2] - icov_m_w[1] @ model - icov_m_w[0] @ model_odd
+            marg_model = marg_model @ icov_m_w[1].T + marg_model_odd @ icov_m_w[0].T
+            icov, key = None, id(icov_m_w[1])
+
+        factor = self.get_marg_cho_factor(marg_model, icov, key=key)
+        if factor is None:
+            # F2 is not positive definite, so fall back to a least-squares solution
+            marg_icov = marg_model if icov is None else marg_model @ icov
+            return np.linalg.lstsq(marg_icov @ marg_model.T, marg_icov @ diff, rcond=None)[0]
+        L, marg_icov, order = factor
+        bband = np.empty(len(order))
+        z = solve_triangular(L, marg_icov @ diff, lower=True, check_finite=False)
+        bband[order] = solve_triangular(L.T, z, lower=False, check_finite=False)
 
         return bband
 
@@ -478,7 +920,7 @@ class Model(ABC):
     def get_raw_start(self):
         """Gets starting points for each parameter given prior and min and max constraints"""
         start_random = []
-        for x in self.get_active_params():
+        for x in self.get_layout().active:
             if x.prior == "flat":
                 start_random.append(uniform(x.min, x.max))
             else:
@@ -582,17 +1024,16 @@ class Model(ABC):
 
     def get_num_dim(self):
         """Gets the number of dimensions (active, free parameters) in the model"""
-        return len(self.get_active_params())
+        return len(self.get_layout().active)
 
     def get_start_scaled(self):
         """Gets a scaled (unit hypercube) optimised starting position."""
         return self.scale(self.get_start())
 
     def get_param_dict(self, params):
-        """Converts a list of parameter values into a dictionary of parameter values"""
-        ps = OrderedDict([(p.name, v) for p, v in zip(self.get_active_params(), params)])
-        ps.update({(p.name, p.default) for p in self.get_inactive_params()})
-        return ps
+        """Converts a list of parameter values into a dictionary of parameter values.
+        If params has shape (N, num_dim), returns a list of dictionaries."""
+        return self.get_layout().get_param_dict(params)
 
     def get_posterior_scaled(self, scaled):
         """Gets the posterior using an input scaled (unit hypercube) location in parameter space"""
@@ -602,36 +1043,53 @@ class Model(ABC):
         """Returns the likelihood given a list of param values and some data. Designed to be overwritten by subclasses"""
         return 0.0
 
+    @profile("posterior")
     def get_posterior(self, params):
         """Returns the posterior given a list of param values."""
-        ps = self.get_param_dict(params)
-        prior = self.get_prior(ps)
+        layout = self.get_layout()
+        prior = layout.get_prior(params)
         if not np.isfinite(prior):
             return -np.inf
+        ps = layout.get_param_dict(params)
         posterior = prior
         for d in self.data:
             posterior += self.get_likelihood(ps, d)
         return posterior
 
+    def get_likelihood_batch(self, ps, data):
+        """Returns the likelihood for a list of parameter dictionaries. Overwrite in subclasses to evaluate them together."""
+        return np.array([self.get_likelihood(p, data) for p in ps])
+
+    @profile("posterior_batch")
+    def get_posterior_batch(self, params):
+        """Returns the posterior for a batch of parameter vectors at once.
+
+        Parameters
+        ----------
+        params : np.ndarray
+            The values of the active parameters, with shape (N, num_dim)
+
+        Returns
+        -------
+        posterior : np.ndarray
+            The log posterior of each parameter vector, with shape (N,)
+        """
+        params = np.atleast_2d(params)
+        posterior = self.get_prior_batch(params)
+        good = np.isfinite(posterior)
+        if np.any(good):
+            ps = self.get_param_dict(params[good])
+            for d in self.data:
+                posterior[good] += self.get_likelihood_batch(ps, d)
+        return posterior
+
     def scale(self, params):
         """Scale parameter values to the unit hypercube. If you want other dists and nested sampling, overwrite this"""
-        scaled = []
-        for s, p in zip(params, self.get_active_params()):
-            if p.prior == "flat":
-                scaled.append((s - p.min) / (p.max - p.min))
-            else:
-                scaled.append(truncnorm.cdf(s, (p.min - p.default) / p.sigma, (p.max - p.default) / p.sigma, loc=p.default, scale=p.sigma))
-        return np.array(scaled)
+        return self.get_layout().scale(params)
 
     def unscale(self, scaled):
         """Unscale from the unit hypercube to parameter values. If you want other dists and nested sampling, overwrite this."""
-        params = []
-        for s, p in zip(scaled, self.get_active_params()):
-            if p.prior == "flat":
-                params.append(p.min + s * (p.max - p.min))
-            else:
-                params.append(truncnorm.ppf(s, (p.min - p.default) / p.sigma, (p.max - p.default) / p.sigma, loc=p.default, scale=p.sigma))
-        return np.array(params)
+        return self.get_layout().unscale(scaled)
 
     def optimize(self, tol=1.0e-6):
         """Perform local optimisation to try and find the best fit of your model to the dataset loaded in.
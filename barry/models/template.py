@@ -0,0 +1,139 @@
+import itertools
+import logging
+import time
+
+import numpy as np
+
+
+class TemplateGrid:
+    """Tabulates a model on a regular grid of parameter values and interpolates it, for fits where everything else
+    about the model is frozen, such as a fixed cosmology with the bias and polynomial terms analytically marginalised.
+
+    The model is interpolated with a tensor product of local Lagrange polynomials, so each evaluation is a weighted sum
+    of (order + 1)^D tabulated models for D parameters. The interpolation stencil is kept centred on the point, so
+    points where it would not fit inside the grid (within about order / 2 grid cells of the edge, or outside) return
+    None and should be evaluated exactly.
+
+    Parameters
+    ----------
+    compute : callable
+        Takes a dictionary of parameter values and returns the model, as a tuple. Arrays of floats in the tuple are
+        tabulated, anything else (such as masks or None) must not depend on the grid parameters and is passed through.
+    base : dict
+        The parameter values to use for any parameters not on the grid
+    names : list[str]
+        The parameters to tabulate the model over
+    lows : list[float]
+        The lower edge of the grid for each parameter
+    highs : list[float]
+        The upper edge of the grid for each parameter
+    num_points : list[int]
+        The number of grid points for each parameter
+    order : int, optional
+        The order of the interpolating polynomials. Defaults to cubic.
+    """
+
+    def __init__(self, compute, base, names, lows, highs, num_points, order=3):
+        self.logger = logging.getLogger("barry")
+        self.names = list(names)
+        self.lows = np.array(lows, dtype=float)
+        self.highs = np.array(highs, dtype=float)
+        self.num_points = np.array(num_points, dtype=int)
+        self.order = order
+        assert np.all(self.num_points > order), f"Need more than {order} grid points per parameter for order {order} interpolation"
+        assert np.all(self.highs > self.lows), "Grid ranges must have a positive width"
+        self.steps = (self.highs - self.lows) / (self.num_points - 1)
+        self.axes = [np.linspace(lo, hi, n) for lo, hi, n in zip(self.lows, self.highs, self.num_points)]
+
+        # Denominators of the Lagrange basis polynomials, for nodes at 0, 1, ..., order
+        nodes = np.arange(order + 1)
+        self.denominators = np.array([np.prod([j - m for m in nodes if m != j]) for j in nodes], dtype=float)
+
+        start = time.time()
+        self.base = dict(base)
+        reference = compute(self.get_params(self.lows))
+        self.tabulated = [isinstance(r, np.ndarray) and np.issubdtype(r.dtype, np.floating) for r in reference]
+        self.constants = [None if t else r for t, r in zip(self.tabulated, reference)]
+        self.tables = [np.empty(tuple(self.num_points) + r.shape) if t else None for t, r in zip(self.tabulated, reference)]
+        for index in itertools.product(*[range(n) for n in self.num_points]):
+            model = compute(self.get_params([axis[i] for axis, i in zip(self.axes, index)]))
+            for table, m in zip(self.tables, model):
+                if table is not None:
+                    table[index] = m
+        self.logger.info(
+            f"Tabulated model over {self.names} at {np.prod(self.num_points)} points in {time.time() - start:0.1f}s, "
+            f"using {self.get_nbytes() / 1024**2:0.1f} MB"
+        )
+
+    def get_params(self, values):
+        return {**self.base, **dict(zip(self.names, values))}
+
+    def matches(self, p):
+        """Whether every parameter in p which is not on the grid has the value the grid was tabulated at"""
+        return all(p[k] == v for k, v in self.base.items() if k not in self.names and k in p)
+
+    def get_nbytes(self):
+        return sum([t.nbytes for t in self.tables if t is not None])
+
+    def get_size(self):
+        return int(np.prod(self.num_points))
+
+    def get_stencil(self, values):
+        """Returns the first grid index and the interpolation weights along each parameter, or None if the centred
+        stencil does not fit inside the grid"""
+        positions = (np.asarray(values, dtype=float) - self.lows) / self.steps
+        starts = np.floor(positions).astype(int) - (self.order - 1) // 2
+        if np.any(starts < 0) or np.any(starts + self.order >= self.num_points) or not np.all(np.isfinite(positions)):
+            return None
+        nodes = np.arange(self.order + 1)
+        weights = []
+        for t in positions - starts:
+            differences = t - nodes
+            products = np.array([np.prod(np.delete(differences, j)) for j in nodes])
+            weights.append(products / self.denominators)
+        return starts, weights
+
+    def __call__(self, p):
+        """Interpolates the model at the grid parameter values in the dictionary p
+
+        Returns
+        -------
+        model : tuple
+            The interpolated model, with the same structure as returned by compute, or None if p is too close to the
+            edge of the grid to be interpolated
+        """
+        stencil = self.get_stencil([p[name] for name in self.names])
+        if stencil is None:
+            return None
+        starts, weights = stencil
+        block = tuple(slice(s, s + self.order + 1) for s in starts)
+        model = []
+        for table, constant in zip(self.tables, self.constants):
+            if table is None:
+                model.append(constant)
+                continue
+            values = table[block]
+            for w in weights:
+                values = np.tensordot(w, values, axes=(0, 0))
+            model.append(values)
+        return tuple(model)
+
+    def validate(self, compute, num_test=10, seed=0):
+        """Compares the interpolated and exact model at random points inside the grid
+
+        Returns
+        -------
+        error : float
+            The largest absolute difference between the interpolated and exact models, relative to the largest absolute
+            value of the exact model, over all test points and tabulated outputs
+        """
+        rng = np.random.default_rng(seed)
+        margin = 0.5 * (self.order + 1) * self.steps
+        error = 0.0
+        for _ in range(num_test):
+            p = self.get_params(rng.uniform(self.lows + margin, self.highs - margin))
+            interpolated, exact = self(p), compute(p)
+            for t, i, e in zip(self.tabulated, interpolated, exact):
+                if t:
+                    error = max(error, np.max(np.abs(i - e)) / max(np.max(np.abs(e)), np.finfo(float).tiny))
+        return error
@@ -0,0 +1,134 @@
+import functools
+import json
+import logging
+import random
+import time
+
+import numpy as np
+
+
+class Profiler:
+    """Records the time spent in each stage of the likelihood pipeline.
+
+    Stages are the functions decorated with `profile`, such as the posterior, the model power spectrum or correlation
+    function, the window function convolution, the pk2xi transforms and the chi2 and marginalisation routines. Timings
+    are inclusive, so the time in a stage includes any stages called from it.
+
+    Profiling is off by default, in which case each decorated call only pays for a single attribute lookup.
+
+    Parameters
+    ----------
+    max_samples : int, optional
+        The number of call durations to keep per stage for computing percentiles. Once exceeded, durations are
+        reservoir sampled, so the percentiles remain representative of the whole run.
+    """
+
+    def __init__(self, max_samples=10000):
+        self.enabled = False
+        self.max_samples = max_samples
+        self.counts = {}
+        self.totals = {}
+        self.samples = {}
+        # Separate generator so that sampling durations never changes the global random state seen by the samplers
+        self.rng = random.Random(0)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.counts, self.totals, self.samples = {}, {}, {}
+        self.rng.seed(0)
+
+    def record(self, stage, duration):
+        count = self.counts.get(stage, 0) + 1
+        self.counts[stage] = count
+        self.totals[stage] = self.totals.get(stage, 0.0) + duration
+        samples = self.samples.setdefault(stage, [])
+        if len(samples) < self.max_samples:
+            samples.append(duration)
+        else:
+            i = self.rng.randrange(count)
+            if i < self.max_samples:
+                samples[i] = duration
+
+    def get_report(self, model=None):
+        """Gets the timing of each stage, and the cache statistics of the model if given
+
+        Parameters
+        ----------
+        model : `barry.models.Model`, optional
+            The model whose caches should be reported, via `Model.get_cache_info`
+
+        Returns
+        -------
+        report : dict
+            Contains 'stages', mapping each stage to its number of calls, its total time and its mean, median, 90th
+            and 99th percentile time per call, all in seconds. If a model is given, 'caches' maps each cache to its
+            hits, misses, size and hit rate, which is None if the cache was never used.
+        """
+        stages = {}
+        for stage in sorted(self.totals, key=self.totals.get, reverse=True):
+            p50, p90, p99 = np.percentile(self.samples[stage], [50, 90, 99])
+            stages[stage] = {
+                "calls": self.counts[stage],
+                "total": self.totals[stage],
+                "mean": self.totals[stage] / self.counts[stage],
+                "p50": p50,
+                "p90": p90,
+                "p99": p99,
+            }
+        report = {"stages": stages}
+        if model is not None:
+            caches = {}
+            for name, info in model.get_cache_info().items():
+                calls = info["hits"] + info["misses"]
+                caches[name] = {**info, "hit_rate": info["hits"] / calls if calls else None}
+            report["caches"] = caches
+        return report
+
+    def log_report(self, report):
+        logger = logging.getLogger("barry")
+        logger.info(f"{'Stage':40s} {'Calls':>10s} {'Total (s)':>10s} {'Mean (ms)':>10s} {'p50 (ms)':>10s} {'p99 (ms)':>10s}")
+        for stage, s in report["stages"].items():
+            logger.info(
+                f"{stage:40s} {s['calls']:10d} {s['total']:10.3f} {1000 * s['mean']:10.4f} {1000 * s['p50']:10.4f} {1000 * s['p99']:10.4f}"
+            )
+        for name, c in report.get("caches", {}).items():
+            hit_rate = "n/a" if c["hit_rate"] is None else f"{c['hit_rate']:0.3f}"
+            logger.info(f"Cache {name}: {c['hits']} hits, {c['misses']} misses, size {c['size']}, hit rate {hit_rate}")
+
+    def save_report(self, report, filename):
+        with open(filename, "w") as f:
+            json.dump(report, f, indent=2, default=float)
+
+
+PROFILER = Profiler()
+
+
+def profile(stage):
+    """Decorator marking a function as a stage of the likelihood pipeline to be timed by `PROFILER` when enabled.
+
+    Parameters
+    ----------
+    stage : str
+        The name the stage is reported under. Functions can share a stage name, for example the
+        `compute_power_spectrum` of each model.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -1,11 +1,52 @@
 import logging
 import os
 import numpy as np
-from barry.samplers.sampler import Sampler
+from barry.samplers.sampler import Sampler, EvaluationCounter
+
+# The functions to reattach to a checkpoint as it is restored, by name
+_reattach = {}
+
+
+class _Reattachable:
+    """Wraps a function dynesty is given, so that checkpointing the sampler doesn't pickle the function (and with it
+    the model and data). When a checkpoint is restored the function is looked up by name in `_reattach` instead."""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __getstate__(self):
+        return {"name": self.name}
+
+    def __setstate__(self, state):
+        self.name = state["name"]
+        self.func = _reattach[self.name]
 
 
 class DynestySampler(Sampler):
-    def __init__(self, temp_dir=None, max_iter=None, dynamic=False, nlive=500, print_progress=False):
+    def __init__(self, temp_dir=None, max_iter=None, dynamic=False, nlive=500, print_progress=False, checkpoint_interval=600):
+        """Uses ``dynesty`` to nested sample the posterior, either with static or dynamic nested sampling.
+
+        Parameters
+        ----------
+        temp_dir : str, optional
+            The directory to save the chains, summaries and checkpoints to
+        max_iter : int, optional
+            The maximum number of iterations to run
+        dynamic : bool, optional
+            Whether to use dynamic nested sampling
+        nlive : int, optional
+            The number of live points (the initial number, for dynamic nested sampling)
+        print_progress : bool, optional
+            Whether to have dynesty print its progress
+        checkpoint_interval : float, optional
+            The number of seconds between checkpoints of the sampler state, which is saved to temp_dir and resumed from
+            if the fit is run again with the same uid, such as after a job hits its walltime. Setting to ``None``
+            disables checkpointing. The checkpoint is removed once the chain is saved.
+        """
 
         self.logger = logging.getLogger("barry")
         self.max_iter = max_iter
@@ -16,6 +57,7 @@ class DynestySampler(Sampler):
             os.makedirs(temp_dir, exist_ok=True)
         self.dynamic = dynamic
         self.print_progress = print_progress
+        self.checkpoint_interval = checkpoint_interval
 
     def get_filename(self, uid):
         if self.dynamic:
@@ -23,6 +65,9 @@ class DynestySampler(Sampler):
         else:
             return os.path.join(self.temp_dir, f"{uid}_nest_chain.npy")
 
+    def get_checkpoint_filename(self, uid):
+        return self.get_filename(uid).replace("_chain.npy", "_checkpoint.save")
+
     def fit(self, log_likelihood, start, num_dim, prior_transform, save_dims=None, uid=None):
 
         import dynesty
@@ -30,21 +75,45 @@ class DynestySampler(Sampler):
         filename = self.get_filename(uid)
         if os.path.exists(filename):
             self.logger.info("Not sampling, returning result from file.")
-            return self.load_file(filename)
+            result = self.load_file(filename)
+            if not os.path.exists(self.get_summary_filename(uid)):
+                self.save_summary(uid, result)
+            return result
         self.logger.info("Sampling posterior now")
+        log_likelihood = EvaluationCounter(log_likelihood)
 
         if save_dims is None:
             save_dims = num_dim
         self.logger.debug("Fitting framework with %d dimensions" % num_dim)
         self.logger.info("Using dynesty Sampler")
+        sampler_class = dynesty.DynamicNestedSampler if self.dynamic else dynesty.NestedSampler
+        checkpoint = self.get_checkpoint_filename(uid)
+        checkpointing = self.temp_dir is not None and self.checkpoint_interval is not None
+        sampler = None
+        if checkpointing and os.path.exists(checkpoint):
+            _reattach.update({"log_likelihood": log_likelihood, "prior_transform": prior_transform})
+            try:
+                sampler = sampler_class.restore(checkpoint)
+                self.logger.info(f"Resuming from checkpoint {checkpoint} after {sampler.it - 1} iterations")
+            except Exception as e:
+                self.logger.warning(f"Could not restore checkpoint {checkpoint}, starting from scratch: {e!r}")
+        kwargs = {"resume": sampler is not None}
+        if checkpointing:
+            kwargs.update({"checkpoint_file": checkpoint, "checkpoint_every": self.checkpoint_interval})
+        if sampler is None:
+            log_likelihood_func = _Reattachable("log_likelihood", log_likelihood)
+            prior_transform_func = _Reattachable("prior_transform", prior_transform)
+            if self.dynamic:
+                sampler = dynesty.DynamicNestedSampler(log_likelihood_func, prior_transform_func, num_dim)
+            else:
+                sampler = dynesty.NestedSampler(log_likelihood_func, prior_transform_func, num_dim, nlive=self.nlive)
+
         if self.dynamic:
-            sampler = dynesty.DynamicNestedSampler(log_likelihood, prior_transform, num_dim)
             sampler.run_nested(
-                maxiter=self.max_iter, print_progress=self.print_progress, nlive_init=self.nlive, nlive_batch=100, maxbatch=10
+                maxiter=self.max_iter, print_progress=self.print_progress, nlive_init=self.nlive, nlive_batch=100, maxbatch=10, **kwargs
             )
         else:
-            sampler = dynesty.NestedSampler(log_likelihood, prior_transform, num_dim, nlive=self.nlive)
-            sampler.run_nested(maxiter=self.max_iter, print_progress=self.print_progress)
+            sampler.run_nested(maxiter=self.max_iter, print_progress=self.print_progress, **kwargs)
 
         self.logger.debug("Fit finished")
 
@@ -57,7 +126,11 @@ class DynestySampler(Sampler):
         mask = weights > trim
         likelihood = dresults["logl"]
         self._save(chain[mask, :], weights[mask], likelihood[mask], filename, logz[mask], save_dims)
-        return {"chain": chain[mask, :], "weights": weights[mask], "posterior": likelihood[mask], "evidence": logz}
+        result = {"chain": chain[mask, :], "weights": weights[mask], "posterior": likelihood[mask], "evidence": logz}
+        self.save_summary(uid, {**result, "chain": chain[mask, :save_dims]}, num_evaluations=log_likelihood.count)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return result
 
     def _save(self, chain, weights, likelihood, filename, logz, save_dims):
         res = np.vstack((likelihood, weights, logz, chain[:, :save_dims].T)).T
@@ -2,11 +2,11 @@ import logging
 import os
 import numpy as np
 from barry.samplers.hdemcee import EmceeWrapper
-from barry.samplers.sampler import Sampler
+from barry.samplers.sampler import Sampler, EvaluationCounter
 
 
 class EnsembleSampler(Sampler):
-    def __init__(self, num_walkers=None, num_steps=1000, num_burn=300, temp_dir=None, save_interval=300):
+    def __init__(self, num_walkers=None, num_steps=1000, num_burn=300, temp_dir=None, save_interval=300, vectorize=False):
         """Uses ``emcee`` and the `EnsembleSampler
         <http://dan.iel.fm/emcee/current/api/#emcee.EnsembleSampler>`_ to fit the supplied
         model.
@@ -30,6 +30,10 @@ class EnsembleSampler(Sampler):
         save_interval : float
             The amount of seconds between saving the chain to file. Setting to ``None``
             disables serialisation.
+        vectorize : bool, optional
+            If true, the log posterior passed to `fit` is expected to take an array of
+            shape ``(num_walkers, num_dim)`` and return an array of ``num_walkers`` log posteriors,
+            such that the whole ensemble is evaluated in one call.
         """
 
         self.logger = logging.getLogger("barry")
@@ -43,6 +47,7 @@ class EnsembleSampler(Sampler):
             os.makedirs(temp_dir, exist_ok=True)
         self.save_interval = save_interval
         self.num_walkers = num_walkers
+        self.vectorize = vectorize
 
     def fit(self, log_posterior, start, num_dim, prior_transform, save_dims=None, uid=None):
         """Runs the sampler over the model and returns the flat chain of results
@@ -51,7 +56,8 @@ class EnsembleSampler(Sampler):
         ----------
         log_posterior : function
             A function which takes a list of parameters and returns
-            the log posterior
+            the log posterior. If `vectorize` is set, it instead takes
+            an array of parameters for all walkers and returns an array.
         start : function|list|ndarray
             Either a starting position, or a function that can be called
             to generate a starting position
@@ -81,7 +87,8 @@ class EnsembleSampler(Sampler):
         self.logger.debug("Fitting framework with %d dimensions" % num_dim)
 
         self.logger.info("Using Ensemble Sampler")
-        sampler = emcee.EnsembleSampler(self.num_walkers, num_dim, log_posterior, live_dangerously=True)
+        log_posterior = EvaluationCounter(log_posterior)
+        sampler = emcee.EnsembleSampler(self.num_walkers, num_dim, log_posterior, live_dangerously=True, vectorize=self.vectorize)
 
         emcee_wrapper = EmceeWrapper(sampler)
         flat_chain = emcee_wrapper.run_chain(
@@ -99,7 +106,10 @@ class EnsembleSampler(Sampler):
         if self.pool is not None:  # pragma: no cover
             self.pool.close()
             self.logger.debug("Pool closed")
-        return {"chain": flat_chain, "weights": np.ones(flat_chain.shape[0])}
+        posterior = emcee_wrapper.posterior[:, self.num_burn :].reshape(-1)
+        result = {"chain": flat_chain, "weights": np.ones(flat_chain.shape[0]), "posterior": posterior}
+        self.save_summary(uid, result, num_evaluations=log_posterior.count)
+        return result
 
     def load_file(self, filename):
         results = np.load(filename)
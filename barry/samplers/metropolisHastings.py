@@ -3,7 +3,7 @@ import numpy as np
 from time import time
 import logging
 
-from barry.samplers.sampler import Sampler
+from barry.samplers.sampler import Sampler, EvaluationCounter
 
 
 class MetropolisHastings(Sampler):
@@ -108,7 +108,7 @@ class MetropolisHastings(Sampler):
             uid = "mh"
         self._update_temp_files(uid)
         self.save_dims = save_dims
-        self.log_posterior = log_posterior
+        self.log_posterior = EvaluationCounter(log_posterior)
         self.start = start
         position, burnin, chain, covariance = self._load()
         if burnin is not None:
@@ -128,7 +128,9 @@ class MetropolisHastings(Sampler):
 
         c, w, p = self._do_chain(position, covariance, chain=chain)
         self.logger.info("Returning results")
-        return {"chain": c, "weights": w, "posterior": p}
+        result = {"chain": c, "weights": w, "posterior": p}
+        self.save_summary(uid, result, num_evaluations=self.log_posterior.count)
+        return result
 
     def _do_burnin(self, position, burnin, covariance):
         if burnin is None:
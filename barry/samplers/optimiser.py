@@ -2,7 +2,7 @@ import logging
 import os
 import numpy as np
 from scipy.optimize import differential_evolution
-from barry.samplers.sampler import Sampler
+from barry.samplers.sampler import Sampler, EvaluationCounter
 
 
 class Optimiser(Sampler):
@@ -47,12 +47,16 @@ class Optimiser(Sampler):
         filename = os.path.join(self.temp_dir, f"{uid}_bestfit_chain.npy")
         if os.path.exists(filename):
             self.logger.info("Not sampling, returning result from file.")
-            return self.load_file(filename)
+            result = self.load_file(filename)
+            if not os.path.exists(self.get_summary_filename(uid)):
+                self.save_summary(uid, result)
+            return result
         self.logger.info("Sampling posterior now")
 
         self.logger.debug("Fitting framework with %d dimensions" % num_dim)
         self.logger.info("Using Optimiser")
 
+        log_posterior = EvaluationCounter(log_posterior)
         bounds = [(0.0, 1.0) for _ in range(num_dim)]
         res = differential_evolution(lambda *x: -log_posterior(prior_transform(*x)), bounds, tol=self.tol)
 
@@ -60,7 +64,9 @@ class Optimiser(Sampler):
         print(res.fun, ps)
         np.save(filename, np.concatenate([[-res.fun], ps]))
 
-        return {"chain": ps, "posterior": -res.fun}
+        result = {"chain": ps, "posterior": -res.fun}
+        self.save_summary(uid, result, num_evaluations=log_posterior.count)
+        return result
 
     def load_file(self, filename):
         """ Load existing results from a file"""
@@ -1,4 +1,21 @@
 import abc
+import json
+import os
+
+import numpy as np
+
+
+class EvaluationCounter:
+    """Wraps a log posterior to count the number of points it is evaluated at, including vectorised calls"""
+
+    def __init__(self, func):
+        self.func = func
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        result = self.func(*args, **kwargs)
+        self.count += np.size(result)
+        return result
 
 
 class Sampler(object):
@@ -38,3 +55,112 @@ class Sampler(object):
     def load_file(self, filename):
         """ Load existing results from a file"""
         raise NotImplementedError()
+
+    def get_summary_filename(self, uid):
+        return os.path.join(self.temp_dir, f"{uid}_summary.json")
+
+    @staticmethod
+    def get_summary(result, num_evaluations=None):
+        """Summarises the results of a fit, so that fits can be compared without loading their chains
+
+        Parameters
+        ----------
+        result : dict
+            The results of the fit, as returned by `fit` or `load_file`
+        num_evaluations : int, optional
+            The number of posterior evaluations the fit took
+
+        Returns
+        -------
+        summary : dict
+            Containing the 'num_samples' and the 'sum_weights' of the chain, the weighted 'mean', 'std' and
+            'covariance' of the parameters, the parameters 'max_posterior' and value 'max_log_posterior' of the
+            highest posterior sample, the final 'log_evidence' and the 'num_evaluations'. Those not available are None.
+        """
+        chain = np.atleast_2d(result["chain"]).astype(np.float64)
+        weights = result.get("weights")
+        weights = np.ones(chain.shape[0]) if weights is None else np.ravel(weights).astype(np.float64)
+        mean = np.average(chain, axis=0, weights=weights)
+        diff = chain - mean
+        covariance = (weights[:, None] * diff).T @ diff / np.sum(weights)
+
+        summary = {
+            "num_samples": int(chain.shape[0]),
+            "sum_weights": float(np.sum(weights)),
+            "mean": mean.tolist(),
+            "std": np.sqrt(np.diag(covariance)).tolist(),
+            "covariance": covariance.tolist(),
+            "max_posterior": None,
+            "max_log_posterior": None,
+            "log_evidence": None,
+            "num_evaluations": None if num_evaluations is None else int(num_evaluations),
+        }
+        posterior = result.get("posterior")
+        if posterior is not None:
+            i = int(np.argmax(np.ravel(posterior)))
+            summary["max_posterior"] = chain[i].tolist()
+            summary["max_log_posterior"] = float(np.ravel(posterior)[i])
+        evidence = result.get("evidence")
+        if evidence is not None and np.any(np.isfinite(evidence)):
+            # Nested samplers give the running evidence, which only increases
+            summary["log_evidence"] = float(np.nanmax(evidence))
+        return summary
+
+    @staticmethod
+    def combine_summaries(summaries):
+        """Combines the summaries of independent fits of the same model, as if their weighted chains were concatenated.
+        The maximum posterior point (and anything else not a moment, such as chi2) is taken from the best fit, the
+        evidence is averaged and the evaluations summed."""
+        if len(summaries) == 1:
+            return summaries[0]
+        sum_weights = np.array([s["sum_weights"] for s in summaries])
+        fractions = sum_weights / np.sum(sum_weights)
+        means = np.array([s["mean"] for s in summaries])
+        mean = fractions @ means
+        diffs = means - mean
+        covariance = np.einsum("i,ijk->jk", fractions, np.array([s["covariance"] for s in summaries]))
+        covariance += np.einsum("i,ij,ik->jk", fractions, diffs, diffs)
+
+        best = max(summaries, key=lambda s: -np.inf if s["max_log_posterior"] is None else s["max_log_posterior"])
+        combined = dict(best)
+        combined.update(
+            {
+                "num_samples": int(sum([s["num_samples"] for s in summaries])),
+                "sum_weights": float(np.sum(sum_weights)),
+                "mean": mean.tolist(),
+                "std": np.sqrt(np.diag(covariance)).tolist(),
+                "covariance": covariance.tolist(),
+            }
+        )
+        evidences = [s["log_evidence"] for s in summaries if s["log_evidence"] is not None]
+        combined["log_evidence"] = float(np.mean(evidences)) if evidences else None
+        evaluations = [s["num_evaluations"] for s in summaries]
+        combined["num_evaluations"] = None if None in evaluations else int(sum(evaluations))
+        if "derived" in best:
+            derived = {}
+            for name, d in best["derived"].items():
+                means = np.array([s["derived"][name]["mean"] for s in summaries])
+                stds = np.array([s["derived"][name]["std"] for s in summaries])
+                m = fractions @ means
+                derived[name] = {"mean": float(m), "std": float(np.sqrt(fractions @ (stds**2 + (means - m) ** 2))), "max": d["max"]}
+            combined["derived"] = derived
+        return combined
+
+    def save_summary(self, uid, result, num_evaluations=None):
+        """Writes the summary of a fit (see `get_summary`) to a json file next to its chain"""
+        if self.temp_dir is None:
+            return None
+        summary = self.get_summary(result, num_evaluations=num_evaluations)
+        self.write_summary(uid, summary)
+        return summary
+
+    def write_summary(self, uid, summary):
+        with open(self.get_summary_filename(uid), "w") as f:
+            json.dump(summary, f)
+
+    def load_summary(self, uid):
+        """Loads the summary of a fit, returning None if it has not been written"""
+        if self.temp_dir is None or not os.path.exists(self.get_summary_filename(uid)):
+            return None
+        with open(self.get_summary_filename(uid)) as f:
+            return json.load(f)
@@ -1,11 +1,11 @@
 import logging
 import os
 import numpy as np
-from barry.samplers.sampler import Sampler
+from barry.samplers.sampler import Sampler, EvaluationCounter
 
 
 class ZeusSampler(Sampler):
-    def __init__(self, num_walkers=None, temp_dir=None, num_steps=1000, autoconverge=True):
+    def __init__(self, num_walkers=None, temp_dir=None, num_steps=1000, autoconverge=True, vectorize=False):
 
         self.logger = logging.getLogger("barry")
         self.num_steps = num_steps
@@ -14,6 +14,7 @@ class ZeusSampler(Sampler):
         if temp_dir is not None and not os.path.exists(temp_dir):
             os.makedirs(temp_dir, exist_ok=True)
         self.autoconverge = autoconverge
+        self.vectorize = vectorize
 
     def get_filename(self, uid):
         return os.path.join(self.temp_dir, f"{uid}_zeus_chain.npy")
@@ -25,7 +26,10 @@ class ZeusSampler(Sampler):
         filename = self.get_filename(uid)
         if os.path.exists(filename):
             self.logger.info("Not sampling, returning result from file.")
-            return self.load_file(filename)
+            result = self.load_file(filename)
+            if not os.path.exists(self.get_summary_filename(uid)):
+                self.save_summary(uid, result)
+            return result
 
         if self.num_walkers is None:
             self.num_walkers = num_dim * 4
@@ -48,20 +52,23 @@ class ZeusSampler(Sampler):
         pos = start(num_walkers=self.num_walkers)
         self.logger.info("Sampling posterior now")
 
-        sampler = zeus.EnsembleSampler(self.num_walkers, num_dim, log_posterior)
+        log_posterior = EvaluationCounter(log_posterior)
+        sampler = zeus.EnsembleSampler(self.num_walkers, num_dim, log_posterior, vectorize=self.vectorize)
         sampler.run_mcmc(pos, self.num_steps, callbacks=callbacks)
 
         self.logger.debug("Fit finished")
 
         tau = zeus.AutoCorrTime(sampler.get_chain(discard=0.5))
         burnin = int(2 * np.max(tau))
-        samples = sampler.get_chain(discard=burnin, flat=True).T
+        samples = sampler.get_chain(discard=burnin, flat=True)
         likelihood = sampler.get_log_prob(discard=burnin, flat=True)
-        self._save(samples, likelihood, filename, save_dims)
-        return {"chain": samples, "weights": np.ones(len(likelihood)), "posterior": likelihood}
+        self._save(samples[:, :save_dims], likelihood, filename)
+        result = {"chain": samples, "weights": np.ones(len(likelihood)), "posterior": likelihood}
+        self.save_summary(uid, {**result, "chain": samples[:, :save_dims]}, num_evaluations=log_posterior.count)
+        return result
 
-    def _save(self, chain, likelihood, filename, save_dims):
-        res = np.vstack((likelihood, chain[:, :save_dims].T)).T
+    def _save(self, chain, likelihood, filename):
+        res = np.column_stack((likelihood, chain))
         np.save(filename, res.astype(np.float32))
 
     def load_file(self, filename):
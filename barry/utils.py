@@ -1,6 +1,8 @@
 import os
 
 import numpy as np
+from scipy.integrate import simps
+from scipy.interpolate import BSpline, CubicSpline
 import matplotlib.pyplot as plt
 import pandas as pd
 import logging
@@ -49,6 +51,90 @@ def stitch_blocks_together(x):
     return x.transpose(0, 2, 1, 3).reshape((n, n))
 
 
+def get_mu_quadrature(method="simpson", nmu=100):
+    """Returns nodes and weights to integrate a function of mu over [0, 1]
+
+    Parameters
+    ----------
+    method : str, optional
+        Either 'simpson', for Simpson's rule on nmu evenly spaced points, or 'gauss' for Gauss-Legendre quadrature.
+        As our models are even in mu, the Gauss-Legendre nodes are the positive half of a 2 * nmu point rule on [-1, 1],
+        which integrates even polynomials up to order 4 * nmu - 2 exactly.
+    nmu : int, optional
+        The number of nodes in [0, 1]. Typically 100 for 'simpson' and 8-16 for 'gauss'
+
+    Returns
+    -------
+    mu : np.ndarray
+        The nodes in mu
+    weights : np.ndarray
+        The weights, such that the integral of f(mu) is f(mu) @ weights
+    """
+    if method.lower() == "simpson":
+        mu = np.linspace(0.0, 1.0, nmu)
+        weights = simps(np.eye(nmu), mu, axis=1)
+    elif method.lower() == "gauss":
+        x, w = np.polynomial.legendre.leggauss(2 * nmu)
+        mu, weights = x[nmu:], w[nmu:]
+    else:
+        raise ValueError(f"mu quadrature method {method} not recognised, must be 'simpson' or 'gauss'")
+    return mu, weights
+
+
+def splev_many(x, tcks):
+    """Evaluates several splines from splrep at the same points, equivalent to [splev(x, tck) for tck in tcks].
+
+    Splines with the same knots and degree (such as those fit to spectra on the same k values) are evaluated together as
+    a single vector valued spline, which only has to locate each point among the knots once.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        The points to evaluate the splines at
+    tcks : list[tuple]
+        The knots, coefficients and degree of each spline
+
+    Returns
+    -------
+    values : list[np.ndarray]
+        The value of each spline at x
+    """
+    t, _, k = tcks[0]
+    if all(tck[2] == k and np.array_equal(tck[0], t) for tck in tcks):
+        values = BSpline(t, np.array([tck[1] for tck in tcks]).T, k)(x)
+        return [values[..., i] for i in range(len(tcks))]
+    return [BSpline(*tck)(x) for tck in tcks]
+
+
+def splev_batch(x, xs, ys):
+    """Evaluates the interpolating cubic splines through many functions, each at its own points. Equivalent to calling
+    splev(x[i], splrep(xs, ys[i, j])) for each i and j, as the not-a-knot splines of splrep and CubicSpline are the same.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        The points to evaluate each batch of splines at, with the batch along the first axis
+    xs : np.ndarray
+        The points the functions are known at
+    ys : np.ndarray
+        The functions, with shape (len(x), n, len(xs))
+
+    Returns
+    -------
+    values : list[np.ndarray]
+        The n splines evaluated at x, each with the same shape as x
+    """
+    coefficients = CubicSpline(xs, ys, axis=-1).c
+    index = np.clip(np.searchsorted(xs, x, side="right") - 1, 0, len(xs) - 2)
+    dx = x - xs[index]
+    batch = np.arange(len(x)).reshape((-1,) + (1,) * (x.ndim - 1))
+    values = []
+    for j in range(ys.shape[1]):
+        c = coefficients[:, index, batch, j]
+        values.append(((c[0] * dx + c[1]) * dx + c[2]) * dx + c[3])
+    return values
+
+
 def create_histogram_plot():
     plt.rc("text", usetex=True)
     plt.rc("font", family="serif")
@@ -60,11 +146,78 @@ def get_hpc():
     return hpc
 
 
-def get_model_comparison_dataframe(fitter):
-    """Uses fitter.load to create a comparison dataframe on the first column of fitter results (presumed to be alpha)
+def _get_chain_comparison_row(posterior, weight, chain, model):
+    """The columns of `get_model_comparison_dataframe` after the realisation, computed from the chain of a fit"""
+    i = posterior.argmax()
+    alphaindex = [i for i, name in enumerate(model.get_names()) if name == "alpha"][0]
+    alpha, salpha = weighted_avg_and_std(chain[:, alphaindex], weights=weight)
+    if model.isotropic:
+        epsilon, sepsilon = 0.0, 0.0
+        alpha_par_avg, salpha_par = alpha, salpha
+        alpha_perp_avg, salpha_perp = alpha, salpha
+        epsilonmax, alpha_par_max, alpha_perp_max = 0.0, chain[i, alphaindex], chain[i, alphaindex]
+    else:
+        epsilonindex = [i for i, name in enumerate(model.get_names()) if name == "epsilon"][0]
+        alpha_par, alpha_perp = model.get_alphas(chain[:, alphaindex], chain[:, epsilonindex])
+        epsilon, sepsilon = weighted_avg_and_std(chain[:, epsilonindex], weights=weight)
+        alpha_par_avg, salpha_par = weighted_avg_and_std(alpha_par, weights=weight)
+        alpha_perp_avg, salpha_perp = weighted_avg_and_std(alpha_perp, weights=weight)
+        epsilonmax, alpha_par_max, alpha_perp_max = chain[i, epsilonindex], alpha_par[i], alpha_perp[i]
+    return [
+        posterior[i],
+        alpha,
+        salpha,
+        chain[i, alphaindex],
+        epsilon,
+        sepsilon,
+        epsilonmax,
+        alpha_par_avg,
+        salpha_par,
+        alpha_par_max,
+        alpha_perp_avg,
+        salpha_perp,
+        alpha_perp_max,
+    ]
+
+
+def _get_summary_comparison_row(summary, model):
+    """The columns of `get_model_comparison_dataframe` after the realisation, taken from the summary of a fit"""
+    alphaindex = summary["names"].index("alpha")
+    alpha, salpha, alphamax = summary["mean"][alphaindex], summary["std"][alphaindex], summary["max_posterior"][alphaindex]
+    epsilon, sepsilon, epsilonmax = 0.0, 0.0, 0.0
+    if not model.isotropic:
+        epsilonindex = summary["names"].index("epsilon")
+        epsilon, sepsilon = summary["mean"][epsilonindex], summary["std"][epsilonindex]
+        epsilonmax = summary["max_posterior"][epsilonindex]
+    par, perp = summary["derived"]["alpha_par"], summary["derived"]["alpha_perp"]
+    return [
+        summary["max_log_posterior"],
+        alpha,
+        salpha,
+        alphamax,
+        epsilon,
+        sepsilon,
+        epsilonmax,
+        par["mean"],
+        par["std"],
+        par["max"],
+        perp["mean"],
+        perp["std"],
+        perp["max"],
+    ]
+
+
+def get_model_comparison_dataframe(fitter, use_summaries=False):
+    """Uses fitter.iload to create a comparison dataframe on the first column of fitter results (presumed to be alpha)
 
     Will only produce a row if a given realisation has a successful fit for all models.
 
+    Parameters
+    ----------
+    use_summaries : bool, optional
+        Build the dataframe from the summaries written at the end of each fit (see `Fitter.load_summaries`) rather than
+        loading the full chains, which is much faster for many realisations. Defaults to `False`
+
     Returns
     -------
     model_results : dict of pd.DataFrame
@@ -74,44 +227,17 @@ def get_model_comparison_dataframe(fitter):
 
     """
     model_results = {}
-    for posterior, weight, chain, evidence, model, data, extra in fitter.load():
+    fits = fitter.load_summaries() if use_summaries else fitter.iload()
+    for fit in fits:
+        model, extra = fit[-3], fit[-1]
         n = extra["name"]
         if model_results.get(n) is None:
             model_results[n] = []
-        i = posterior.argmax()
-        alphaindex = [i for i, name in enumerate(model.get_names()) if name == "alpha"][0]
-        alpha, salpha = weighted_avg_and_std(chain[:, alphaindex], weights=weight)
-        if model.isotropic:
-            epsilon, sepsilon = 0.0, 0.0
-            alpha_par_avg, salpha_par = alpha, salpha
-            alpha_perp_avg, salpha_perp = alpha, salpha
-            epsilonmax, alpha_par_max, alpha_perp_max = 0.0, chain[i, alphaindex], chain[i, alphaindex]
+        if use_summaries:
+            row = _get_summary_comparison_row(fit[0], model)
         else:
-            epsilonindex = [i for i, name in enumerate(model.get_names()) if name == "epsilon"][0]
-            alpha_par, alpha_perp = model.get_alphas(chain[:, alphaindex], chain[:, epsilonindex])
-            epsilon, sepsilon = weighted_avg_and_std(chain[:, epsilonindex], weights=weight)
-            alpha_par_avg, salpha_par = weighted_avg_and_std(alpha_par, weights=weight)
-            alpha_perp_avg, salpha_perp = weighted_avg_and_std(alpha_perp, weights=weight)
-            epsilonmax, alpha_par_max, alpha_perp_max = chain[i, epsilonindex], alpha_par[i], alpha_perp[i]
-
-        model_results[n].append(
-            [
-                extra["realisation"] if extra["realisation"] is not None else "Mock mean",
-                posterior[i],
-                alpha,
-                salpha,
-                chain[i, alphaindex],
-                epsilon,
-                sepsilon,
-                epsilonmax,
-                alpha_par_avg,
-                salpha_par,
-                alpha_par_max,
-                alpha_perp_avg,
-                salpha_perp,
-                alpha_perp_max,
-            ]
-        )
+            row = _get_chain_comparison_row(*fit[:3], model)
+        model_results[n].append([extra["realisation"] if extra["realisation"] is not None else "Mock mean"] + row)
 
     for label in model_results.keys():
         model_results[label] = pd.DataFrame(
@@ -120,7 +246,7 @@ def get_model_comparison_dataframe(fitter):
                 "realisation",
                 "posterior",
                 "alpha_avg",
-                +"alpha_std",
+                "alpha_std",
                 "alpha_max",
                 "epsilon_avg",
                 "epsilon_std",
@@ -0,0 +1,185 @@
+"""Benchmark suites for Barry, written in the style of airspeed velocity (asv).
+
+Each suite is a class with a list of `params` (one list per entry in `param_names`), a `setup` method called once for
+each combination of parameters, and `time_*` methods which are timed. A `setup` that raises `NotImplementedError` marks
+a combination as not applicable, such as two galactic caps for a dataset that only has one. Methods with an
+`evaluations` attribute do that many evaluations per call, so are also reported in evaluations per second.
+
+Run them with `python -m benchmarks.run_benchmarks` from the top level directory, see that file for options.
+"""
+import itertools
+import shutil
+import tempfile
+
+import numpy as np
+
+from barry.cosmology import getCambGenerator
+from barry.cosmology.pk2xi import (
+    PowerToCorrelationGauss,
+    PowerToCorrelationFT,
+    PowerToCorrelationFFTLog,
+    PowerToCorrelationSphericalBessel,
+    PowerToCorrelationMatrix,
+)
+from barry.datasets import PowerSpectrum_SDSS_DR12, CorrelationFunction_ROSS_DR12
+from barry.datasets.dataset_power_spectrum import PowerSpectrum_DESI_KP4
+from barry.datasets.dataset_correlation_function import CorrelationFunction_DESI_KP4
+from barry.fitter import Fitter
+from barry.models import PowerBeutler2017
+from barry.models.model import Model
+from barry.models.bao_power import PowerSpectrumFit
+from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.samplers import DynestySampler
+from tests.utils import get_concrete
+
+MODELS = {c.__name__: c for c in get_concrete(Model) if issubclass(c, (PowerSpectrumFit, CorrelationFunctionFit))}
+
+DATASETS = {
+    "pk_sdss_dr12_iso": lambda: PowerSpectrum_SDSS_DR12(isotropic=True, recon="iso"),
+    "pk_sdss_dr12_aniso": lambda: PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]),
+    "pk_sdss_dr12_both_caps": lambda: PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2], galactic_cap="both"),
+    "xi_ross_dr12_iso": lambda: CorrelationFunction_ROSS_DR12(isotropic=True, recon="iso"),
+    "xi_ross_dr12_aniso": lambda: CorrelationFunction_ROSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]),
+    "pk_desi_kp4": lambda: PowerSpectrum_DESI_KP4(recon="sym", fit_poles=[0, 2]),
+    "xi_desi_kp4": lambda: CorrelationFunction_DESI_KP4(recon="sym", fit_poles=[0, 2]),
+}
+
+
+def get_dataset(kind, isotropic, recon, n_data):
+    """Gets the SDSS DR12 dataset to benchmark a power spectrum ("pk") or correlation function ("xi") model against"""
+    fit_poles = [0] if isotropic else [0, 2]
+    if kind == "pk":
+        galactic_cap = {1: "ngc", 2: "both"}[n_data]
+        return PowerSpectrum_SDSS_DR12(isotropic=isotropic, recon=recon, fit_poles=fit_poles, galactic_cap=galactic_cap)
+    if n_data != 1:
+        raise NotImplementedError("The SDSS DR12 correlation function only has one dataset")
+    return CorrelationFunction_ROSS_DR12(isotropic=isotropic, recon=recon, fit_poles=fit_poles)
+
+
+class ModelPosteriorSuite:
+    """Posterior evaluations per second for every concrete model against SDSS DR12 data."""
+
+    params = [sorted(MODELS), [True, False], ["iso", None], [None, "partial", "full"], [1, 2]]
+    param_names = ["model", "isotropic", "recon", "marg", "n_data"]
+    num_points = 32
+
+    def setup(self, model, isotropic, recon, marg, n_data):
+        cls = MODELS[model]
+        kind = "pk" if issubclass(cls, PowerSpectrumFit) else "xi"
+        # Only pass marg when marginalising, as models without analytic marginalisation (PowerNoda2019) don't take it
+        options = {"isotropic": isotropic, "recon": recon}
+        if marg is not None:
+            options["marg"] = marg
+        try:
+            self.model = cls(**options)
+        except TypeError as e:
+            raise NotImplementedError(f"{model} does not take these options: {e}")
+        try:
+            dataset = get_dataset(kind, isotropic, recon, n_data)
+        except FileNotFoundError as e:
+            raise NotImplementedError(f"Data is not available: {e}")
+        self.model.set_data(dataset.get_data())
+
+        np.random.seed(0)
+        self.points = np.array([self.model.get_raw_start() for _ in range(self.num_points)])
+        self.cycle = itertools.cycle(self.points)
+        if not np.isfinite(self.model.get_posterior(self.points[0])):
+            raise ValueError(f"{model} has a non-finite posterior at its starting point")
+
+    def time_posterior(self, *args):
+        self.model.get_posterior(next(self.cycle))
+
+    def time_posterior_batch(self, *args):
+        self.model.get_posterior_batch(self.points)
+
+    time_posterior.evaluations = 1
+    time_posterior_batch.evaluations = num_points
+
+
+class DatasetSuite:
+    """Construction of the bundled datasets and their data dictionaries."""
+
+    params = [sorted(DATASETS)]
+    param_names = ["dataset"]
+
+    def setup(self, dataset):
+        self.make = DATASETS[dataset]
+        try:
+            self.dataset = self.make()
+        except FileNotFoundError as e:
+            raise NotImplementedError(f"Data for {dataset} is not available: {e}")
+
+    def time_construct(self, dataset):
+        self.make()
+
+    def time_get_data(self, dataset):
+        self.dataset.get_data()
+
+
+class FitterLoadSuite:
+    """Loading chains with `Fitter.load`, using synthetic chains with the shape of the DynestySampler output, either
+    from the chain files of each fit or from the chain archive built by `Fitter.build_archive`."""
+
+    params = [[1, 8], [10], [20000], [False, True]]
+    param_names = ["num_models", "num_walkers", "num_samples", "archive"]
+
+    def setup(self, num_models, num_walkers, num_samples, archive):
+        self.temp_dir = tempfile.mkdtemp()
+        self.fitter = Fitter(self.temp_dir, remove_output=False)
+        sampler = DynestySampler(temp_dir=self.temp_dir)
+        self.fitter.set_sampler(sampler)
+        self.fitter.set_num_walkers(num_walkers)
+
+        model = PowerBeutler2017(recon="iso", isotropic=True)
+        dataset = PowerSpectrum_SDSS_DR12(isotropic=True, recon="iso")
+        rng = np.random.default_rng(0)
+        num_dim = len(model.get_active_params())
+        for i in range(num_models):
+            self.fitter.add_model_and_dataset(model, dataset)
+            for j in range(num_walkers):
+                chain = rng.normal(size=(num_samples, num_dim))
+                weights, likelihood, logz = rng.uniform(size=(3, num_samples))
+                sampler._save(chain, weights, likelihood, sampler.get_filename(f"chain_{i}_{j}"), logz, None)
+        if archive:
+            self.fitter.build_archive()
+
+    def teardown(self, *args):
+        shutil.rmtree(self.temp_dir)
+
+    def time_load(self, *args):
+        self.fitter.load()
+
+    def time_load_split_walkers(self, *args):
+        self.fitter.load(split_walkers=True)
+
+    def time_iload_first(self, *args):
+        next(self.fitter.iload())
+
+
+class Pk2xiSuite:
+    """Transforming the linear power spectrum multipoles to correlation function multipoles."""
+
+    params = [["gauss", "ft", "fftlog", "spherical_bessel", "matrix"], [0, 2, 4]]
+    param_names = ["method", "ell"]
+
+    def setup(self, method, ell):
+        camb = getCambGenerator()
+        data = camb.get_data()
+        self.ks, self.pk = data["ks"], data["pk_lin"]
+        self.ss = np.linspace(30.0, 200.0, 85)
+        if method == "gauss":
+            self.transform = PowerToCorrelationGauss(self.ks, ell=ell)
+        elif method == "ft":
+            self.transform = PowerToCorrelationFT(ell=ell)
+        elif method == "fftlog":
+            self.transform = PowerToCorrelationFFTLog(ell=ell)
+        elif method == "matrix":
+            self.transform = PowerToCorrelationMatrix(self.ks, self.ss, ell=ell)
+        else:
+            self.transform = PowerToCorrelationSphericalBessel(qs=self.ks, ell=ell)
+
+    def time_transform(self, method, ell):
+        self.transform(self.ks, self.pk, self.ss)
+
+
+SUITES = [ModelPosteriorSuite, DatasetSuite, FitterLoadSuite, Pk2xiSuite]
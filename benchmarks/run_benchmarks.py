@@ -0,0 +1,160 @@
+"""Runs the benchmark suites in `benchmarks.benchmarks` and stores the results as json, so that regressions can be
+found by comparing the results of two commits on the same machine.
+
+Usage, from the top level directory:
+
+    python -m benchmarks.run_benchmarks [--filter REGEX] [--repeat N] [--output FILE]
+    python -m benchmarks.run_benchmarks --compare OLD.json NEW.json [--threshold 1.1]
+
+By default results are saved to benchmarks/results/<commit>_<machine>.json.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import timeit
+
+import numpy as np
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def get_machine():
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def get_name(suite, method, params):
+    return f"{suite.__name__}.{method}({', '.join(f'{k}={v!r}' for k, v in zip(suite.param_names, params))})"
+
+
+def time_method(func, repeat):
+    """Returns the best time in seconds per call, after choosing a number of calls per repeat taking at least 0.2s"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(suites, pattern=None, repeat=5):
+    """Runs every benchmark in the suites whose name matches the regex pattern
+
+    Returns
+    -------
+    results : dict
+        Containing 'results', mapping each benchmark name to its seconds per call and evaluations per second, and
+        'skipped' and 'failed', mapping benchmark names to the reason they did not run.
+    """
+    logger = logging.getLogger("barry")
+    results, skipped, failed = {}, {}, {}
+    for suite in suites:
+        methods = sorted(m for m in dir(suite) if m.startswith("time_"))
+        for params in itertools.product(*suite.params):
+            names = {m: get_name(suite, m, params) for m in methods}
+            names = {m: n for m, n in names.items() if pattern is None or re.search(pattern, n)}
+            if not names:
+                continue
+            instance = suite()
+            try:
+                instance.setup(*params)
+            except NotImplementedError as e:
+                skipped.update({n: str(e) for n in names.values()})
+                continue
+            except Exception as e:
+                logger.warning(f"Setup of {suite.__name__}{params} failed: {e!r}")
+                failed.update({n: repr(e) for n in names.values()})
+                continue
+            try:
+                for method, name in names.items():
+                    func = getattr(instance, method)
+                    try:
+                        seconds = time_method(lambda: func(*params), repeat)
+                    except Exception as e:
+                        logger.warning(f"{name} failed: {e!r}")
+                        failed[name] = repr(e)
+                        continue
+                    evaluations = getattr(func, "evaluations", 1)
+                    results[name] = {
+                        "suite": suite.__name__,
+                        "method": method,
+                        "params": dict(zip(suite.param_names, params)),
+                        "seconds": seconds,
+                        "per_second": evaluations / seconds,
+                    }
+                    logger.info(f"{name}: {1000 * seconds:0.3f} ms, {evaluations / seconds:0.1f} per second")
+            finally:
+                if hasattr(instance, "teardown"):
+                    instance.teardown(*params)
+    return {"results": results, "skipped": skipped, "failed": failed}
+
+
+def compare(old, new, threshold=1.1):
+    """Prints the ratio of new to old time for each benchmark in both result files, flagging those slower than
+    threshold times the old time. Returns the names of the regressed benchmarks."""
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    if old["machine"] != new["machine"]:
+        logging.getLogger("barry").warning("Results are from different machines, timings may not be comparable")
+
+    regressions = []
+    for name in sorted(set(old["results"]) & set(new["results"])):
+        ratio = new["results"][name]["seconds"] / old["results"][name]["seconds"]
+        flag = ""
+        if ratio > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1.0 / threshold:
+            flag = "improved"
+        print(f"{ratio:7.3f} {flag:10s} {name}")
+    print(f"{old['commit']} -> {new['commit']}: {len(regressions)} regressions")
+    return regressions
+
+
+if __name__ == "__main__":
+    from barry.config import setup_logging
+
+    parser = argparse.ArgumentParser(description="Runs the Barry benchmark suites")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name matches this regex")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repeats to take the best time from")
+    parser.add_argument("--output", default=None, help="The json file to save results to")
+    parser.add_argument("--compare", nargs=2, default=None, metavar=("OLD", "NEW"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.1, help="Slowdown ratio flagged as a regression")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.compare is not None:
+        compare(*args.compare, threshold=args.threshold)
+    else:
+        from benchmarks.benchmarks import SUITES
+
+        commit = get_commit()
+        machine = get_machine()
+        output = run(SUITES, pattern=args.filter, repeat=args.repeat)
+        output.update({"commit": commit, "date": datetime.datetime.now().isoformat(), "machine": machine})
+
+        filename = args.output
+        if filename is None:
+            filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit}_{machine['node']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(filename, "w") as f:
+            json.dump(output, f, indent=2)
+        logging.getLogger("barry").info(
+            f"Saved {len(output['results'])} results to {filename}, {len(output['skipped'])} skipped, {len(output['failed'])} failed"
+        )
@@ -0,0 +1,52 @@
+from barry.config import setup_logging
+from barry.datasets import PowerSpectrum_SDSS_DR12, CorrelationFunction_ROSS_DR12
+from barry.models import PowerBeutler2017, PowerSeo2016, PowerDing2018, PowerChen2019
+from barry.models import CorrBeutler2017, CorrSeo2016, CorrDing2018
+from barry.models.bao_correlation_Chen2019 import CorrChen2019
+from timeit import timeit
+import numpy as np
+
+# Compares the Gauss-Legendre mu quadrature against the default 100 point Simpson integration for each model,
+# both in terms of the change in the log posterior at random points in parameter space, and the time per posterior.
+
+if __name__ == "__main__":
+    setup_logging()
+
+    datasets = {
+        "pk": PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2, 4]).get_data(),
+        "xi": CorrelationFunction_ROSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]).get_data(),
+    }
+    classes = [
+        ("pk", PowerBeutler2017),
+        ("pk", PowerSeo2016),
+        ("pk", PowerDing2018),
+        ("pk", PowerChen2019),
+        ("xi", CorrBeutler2017),
+        ("xi", CorrSeo2016),
+        ("xi", CorrDing2018),
+        ("xi", CorrChen2019),
+    ]
+    nmus = [8, 10, 12, 16]
+    num_points = 20
+
+    for kind, cls in classes:
+        reference = cls(recon="iso", isotropic=False, marg="full")
+        reference.set_data(datasets[kind])
+
+        np.random.seed(0)
+        points = [reference.get_defaults()] + [reference.get_raw_start() for _ in range(num_points)]
+        posteriors = np.array([reference.get_posterior(p) for p in points])
+        t_ref = timeit(lambda: [reference.get_posterior(p) for p in points], number=1) / len(points)
+        print(f"{cls.__name__}: Simpson nmu=100 takes {1000 * t_ref:0.2f} ms per posterior")
+
+        for nmu in nmus:
+            model = cls(recon="iso", isotropic=False, marg="full", mu_quadrature={"method": "gauss", "nmu": nmu})
+            model.set_data(datasets[kind])
+            gauss = np.array([model.get_posterior(p) for p in points])
+            t = timeit(lambda: [model.get_posterior(p) for p in points], number=1) / len(points)
+            good = np.isfinite(posteriors)
+            diff = np.abs(gauss[good] - posteriors[good])
+            print(
+                f"    Gauss nmu={nmu:2d}: |delta log posterior| at default {diff[0]:0.2e}, max {np.max(diff):0.2e}, "
+                f"takes {1000 * t:0.2f} ms per posterior ({t_ref / t:0.1f}x faster)"
+            )
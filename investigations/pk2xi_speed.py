@@ -1,13 +1,23 @@
-from barry.cosmology import PowerToCorrelationGauss, PowerToCorrelationFT, getCambGenerator
+from barry.cosmology import (
+    PowerToCorrelationGauss,
+    PowerToCorrelationFT,
+    PowerToCorrelationSphericalBessel,
+    PowerToCorrelationMatrix,
+    getCambGenerator,
+)
 import numpy as np
 from timeit import timeit
 
 camb = getCambGenerator()
 ks = camb.ks
-pk = camb.get_data()[1]
+pk = camb.get_data()["pk_lin"]
+pks = np.array([pk] * 10)
 ss = np.linspace(20, 200, 50)
 gauss = PowerToCorrelationGauss(ks)
 fft = PowerToCorrelationFT()
+bessel = PowerToCorrelationSphericalBessel(qs=ks, ell=0)
+matrix = PowerToCorrelationMatrix(ks, ss)
+matrix_svd = PowerToCorrelationMatrix(ks, ss, rtol=1.0e-10)
 n = 500
 
 
@@ -19,5 +29,26 @@ def time_ft():
     fft(ks, pk, ss)
 
 
+def time_bessel():
+    bessel(ks, pk, ss, nu=0)
+
+
+def time_matrix():
+    matrix(ks, pk, ss)
+
+
+def time_matrix_svd():
+    matrix_svd(ks, pk, ss)
+
+
+def time_matrix_batch():
+    matrix(ks, pks, ss)
+
+
 print(f"Gaussian method takes {timeit(time_gauss, number=n) * 1000 / n  : 0.2f} milliseconds")
 print(f"FFT method takes {timeit(time_ft, number=n) * 1000 / n  : 0.2f} milliseconds")
+print(f"Spherical Bessel method takes {timeit(time_bessel, number=n) * 1000 / n  : 0.2f} milliseconds")
+print(f"Matrix method takes {timeit(time_matrix, number=n) * 1000 / n  : 0.2f} milliseconds")
+print(f"Truncated SVD matrix method takes {timeit(time_matrix_svd, number=n) * 1000 / n  : 0.2f} milliseconds")
+print(f"Matrix method takes {timeit(time_matrix_batch, number=n) * 1000 / n / len(pks) : 0.2f} milliseconds per spectrum in a batch")
+print(f"Matrix method differs from Gaussian by at most {np.max(np.abs(ss ** 2 * (matrix(ks, pk, ss) - gauss(ks, pk, ss)))) : 0.2e} in s^2 xi")
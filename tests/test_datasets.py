@@ -2,6 +2,7 @@ from barry.datasets.dataset import Dataset
 from barry.datasets.dataset_power_spectrum_abc import PowerSpectrum
 from barry.datasets.dataset_correlation_function_abc import CorrelationFunction
 from tests.utils import get_concrete
+import numpy as np
 
 
 class TestDataset:
@@ -69,3 +70,128 @@ class TestDataset:
                         assert r in data.keys(), f"Correlation function data should have computed key {r}"
                     for i, d in enumerate(data["poles"]):
                         assert f"xi{d}" in data.keys(), f"Correlation function data needs to have key xi{d}"
+
+    def test_binning_matrix_matches_binned_basis_splines(self):
+        from scipy.interpolate import splrep, splev
+        from barry.datasets.dataset_correlation_function_abc import get_binmat
+
+        ss, ds, ss_input = np.arange(32.5, 100.0, 5.0), 5.0, np.linspace(1.0, 250.0, 249)
+        binmat = get_binmat(ss, ds, ss_input)
+        for ii in [0, 40, 100, 248]:
+            spline = splrep(ss_input, np.eye(len(ss_input))[ii])
+            for i, s in enumerate(ss):
+                sin = np.linspace(s - ds / 2, s + ds / 2, 100)
+                expected = np.trapz(sin**2 * splev(sin, spline, ext=3), x=sin) * 3 / ((s + ds / 2) ** 3 - (s - ds / 2) ** 3)
+                assert np.isclose(binmat[i, ii], expected, atol=1e-12), f"Binning matrix element {i}, {ii} is wrong"
+
+    def test_fitter_shares_arrays_between_realisations(self):
+        import tempfile
+        from barry.datasets import PowerSpectrum_SDSS_DR12
+        from barry.fitter import Fitter
+        from barry.models import PowerBeutler2017
+
+        model = PowerBeutler2017(isotropic=False, recon="iso", marg="full")
+        fitter = Fitter(tempfile.mkdtemp(), remove_output=False)
+        for realisation in range(3):
+            dataset = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2], realisation=realisation)
+            fitter.add_model_and_dataset(model, dataset)
+            assert np.array_equal(fitter.model_datasets[-1][1][0]["pk"], dataset.get_data()[0]["pk"])
+        first, last = fitter.model_datasets[0][1][0], fitter.model_datasets[-1][1][0]
+        assert first["w_m_transform"] is last["w_m_transform"] and first["icov"] is last["icov"]
+        assert not np.array_equal(first["pk"], last["pk"])
+        per_pair = fitter.get_memory_footprint()["per_pair"]
+        assert per_pair[1] < 0.01 * per_pair[0] and per_pair[2] == per_pair[1]
+
+    def test_fitter_load_from_chain_archive(self):
+        import tempfile
+        from barry.datasets import PowerSpectrum_SDSS_DR12
+        from barry.fitter import Fitter
+        from barry.models import PowerBeutler2017
+        from barry.samplers import DynestySampler
+
+        temp_dir = tempfile.mkdtemp()
+        fitter = Fitter(temp_dir, remove_output=False)
+        sampler = DynestySampler(temp_dir=temp_dir)
+        fitter.set_sampler(sampler)
+        fitter.set_num_walkers(2)
+        model = PowerBeutler2017(isotropic=False, recon="iso")
+        dataset = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2])
+        rng = np.random.default_rng(0)
+        for i in range(2):
+            fitter.add_model_and_dataset(model, dataset)
+            for j in range(2):
+                n = 100 + 10 * i + j
+                chain = rng.normal(size=(n, len(model.get_active_params())))
+                weights, likelihood, logz = rng.uniform(size=(3, n))
+                sampler._save(chain, weights, likelihood, sampler.get_filename(f"chain_{i}_{j}"), logz, None)
+
+        for kwargs in [{}, {"split_walkers": True}, {"split_models": False}]:
+            expected = fitter.load(**kwargs)
+            fitter.build_archive(num_processes=1)
+            loaded = fitter.load(**kwargs)
+            assert len(loaded) == len(expected)
+            for a, b in zip(loaded, expected):
+                for x, y in zip(a[:4], b[:4]):
+                    assert np.array_equal(x, y)
+        assert fitter.get_archive().get_model_indexes() == [0, 1]
+
+    def test_fitter_summaries_match_chains(self):
+        import tempfile
+        from barry.datasets import PowerSpectrum_SDSS_DR12
+        from barry.fitter import Fitter
+        from barry.models import PowerBeutler2017
+        from barry.samplers import DynestySampler
+        from barry.utils import get_model_comparison_dataframe
+
+        temp_dir = tempfile.mkdtemp()
+        fitter = Fitter(temp_dir, remove_output=False)
+        sampler = DynestySampler(temp_dir=temp_dir)
+        fitter.set_sampler(sampler)
+        fitter.set_num_walkers(2)
+        model = PowerBeutler2017(isotropic=False, recon="iso")
+        rng = np.random.default_rng(0)
+        for i in range(3):
+            dataset = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2], realisation=i)
+            fitter.add_model_and_dataset(model, dataset, name="model", realisation=i)
+            for j in range(2):
+                chain = rng.normal(1.0, 0.05, size=(200, len(model.get_active_params())))
+                weights, likelihood, logz = rng.uniform(size=(3, 200))
+                sampler._save(chain, weights, likelihood, sampler.get_filename(f"chain_{i}_{j}"), logz, None)
+
+        expected, _ = get_model_comparison_dataframe(fitter)
+        summarised, _ = get_model_comparison_dataframe(fitter, use_summaries=True)
+        assert np.allclose(summarised["model"].values.astype(float), expected["model"].values.astype(float), rtol=1e-5)
+        assert len(fitter.load_summaries(split_walkers=True)) == 6
+
+
+def test_fitter_only_skips_finished_fits():
+    import tempfile
+    from barry.fitter import Fitter
+    from barry.samplers import EnsembleSampler
+
+    temp_dir = tempfile.mkdtemp()
+    fitter = Fitter(temp_dir, remove_output=False)
+    sampler = EnsembleSampler(temp_dir=temp_dir)
+    fitter.set_sampler(sampler)
+    fitter.set_num_walkers(2)
+    # A sampler checkpoints its chain while running, so an interrupted fit has a chain but no summary
+    np.save(f"{temp_dir}/chain_0_1_ens.chain.npy", np.zeros((4, 10, 3)))
+    assert not fitter._fit_complete(1)
+    sampler.write_summary("chain_0_1", {"mean": [0.0]})
+    assert fitter._fit_complete(1) and not fitter._fit_complete(0)
+
+
+def test_fitter_does_not_retain_duplicate_arrays():
+    import pickle
+    import tempfile
+    from barry.datasets import PowerSpectrum_SDSS_DR12
+    from barry.fitter import Fitter
+    from barry.models import PowerBeutler2017
+
+    model = PowerBeutler2017(isotropic=False, recon="iso")
+    fitter = Fitter(tempfile.mkdtemp(), remove_output=False)
+    for i in range(3):
+        # Separately constructed datasets have equal, but not identical, window functions and covariances
+        fitter.add_model_and_dataset(model, PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]))
+    total = fitter.get_memory_footprint()["total"]
+    assert len(pickle.dumps(fitter)) < 1.1 * total
@@ -3,9 +3,13 @@ from barry.datasets.dataset_correlation_function import CorrelationFunction_ROSS
 from barry.models.model import Model
 from barry.models.bao_power import PowerSpectrumFit
 from barry.models.bao_correlation import CorrelationFunctionFit
+from barry.models import PowerBeutler2017, PowerDing2018, PowerSeo2016, PowerChen2019
+from barry.models import CorrBeutler2017, CorrDing2018, CorrSeo2016, CorrRoss2017
 
 from tests.utils import get_concrete
+import json
 import numpy as np
+import pytest
 
 
 class TestModels:
@@ -56,3 +60,278 @@ class TestModels:
                     params = c.get_raw_start()
                     posterior = c.get_posterior(params)
                     assert np.isfinite(posterior), f"Model {str(c)} at params {params} gave posterior {posterior}"
+
+
+@pytest.fixture(scope="module")
+def models():
+    """Anisotropic power spectrum and (analytically marginalised) correlation function models, with their data set"""
+    pk_data = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]).get_data()
+    xi_data = CorrelationFunction_ROSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]).get_data()
+    models = [c(isotropic=False, recon="iso") for c in [PowerBeutler2017, PowerDing2018, PowerSeo2016, PowerChen2019]]
+    xi_classes = [CorrBeutler2017, CorrDing2018, CorrSeo2016, CorrRoss2017]
+    models += [c(isotropic=False, recon="iso", poly_poles=[0, 2], marg="full") for c in xi_classes]
+    for model in models:
+        model.set_data(pk_data if isinstance(model, PowerSpectrumFit) else xi_data)
+    return models
+
+
+def test_batch_posterior_matches_single_posterior(models):
+    for c in models:
+        np.random.seed(0)
+        params = np.array([c.get_raw_start() for i in range(5)])
+        posteriors = np.array([c.get_posterior(p) for p in params])
+        batch = c.get_posterior_batch(params)
+        assert np.allclose(posteriors, batch), f"Model {str(c)} gave batch posteriors {batch} instead of {posteriors}"
+
+
+def test_pk_compressed_window_likelihood_matches_convolved():
+    data = PowerSpectrum_SDSS_DR12(isotropic=False, fit_poles=[0, 2, 4], compress_window=True).get_data()
+    for c in [PowerBeutler2017, PowerDing2018, PowerSeo2016, PowerChen2019]:
+        model = c(isotropic=False, marg="full")
+        model.set_data(data)
+        np.random.seed(0)
+        for i in range(5):
+            compressed, convolved = model.validate_compressed_likelihood(model.get_raw_start())
+            assert np.allclose(compressed, convolved), f"Model {str(model)} gave {compressed} instead of {convolved}"
+
+
+def test_cholesky_marg_likelihood_matches_explicit_inverse(models):
+    model = models[0]
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(30, 30))
+    icov = a @ a.T + 30 * np.eye(30)
+    data, polys = rng.normal(size=30), rng.normal(size=(6, 30))
+    for i in range(3):
+        mod, marg = rng.normal(size=30), np.vstack([rng.normal(size=(1, 30)), polys])
+        F2 = marg @ icov @ marg.T
+        F11 = marg @ icov @ (data - mod)
+        chi2 = (data - mod) @ icov @ (data - mod) - F11 @ np.linalg.inv(F2) @ F11
+        expected = model.get_corrected_marg_likelihood(chi2, np.log(np.linalg.det(F2)), 7)
+        computed = model.get_chi2_marg_likelihood(data, mod, np.zeros(30), marg, np.zeros((7, 30)), icov, [None])
+        assert np.isclose(computed, expected), f"Cholesky marginalised likelihood {computed} should be {expected}"
+        bband = model.get_ML_nuisance(data, mod, np.zeros(30), marg, np.zeros((7, 30)), icov, [None])
+        assert np.allclose(bband, np.linalg.solve(F2, F11))
+
+
+def test_parameter_layout_matches_individual_parameters(models):
+    from scipy.stats import truncnorm
+
+    for c in models:
+        np.random.seed(0)
+        active = c.get_active_params()
+        for i in range(5):
+            scaled = np.random.uniform(size=len(active))
+            expected = [
+                p.min + s * (p.max - p.min)
+                if p.prior == "flat"
+                else truncnorm.ppf(s, (p.min - p.default) / p.sigma, (p.max - p.default) / p.sigma, loc=p.default, scale=p.sigma)
+                for s, p in zip(scaled, active)
+            ]
+            params = c.unscale(scaled)
+            assert np.allclose(params, expected), f"Model {str(c)} unscaled {scaled} to {params} instead of {expected}"
+            assert np.allclose(c.scale(params), scaled), f"Model {str(c)} does not scale {params} back to {scaled}"
+            assert np.isclose(c.get_prior(c.get_param_dict(params)), c.get_prior_batch(params[None, :])[0])
+
+
+def test_damping_engine_matches_product_of_damping_terms():
+    from barry.models.damping import DampingEngine
+
+    ks, mu = np.linspace(0.01, 0.5, 50), np.linspace(0.0, 1.0, 11)
+    engine = DampingEngine(ks, mu)
+    for power_par, power_perp in [(1.0, 1.0), (0.9, 1.1), (1.2, 0.95)]:
+        expected = np.exp(-np.outer(3.0 * ks**2, mu**2)) ** power_par * np.exp(-np.outer(ks**2, 1.0 - mu**2)) ** power_perp
+        damping = engine.get_damping("test", engine.get_coefficient(3.0 * power_par, power_perp))
+        assert np.allclose(damping, expected), f"Damping engine does not match for {power_par}, {power_perp}"
+        assert damping is engine.get_damping("test", engine.get_coefficient(3.0 * power_par, power_perp))
+    assert engine.get_cache_info() == {"hits": 3, "misses": 3, "size": 1}
+
+
+def test_profiler_records_pipeline_stages_only_when_enabled(models):
+    from barry.profiling import PROFILER
+
+    for c in models:
+        PROFILER.reset()
+        c.get_posterior(c.get_defaults())
+        assert PROFILER.get_report()["stages"] == {}, f"Model {str(c)} recorded timings with profiling disabled"
+
+        PROFILER.enable()
+        try:
+            c.get_posterior(c.get_defaults())
+        finally:
+            PROFILER.disable()
+        report = PROFILER.get_report(c)
+        assert report["stages"]["posterior"]["calls"] == 1
+        if isinstance(c, (PowerSpectrumFit, CorrelationFunctionFit)):
+            assert "get_model" in report["stages"], f"Model {str(c)} did not record get_model"
+        for name, cache in report["caches"].items():
+            assert cache["hits"] >= 0 and cache["misses"] >= 0, f"Model {str(c)} cache {name} is invalid"
+            assert cache["hit_rate"] is None or 0 <= cache["hit_rate"] <= 1, f"Model {str(c)} cache {name} is invalid"
+        json.dumps(report, default=float, allow_nan=False)
+        PROFILER.log_report(report)
+
+
+def test_template_grid_interpolates_model_inside_grid():
+    from barry.models.template import TemplateGrid
+
+    ks, mask = np.linspace(0.01, 0.3, 30), np.ones(30, dtype=bool)
+    compute = lambda p: (np.sin(100.0 * ks / p["alpha"]) * (1.0 + p["epsilon"] * ks), mask, None)
+    grid = TemplateGrid(compute, {"b": 1.0}, ["alpha", "epsilon"], [0.9, -0.1], [1.1, 0.1], [81, 11])
+    assert grid.validate(compute) < 1.0e-3
+    model = grid({"alpha": 1.01, "epsilon": 0.03})
+    assert np.allclose(model[0], compute({"alpha": 1.01, "epsilon": 0.03})[0], atol=1.0e-3)
+    assert model[1] is mask and model[2] is None
+    assert grid({"alpha": 0.9, "epsilon": 0.0}) is None, "Points whose stencil does not fit in the grid should not be interpolated"
+    assert grid({"alpha": 1.2, "epsilon": 0.0}) is None
+
+
+def test_mock_ensemble_grid_matches_posterior():
+    from barry.grid_likelihood import MockEnsembleGrid
+    dataset = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2])
+    model = PowerBeutler2017(isotropic=False, recon="iso", marg="full", poly_poles=[0, 2])
+    model.set_fix_params([p.name for p in model.params if p.name != "alpha"])
+    grid = MockEnsembleGrid(model, dataset, num_points=7, ranges={"alpha": (0.95, 1.05)})
+    log_posterior = grid.get_log_likelihood(grid.get_mock_data([0, 3])) + grid.log_prior[:, None]
+    results = grid.run([0, 3])
+    for i, realisation in enumerate([0, 3]):
+        dataset.set_realisation(realisation)
+        model.set_data(dataset.get_data())
+        for j in [0, 3, 6]:
+            assert np.isclose(model.get_posterior(grid.get_points([j])[0]), log_posterior[j, i])
+        assert np.isclose(results["max_log_posterior"][i], np.max(log_posterior[:, i]))
+    assert results["mean"].shape == (2, 1) and results["marginals"][0].shape == (2, 7)
+    assert np.allclose(grid.get_points(slice(0, 7))[:, 0], np.linspace(0.95, 1.05, 7))
+
+    model.set_fix_params([])
+    try:
+        MockEnsembleGrid(model, dataset)
+        assert False, "A grid over every active parameter should be too large to build"
+    except ValueError:
+        pass
+
+
+def test_camb_data_interpolates_fields_lazily():
+    from barry.cosmology.camb_generator import CambGenerator
+
+    camb = CambGenerator(redshift=0.51, cache_size=2)
+    camb.load_data()
+    full = np.array(camb.data)
+    row = camb._interpolate((0.3 - camb.omega_b) * camb.h0**2, camb.h0, data=full)
+    data = camb.get_data(0.3)
+    assert camb.get_cache_info()["nbytes"] == 0, "No fields should be interpolated until they are used"
+    assert np.allclose(data["pk_lin"], row[camb.fields["pk_lin"]]) and np.isclose(data["r_s"], row[0])
+    assert camb.get_cache_info()["nbytes"] == data["pk_lin"].nbytes + data["r_s"].nbytes
+    assert camb.get_data(0.3) is data
+    camb.get_data(0.31), camb.get_data(0.32)
+    assert camb.get_cache_info()["size"] == 2
+
+
+def test_smoothed_data_matches_smoothing_at_grid_nodes():
+    from barry.cosmology.camb_generator import CambGenerator
+    from barry.cosmology.power_spectrum_smoothing import smooth_func
+
+    camb = CambGenerator(redshift=0.51)
+    for method in ["hinton2017", "wallisch2018"]:
+        for i in [10, 50]:
+            om = camb.omch2s[i] / camb.h0**2 + camb.omega_b
+            pk_lin = camb.get_data(om)["pk_lin"]
+            pk_smooth_lin, pk_ratio = camb.get_smoothed_data(om, smooth_type={"method": method})
+            expected = smooth_func(camb.ks, pk_lin, method=method)
+            with np.errstate(divide="ignore"):
+                ratio = pk_lin / expected - 1.0
+            finite = np.isfinite(ratio)
+            assert np.all(np.isfinite(pk_ratio)) and np.all(pk_ratio[~finite] == 0.0)
+            assert np.allclose(pk_smooth_lin, expected, rtol=1e-6)
+            assert np.allclose(pk_ratio[finite], ratio[finite], rtol=1e-6, atol=1e-8)
+
+
+def test_grid_interpolators_reproduce_polynomials():
+    from barry.cosmology.interpolation import get_interpolator
+
+    for name, num, degree in [("linear", 11, 1), ("cubic", 11, 3), ("chebyshev", 9, 8)]:
+        interpolator = get_interpolator(name)
+        nodes = interpolator.get_nodes(0.05, 0.3, num)
+        values = (nodes - 0.1) ** degree
+        for x in [0.05, 0.0731, 0.2, 0.3]:
+            indexes, weights = interpolator.get_weights(x, nodes)
+            assert np.isclose(np.sum(weights), 1.0)
+            assert np.isclose(np.dot(weights, values[indexes]), (x - 0.1) ** degree, atol=1e-12)
+
+
+def test_power_emulator_reproduces_held_out_spectra():
+    import os
+    import tempfile
+    from barry.cosmology.emulator import PowerEmulator
+
+    ks = np.logspace(-4, 1, 2000)
+
+    def get_rows(samples):
+        omch2, ombh2, h0, ns, mnu = samples.T
+        r_s = 150.0 * (omch2 / 0.12) ** -0.25 * (ombh2 / 0.022) ** -0.1
+        pk = np.exp(np.outer(ns, np.log(ks)) - np.outer(omch2 / h0, ks) - np.outer(mnu, ks**0.5) + ombh2[:, None] * np.sin(np.outer(r_s * h0, ks)))
+        return np.hstack([r_s[:, None], pk, 1.2 * pk, 1.1 * pk])
+
+    train, test = PowerEmulator.get_samples(80), PowerEmulator.get_samples(10, seed=1)
+    emulator = PowerEmulator.fit(0.51, ks, train, get_rows(train))
+    accuracy = emulator.validate(test, get_rows(test), kmin=1e-3, kmax=0.5)
+    assert max(accuracy.values()) < 5e-3, accuracy
+
+    filename = os.path.join(tempfile.mkdtemp(), "emulator.npz")
+    emulator.save(filename)
+    loaded = PowerEmulator.load(filename)
+    assert loaded.accuracy == accuracy
+    for name in PowerEmulator.fields:
+        assert np.allclose(loaded.predict(name, test[0]), emulator.predict(name, test[0]), rtol=1e-12)
+
+
+def test_shipped_emulator_backend_loads():
+    from barry.cosmology.camb_generator import getCambGenerator
+
+    generator = getCambGenerator(redshift=0.51, backend="emulator")
+    data = generator.get_data(0.31)
+    assert max(generator.data.accuracy.values()) < 2e-2
+    assert 140 < data["r_s"] < 155
+    assert np.all(np.isfinite(data["pk_lin"])) and np.all(data["pk_lin"] > 0)
+
+
+def test_template_grid_only_spans_requested_parameters():
+    data = PowerSpectrum_SDSS_DR12(isotropic=False, recon="iso", fit_poles=[0, 2]).get_data()
+    model = PowerBeutler2017(isotropic=False, recon="iso", marg="full", poly_poles=[0, 2])
+    model.set_data(data)
+    try:
+        model.set_template_grid(params=model.get_names(), num_points=41)
+        assert False, "A template grid over every active parameter should be too large to tabulate"
+    except ValueError:
+        pass
+
+    model.set_template_grid(num_points=9, ranges={"alpha": (0.95, 1.05), "epsilon": (-0.05, 0.05)}, rtol=1.0)
+    assert model.template_config["params"] == ["alpha", "epsilon"]
+    p = model.get_param_dict(model.get_defaults())
+    model.get_posterior(model.get_defaults())
+    assert model.template_grids[data[0]["name"]].get_size() == 81
+    hits = model.template_hits
+    model.get_posterior(model.get_defaults())
+    assert model.template_hits == hits + 1
+
+    p["sigma_nl_par"] += 1.0
+    exact = model.get_posterior([p[n] for n in model.get_names()])
+    assert model.template_hits == hits + 1, "Parameters off the grid should be evaluated exactly"
+    model.template_config = None
+    assert np.isclose(exact, model.get_posterior([p[n] for n in model.get_names()]))
+
+
+def test_batched_spline_evaluation_matches_splev():
+    from scipy.interpolate import splev, splrep
+    from barry.utils import splev_batch, splev_many
+
+    rng = np.random.default_rng(0)
+    xs = np.linspace(0.0, 10.0, 51)
+    ys = rng.normal(size=(4, 3, len(xs)))
+    x = rng.uniform(-0.5, 10.5, size=(4, 20, 7))
+    values = splev_batch(x, xs, ys)
+    for i in range(4):
+        for j in range(3):
+            assert np.allclose(values[j][i], splev(x[i], splrep(xs, ys[i, j])))
+
+    tcks = [splrep(xs, y) for y in ys[0]] + [splrep(xs[::2], ys[1, 0, ::2])]
+    for value, tck in zip(splev_many(x, tcks), tcks):
+        assert np.allclose(value, splev(x, tck))
@@ -1,4 +1,5 @@
 from barry.cosmology import PowerToCorrelationGauss, PowerToCorrelationFT, getCambGenerator
+from barry.cosmology.pk2xi import PowerToCorrelationSphericalBessel, PowerToCorrelationMatrix, PowerToCorrelationFFTLog
 import numpy as np
 
 
@@ -32,3 +33,29 @@ class TestPk2Xi:
         ss2_xi = self.ss ** 2 * self.fft(self.ks, self.pk, self.ss)
         diff = np.abs(ss2_xi - self.ss ** 2 * self.xi_truth)
         assert np.all(diff < self.threshold)
+
+    def test_batched_spherical_bessel(self):
+        ss = np.linspace(0.0, 300.0, 601)
+        pks = np.array([self.pk, 0.5 * self.pk, 0.2 * self.pk])
+        batched = PowerToCorrelationSphericalBessel(qs=self.ks, ell=4).transform(self.ks, pks, ss, [0, 2, 4])
+        for i, ell in enumerate([0, 2, 4]):
+            xi = PowerToCorrelationSphericalBessel(qs=self.ks, ell=ell)(self.ks, pks[i], ss)
+            assert np.allclose(ss**2 * batched[i], ss**2 * xi, rtol=0.0, atol=1.0e-8)
+
+    def test_matrix_matches_gaussian(self):
+        pks = np.array([self.pk, 0.5 * self.pk])
+        for ell in [0, 2, 4]:
+            xi = PowerToCorrelationGauss(self.ks, ell=ell)(self.ks, self.pk, self.ss)
+            xis = PowerToCorrelationMatrix(self.ks, self.ss, ell=ell)(self.ks, pks, self.ss)
+            assert np.allclose(self.ss**2 * xis[0], self.ss**2 * xi, rtol=0.0, atol=1.0e-8)
+            assert np.allclose(xis[1], 0.5 * xis[0])
+
+    def test_fftlog_batch(self):
+        pks = np.array([[self.pk, 0.5 * self.pk], [0.2 * self.pk, 2.0 * self.pk]])
+        fftlog = PowerToCorrelationFFTLog(ell=2, transformed_axis=-1)
+        xis = fftlog(self.ks, pks, self.ss)
+        assert xis.shape == (2, 2, self.ss.size)
+        for i in range(2):
+            for j in range(2):
+                assert np.allclose(xis[i, j], PowerToCorrelationFFTLog(ell=2)(self.ks, pks[i, j], self.ss))
+        assert np.allclose(PowerToCorrelationFFTLog(ell=2)(self.ks, pks[0].T, self.ss), xis[0].T)
@@ -0,0 +1,29 @@
+import tempfile
+
+import numpy as np
+
+from barry.samplers.zeus_sampler import ZeusSampler
+
+
+def test_zeus_summary_uses_samples_along_first_axis():
+    sampler = ZeusSampler(temp_dir=tempfile.mkdtemp())
+    rng = np.random.default_rng(0)
+    num_samples, num_dim, save_dims = 500, 4, 3
+    samples = rng.normal(loc=[1.0, 2.0, 3.0, 4.0], size=(num_samples, num_dim))
+    likelihood = -0.5 * np.sum((samples - [1.0, 2.0, 3.0, 4.0]) ** 2, axis=1)
+
+    # The same steps as the end of ZeusSampler.fit, with a flat (num_samples, num_dim) chain
+    filename = sampler.get_filename("test")
+    sampler._save(samples[:, :save_dims], likelihood, filename)
+    result = {"chain": samples, "weights": np.ones(len(likelihood)), "posterior": likelihood}
+    summary = sampler.save_summary("test", {**result, "chain": samples[:, :save_dims]}, num_evaluations=1000)
+
+    assert summary["num_samples"] == num_samples
+    assert np.allclose(summary["mean"], np.mean(samples[:, :save_dims], axis=0))
+    assert np.allclose(summary["max_posterior"], samples[np.argmax(likelihood), :save_dims])
+    assert sampler.load_summary("test") == summary
+
+    loaded = sampler.load_file(filename)
+    assert loaded["chain"].shape == (num_samples, save_dims)
+    assert np.allclose(loaded["posterior"], likelihood, rtol=1e-6)
+    assert np.allclose(sampler.get_summary(loaded)["mean"], summary["mean"], rtol=1e-5)